@@ -1,9 +1,115 @@
 # app/__init__.py
+import logging
+import os
+import sys
 from flask import Flask
 from flask_cors import CORS
 
-def create_app():
+# The backend modules import each other by their plain names
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+if APP_DIR not in sys.path:
+    sys.path.insert(1, APP_DIR)
+
+from http_utils import init_http
+from metrics import init_metrics
+from log_setup import init_request_ids
+
+
+def create_app(*blueprints):
+    """
+    Create the Flask application.
+
+    Nothing here touches the database or starts threads, so the app can be
+    created in a server's master process and forked into workers. Call
+    startup() in every process that serves requests.
+
+    Args:
+        blueprints (Blueprint): Blueprints to register, e.g. the API and the webhook.
+
+    Returns:
+        Flask: The application.
+    """
     app = Flask(__name__)
-    CORS(app, resources={r"/*": {"origins": "*"}}) 
+    CORS(app, resources={r"/*": {"origins": "*"}})
+
+    # Fast JSON encoding and compression of large responses
+    init_http(app)
+    # Request timings for /metrics and correlation ids for the logs
+    init_metrics(app)
+    init_request_ids(app)
 
+    for blueprint in blueprints:
+        app.register_blueprint(blueprint)
     return app
+
+
+def startup(init_database=True, sweeper=True, is_leader=None, expiry=True, journal=True, maintenance=True):
+    """
+    Prepare a serving process: start the logging writer, create the
+    database tables and start the background workers.
+
+    Args:
+        init_database (bool): Run init_db, skip it when the parent process
+            already did before forking the workers.
+        sweeper (bool): Start the reputation sweeper.
+        is_leader (callable, optional): Passed to the sweeper and the storage
+            maintenance so only one of several processes runs them.
+        expiry (bool): Start removing time-bounded mitigations when they expire.
+            Every process may run it, each expiration is claimed once.
+        journal (bool): Journal received alerts, after replaying those that
+            stopped processes left unprocessed.
+        maintenance (bool): Move old events and actions to monthly partitions
+            and archive partitions past the retention period.
+    """
+    from database import init_db
+    from log_setup import configure_logging
+
+    configure_logging()
+    if init_database:
+        init_db()
+    if sweeper:
+        from decision import start_reputation_sweeper
+        # Decay marks and lift expired mitigations in the background
+        start_reputation_sweeper(is_leader=is_leader)
+    if maintenance:
+        from retention import start_maintenance
+        start_maintenance(is_leader=is_leader)
+    if expiry:
+        # Registers the controller calls that remove each kind of mitigation
+        import controller_actions
+        from expiry import scheduler
+        scheduler.start()
+    if journal:
+        from journal import journal as alert_journal
+        from reception import replay_events
+        alert_journal.open()
+        alert_journal.replay(replay_events)
+
+
+def shutdown():
+    """
+    Stop the background workers, flushing events still held for coalescing.
+    """
+    from decision import stop_reputation_sweeper
+    from coalescer import coalescer
+    from expiry import scheduler
+    from jobs import job_runner
+    from journal import journal
+    from log_setup import stop_logging
+    from redirect_aggregator import aggregator
+    from retention import stop_maintenance
+
+    stop_reputation_sweeper()
+    stop_maintenance()
+    # Let running traffic-control jobs finish before their helpers stop
+    job_runner.stop()
+    scheduler.stop()
+    # Submit honeypot intent updates still waiting for their burst to end
+    aggregator.flush()
+    try:
+        coalescer.stop()
+    except Exception as e:
+        logging.getLogger(__name__).error("Error flushing coalesced events: %s", e)
+    # After the coalescer, whose flush marks its alerts as processed
+    journal.close()
+    stop_logging()
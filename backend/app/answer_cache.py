@@ -0,0 +1,92 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# Answers are reused for at most this many seconds
+ANSWER_TTL = 600
+
+# Number of answers kept before the least recently used is dropped
+MAX_ANSWERS = 256
+
+STOP_WORDS = {"a", "an", "the", "is", "are", "was", "were", "be", "been", "do", "does", "did",
+              "of", "to", "in", "on", "for", "at", "by", "with", "me", "my", "please", "can",
+              "you", "tell", "show", "what", "which", "there", "any", "it", "this", "that"}
+
+
+def normalize_question(question):
+    """
+    Reduce a question to lowercase words without punctuation or stop words.
+    """
+    words = re.findall(r"[a-z0-9]+(?:\.[0-9]+)*", question.lower())
+    return " ".join(word for word in words if word not in STOP_WORDS)
+
+
+class AnswerCache:
+    """
+    Cache of chatbot answers keyed by question and data version.
+
+    An answer is only reused while the fingerprint of the data it was based on
+    is unchanged, so new events, actions or topology changes invalidate it.
+    Questions only share an answer if they are the same after normalization,
+    case, punctuation and stop words aside. Similar wording is not enough, a
+    single word such as "not" or "redirect" instead of "block" changes the
+    answer.
+    Entries expire after ttl seconds and the least recently used entry is
+    dropped once max_entries is reached.
+    """
+
+    def __init__(self, ttl=ANSWER_TTL, max_entries=MAX_ANSWERS):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, question, fingerprint):
+        """
+        Look up an answer for a question.
+
+        Args:
+            question (str): The user's question.
+            fingerprint (str): Version of the data the answer must be based on.
+
+        Returns:
+            str: The cached answer, or None.
+        """
+        normalized = normalize_question(question)
+        now = time.time()
+        with self.lock:
+            self._expire(now)
+            key = (normalized, fingerprint)
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key]["answer"]
+
+    def put(self, question, fingerprint, answer):
+        """
+        Store an answer for a question.
+
+        Args:
+            question (str): The user's question.
+            fingerprint (str): Version of the data the answer is based on.
+            answer (str): The answer.
+        """
+        normalized = normalize_question(question)
+        with self.lock:
+            self.entries[(normalized, fingerprint)] = {
+                "answer": answer,
+                "created": time.time()
+            }
+            self.entries.move_to_end((normalized, fingerprint))
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def _expire(self, now):
+        expired = [key for key, entry in self.entries.items() if now - entry["created"] >= self.ttl]
+        for key in expired:
+            del self.entries[key]
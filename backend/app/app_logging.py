@@ -1,8 +1,9 @@
-import requests
-from database import save_flows, get_setting_value
+import logging
+from database import save_flows
+from topology import get_onos_base_url, onos_session
+
+logger = logging.getLogger(__name__)
 
-ONOS_CONTROLLER_IP = get_setting_value("SDN Controller IP")
-ONOS_API_URL = f'http://{ONOS_CONTROLLER_IP}:8181/onos/v1/flows'
 USERNAME = ""
 PASSWORD = ""
 
@@ -14,7 +15,7 @@ def fetch_flows_from_onos():
         list of dict: A list of flow dictionaries retrieved from ONOS.
     """
     try:
-        response = requests.get(ONOS_API_URL, auth=(USERNAME, PASSWORD))
+        response = onos_session.get(f"{get_onos_base_url()}/flows", auth=(USERNAME, PASSWORD))
         if response.status_code == 200:
             return response.json().get("flows", [])
         else:
@@ -93,7 +94,7 @@ def filter_flows(raw_flows):
                 "out_port": out_port,
             })
         except Exception as e:
-            print(f"Error processing flow {flow.get('id', 'Unknown')}: {e}")
+            logger.error("Error processing flow %s: %s", flow.get('id', 'Unknown'), e)
 
     return formatted_flows
 
@@ -112,7 +113,7 @@ def log_flows_to_database():
         
         # Step 3: Save the formatted flows to the database
         save_flows(formatted_flows)
-        print(f"Successfully saved {len(formatted_flows)} flows to the database.")
+        logger.info("Successfully saved %s flows to the database.", len(formatted_flows))
     except Exception as e:
-        print(f"Error logging flows to the database: {e}")
+        logger.error("Error logging flows to the database: %s", e)
 
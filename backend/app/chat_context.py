@@ -0,0 +1,115 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+# Seconds an assembled context snapshot is reused before it is rebuilt
+CONTEXT_TTL = 30
+
+# Seconds to wait for a single source before using its previous value
+SOURCE_TIMEOUT = 10
+
+
+def _row_key(row):
+    # ELK hits carry an _id, database rows are compared whole
+    if isinstance(row, dict):
+        return row.get("_id")
+    return tuple(row)
+
+
+def diff_snapshots(previous, current):
+    """
+    Describe what changed between two context snapshots.
+
+    Args:
+        previous (dict): The older snapshot, or None.
+        current (dict): The newer snapshot.
+
+    Returns:
+        dict: For list sources, the entries not present before. For other
+            sources, the new value if it differs from the old one.
+    """
+    if previous is None:
+        return {}
+    changes = {}
+    for name, value in current["data"].items():
+        old = previous["data"].get(name)
+        if isinstance(value, list) and isinstance(old, list):
+            seen = {_row_key(row) for row in old}
+            added = [row for row in value if _row_key(row) not in seen]
+            if added:
+                changes[name] = added
+        elif value != old:
+            changes[name] = value
+    return changes
+
+
+class ContextBuilder:
+    """
+    Gather chatbot context from several sources concurrently and cache it.
+
+    Each source is a callable returning its data. All sources are fetched in
+    parallel and the assembled snapshot is reused for CONTEXT_TTL seconds, so
+    back-to-back questions share one fan-out. Only one rebuild runs at a time;
+    other callers wait for it instead of starting their own. A source that
+    fails or times out keeps its value from the previous snapshot.
+
+    Args:
+        sources (dict): Source names mapped to callables.
+        ttl (float): Seconds a snapshot stays fresh.
+    """
+
+    def __init__(self, sources, ttl=CONTEXT_TTL):
+        self.sources = sources
+        self.ttl = ttl
+        self.snapshot = None
+        self.previous = None
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=len(sources), thread_name_prefix="chat-context")
+
+    def build(self):
+        """
+        Fetch every source concurrently and store the result as the current snapshot.
+
+        Returns:
+            dict: The snapshot with 'data', 'changes' and 'built_at'.
+        """
+        futures = {name: self.executor.submit(fetch) for name, fetch in self.sources.items()}
+        wait(futures.values(), timeout=SOURCE_TIMEOUT)
+
+        data = {}
+        for name, future in futures.items():
+            if future.done() and future.exception() is None:
+                data[name] = future.result()
+            elif self.snapshot is not None:
+                data[name] = self.snapshot["data"].get(name)
+            else:
+                data[name] = None
+
+        snapshot = {"data": data, "built_at": time.time()}
+        snapshot["changes"] = diff_snapshots(self.snapshot, snapshot)
+        self.previous, self.snapshot = self.snapshot, snapshot
+        return snapshot
+
+    def get_snapshot(self):
+        """
+        Return the cached snapshot, rebuilding it if it is older than the TTL.
+
+        Returns:
+            dict: The snapshot with 'data', 'changes' and 'built_at'.
+        """
+        snapshot = self.snapshot
+        if snapshot is not None and time.time() - snapshot["built_at"] < self.ttl:
+            return snapshot
+        with self.lock:
+            # Another request may have rebuilt it while we waited
+            snapshot = self.snapshot
+            if snapshot is not None and time.time() - snapshot["built_at"] < self.ttl:
+                return snapshot
+            return self.build()
+
+    def invalidate(self):
+        """
+        Force the next get_snapshot call to rebuild.
+        """
+        if self.snapshot is not None:
+            self.snapshot = dict(self.snapshot, built_at=0)
@@ -1,21 +1,29 @@
-import openai
 import sqlite3
-import requests
-from elasticsearch import Elasticsearch
+import json
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+from chat_context import ContextBuilder
+from context_compactor import compact_context
+from llm_backends import get_backend, InvalidRequestError
+from answer_cache import AnswerCache
+from database import DB_PATH, get_recent_events, get_version
+from metrics import observe_external
+from topology import onos_session
 
-
-# OpenAI API Key
-openai.api_key = ""
-
-# Database configuration
-DB_PATH = "C:\\netsecflow\\database\\netsecflow.db"
+logger = logging.getLogger(__name__)
 
 # Elasticsearch configuration
 ELASTICSEARCH_URL = "http://192.168.102.1:9200"
-elk_client = Elasticsearch(
-    ELASTICSEARCH_URL,
-    basic_auth=("elastic", ""),
-)
+_elk_client = None
+_elk_client_lock = threading.Lock()
+
+# Number of recent rows and log entries summarized into the chatbot context
+EVENT_LIMIT = 200
+ACTION_LIMIT = 100
+ELK_LOG_LIMIT = 50
 
 def query_database(query, params=()):
     """
@@ -32,50 +40,73 @@ def get_mininet_topology():
     """
     onos_url = "http://192.168.102.2:8181/onos/v1/topology"
     try:
-        response = requests.get(onos_url, auth=("onos", ""))
+        response = onos_session.get(onos_url, auth=("onos", ""))
         response.raise_for_status()
         return response.json()
     except Exception as e:
         return {"error": "Failed to fetch Mininet topology"}
 
+def get_elk_client():
+    """
+    Create the Elasticsearch client on first use.
+    """
+    global _elk_client
+    if _elk_client is None:
+        with _elk_client_lock:
+            if _elk_client is None:
+                from elasticsearch import Elasticsearch
+                _elk_client = Elasticsearch(
+                    ELASTICSEARCH_URL,
+                    basic_auth=("elastic", ""),
+                )
+    return _elk_client
+
 def fetch_elasticsearch_logs(index, query):
     """
     Fetch logs from Elasticsearch.
     """
+    start = time.perf_counter()
     try:
-        response = elk_client.search(index=index, body=query)
+        response = get_elk_client().search(index=index, body=query)
+        observe_external("elasticsearch", "search", start, "ok")
         return response["hits"]["hits"]
     except Exception as e:
+        observe_external("elasticsearch", "search", start, "error")
         return []
 
-def generate_gpt_response(prompt, context=None):
+def get_chat_backend():
+    """
+    Create the chat backend selected by the 'Chatbot Backend' setting ('openai' by default).
+    """
+    rows = query_database("SELECT value FROM settings WHERE key = ?", ("Chatbot Backend",))
+    return get_backend(rows[0][0] if rows else None)
+
+
+def build_messages(prompt, context=None):
+    messages = [{"role": "user", "content": prompt}]
+
+    # Add context if provided, compact_context already keeps it within budget
+    if context:
+        messages.insert(0, {"role": "system", "content": context})
+    return messages
+
+
+def generate_gpt_response(prompt, context=None, backend=None):
     """
     Generate a response from GPT-3.5 using the provided prompt and optional context.
     
     Args:
         prompt (str): The user's question or input.
         context (str, optional): Additional context to provide better responses.
+        backend (object, optional): The chat backend, defaults to get_chat_backend().
     
     Returns:
         str: The GPT-3.5 response.
     """
     try:
-        messages = [{"role": "user", "content": prompt}]
-        
-        # Add context if provided
-        if context:
-            context_tokens = len(context.split())  # Count tokens in context
-            if context_tokens > 1500:  # Adjust the limit as necessary
-                context = " ".join(context.split()[:1500])  # Trim to 1500 tokens
-            
-            messages.insert(0, {"role": "system", "content": context})
-        
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo", 
-            messages=messages
-        )
-        return response['choices'][0]['message']['content']
-    except openai.error.InvalidRequestError as e:
+        backend = backend or get_chat_backend()
+        return backend.complete(build_messages(prompt, context))
+    except InvalidRequestError as e:
         if 'context_length_exceeded' in str(e):
             return "too long"
         raise
@@ -83,6 +114,42 @@ def generate_gpt_response(prompt, context=None):
         return "Sorry, I couldn't process your request at the moment."
 
 
+def fetch_recent_anomalies():
+    # Decoded by the database helper, events store ids and packed addresses
+    return get_recent_events(EVENT_LIMIT)
+
+
+def fetch_recent_actions():
+    return query_database(
+        "SELECT timestamp, action_type, reason, source_ip, admin_or_automated "
+        "FROM actions ORDER BY timestamp DESC LIMIT ?", (ACTION_LIMIT,)
+    )
+
+
+def fetch_recent_elk_logs():
+    return fetch_elasticsearch_logs("ad-logs*", {
+        "query": {"match_all": {}},
+        "sort": [{"@timestamp": {"order": "desc"}}],
+        "size": ELK_LOG_LIMIT
+    })
+
+
+# Answers returned when the model could not be reached, never cached
+FAILED_ANSWERS = {"too long", "Sorry, I couldn't process your request at the moment."}
+
+answer_cache = AnswerCache()
+
+# Runs context assembly for streamed responses alongside the stream itself
+context_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="chat-stream")
+
+context_builder = ContextBuilder({
+    "anomalies": fetch_recent_anomalies,
+    "actions": fetch_recent_actions,
+    "elk_logs": fetch_recent_elk_logs,
+    "topology": get_mininet_topology
+})
+
+
 def handle_chatbot_request(user_question):
     """
     Main function to handle chatbot requests.
@@ -97,23 +164,106 @@ def handle_chatbot_request(user_question):
     if not user_question:
         return "Please ask a question."
 
-    # Fetch database anomalies/actions as context
-    anomalies = query_database("SELECT * FROM events ORDER BY timestamp DESC LIMIT 5")
-    actions = query_database("SELECT * FROM actions ORDER BY timestamp DESC LIMIT 5")
+    # Answer repeated questions without a model call while the data is unchanged
+    answer = cached_answer(user_question)
+    if answer is not None:
+        return answer
 
-    # Fetch recent ELK logs as context
-    elk_logs = fetch_elasticsearch_logs("ad-logs*", {"query": {"match_all": {}}})
+    # Generate GPT response
+    answer = generate_gpt_response(user_question, build_chatbot_context(user_question))
+    if answer not in FAILED_ANSWERS:
+        cache_answer(user_question, answer)
+    return answer
 
-    # Fetch Mininet topology as context
-    topology = get_mininet_topology()
 
-    # Create a combined context
-    context = f"""
-    Recent Anomalies: {anomalies}
-    Recent Actions: {actions}
-    ELK Logs: {elk_logs}
-    Mininet Topology: {topology}
+def get_context_fingerprint():
     """
+    Identify the version of the data the chatbot context is built from.
 
-    # Generate GPT response
-    return generate_gpt_response(user_question, context)
+    Returns:
+        str: Changes whenever events or actions are written or the
+            topology in the context snapshot changes.
+    """
+    events_version, _ = get_version("events")
+    actions_version, _ = get_version("actions")
+    snapshot = context_builder.snapshot
+    topology = snapshot["data"].get("topology") if snapshot else None
+    topology_version = hashlib.sha1(json.dumps(topology, sort_keys=True, default=str).encode()).hexdigest()[:12]
+    return f"{events_version}:{actions_version}:{topology_version}"
+
+
+def cached_answer(user_question):
+    """
+    Look up a cached answer for the current data, None if there is none.
+    """
+    try:
+        return answer_cache.get(user_question, get_context_fingerprint())
+    except Exception as e:
+        # The question is answered without the cache
+        logger.warning("Error looking up a cached chatbot answer: %s", e)
+        return None
+
+
+def cache_answer(user_question, answer):
+    """
+    Cache an answer for the current data.
+    """
+    try:
+        # The snapshot may have been rebuilt for this answer
+        answer_cache.put(user_question, get_context_fingerprint(), answer)
+    except Exception as e:
+        logger.warning("Error caching a chatbot answer: %s", e)
+
+
+def build_chatbot_context(user_question):
+    """
+    Assemble the context for a question from the cached snapshot.
+    """
+    # Database, ELK and Mininet data, fetched concurrently and shared between questions
+    snapshot = context_builder.get_snapshot()
+
+    # Summarize it into a context that fits the token budget
+    return compact_context(user_question, snapshot["data"], snapshot["changes"])
+
+
+def stream_chatbot_response(user_question, backend=None):
+    """
+    Generate a chatbot response as a stream of events.
+
+    Context assembly starts in the background before the first event is
+    produced, so the client gets an immediate status update while the
+    context is gathered, then tokens as the model generates them.
+
+    Args:
+        user_question (str): The user's question.
+        backend (object, optional): The chat backend, defaults to get_chat_backend().
+
+    Yields:
+        tuple: (event, text) where event is 'status', 'token', 'error' or 'done'.
+    """
+    if not user_question:
+        yield ("error", "Please ask a question.")
+        return
+
+    answer = cached_answer(user_question)
+    if answer is not None:
+        yield ("token", answer)
+        yield ("done", "")
+        return
+
+    context_future = context_executor.submit(build_chatbot_context, user_question)
+    yield ("status", "Gathering context")
+
+    try:
+        backend = backend or get_chat_backend()
+        messages = build_messages(user_question, context_future.result())
+        pieces = []
+        for text in backend.stream(messages):
+            pieces.append(text)
+            yield ("token", text)
+        cache_answer(user_question, "".join(pieces))
+    except InvalidRequestError as e:
+        yield ("error", "too long" if 'context_length_exceeded' in str(e) else str(e))
+    except Exception as e:
+        yield ("error", "Sorry, I couldn't process your request at the moment.")
+    yield ("done", "")
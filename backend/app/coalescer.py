@@ -0,0 +1,173 @@
+import logging
+import threading
+from datetime import datetime, timezone
+from database import get_setting_value, save_events
+from decision import process_events
+from journal import journal
+from log_setup import correlation_id, new_correlation_id
+
+logger = logging.getLogger(__name__)
+
+# How often the window setting is re-read while coalescing is disabled
+IDLE_POLL_SECONDS = 5
+
+
+def get_coalesce_window():
+    """
+    Retrieve the coalescing window from the database.
+
+    Returns:
+        float: The window in seconds, 0.0 if coalescing is disabled.
+    """
+    window = get_setting_value("Coalesce Window")
+    try:
+        return max(float(window), 0.0) if window else 0.0
+    except ValueError:
+        return 0.0
+
+
+def get_coalesce_score_mode():
+    """
+    Retrieve how scores of coalesced events are combined ('sum' or 'max').
+    """
+    mode = get_setting_value("Coalesce Score Mode")
+    return mode if mode in ("sum", "max") else "sum"
+
+
+class EventCoalescer:
+    """
+    Merge bursts of identical webhook events into aggregate records.
+
+    Events are keyed by (Source, SourceIP, Event). Everything received for a
+    key within one window is stored as a single events row carrying the count
+    and first/last seen times. The whole window is then scored as one batch,
+    each burst counting as one event with the combined score.
+    """
+
+    def __init__(self):
+        self.window = None
+        self.score_mode = "sum"
+        self.pending = {}
+        # Correlation ids of the webhook requests in the current window
+        self.correlation_ids = []
+        # Journal sequence numbers of the events in the current window
+        self.journal_seqs = []
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def submit(self, event, journal_seq=None):
+        """
+        Add an event to the current window.
+
+        Args:
+            event (dict): The event received from the webhook.
+            journal_seq (int, optional): The event's sequence number in the
+                journal, marked done once the window is processed.
+
+        Returns:
+            bool: True if the event was queued, False if coalescing is disabled
+                and the caller should process it directly.
+        """
+        if self.window is None:
+            self.reload_settings()
+        if self.window <= 0:
+            self._ensure_started()
+            return False
+
+        key = (event.get("Source"), event.get("SourceIP"), event.get("Event"))
+        score = float(event.get("Score", 0))
+        # Same format and timezone as the stored timestamps (SQLite CURRENT_TIMESTAMP)
+        now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+        with self.lock:
+            record = self.pending.get(key)
+            if record is None:
+                self.pending[key] = {
+                    "Source": key[0],
+                    "SourceIP": key[1],
+                    "Event": key[2],
+                    "DestinationIP": event.get("DestinationIP"),
+                    "Score": score,
+                    "Count": 1,
+                    "FirstSeen": now,
+                    "LastSeen": now
+                }
+            else:
+                if self.score_mode == "max":
+                    record["Score"] = max(record["Score"], score)
+                else:
+                    record["Score"] += score
+                record["Count"] += 1
+                record["LastSeen"] = now
+                record["DestinationIP"] = event.get("DestinationIP")
+            request_id = correlation_id.get()
+            if request_id:
+                self.correlation_ids.append(request_id)
+            if journal_seq is not None:
+                self.journal_seqs.append(journal_seq)
+
+        self._ensure_started()
+        return True
+
+    def reload_settings(self):
+        """
+        Re-read the window and score mode from the database.
+        """
+        self.window = get_coalesce_window()
+        self.score_mode = get_coalesce_score_mode()
+
+    def flush(self):
+        """
+        Save and process everything collected in the current window.
+
+        Returns:
+            list of dict: The aggregate records that were flushed.
+        """
+        with self.lock:
+            records = list(self.pending.values())
+            request_ids = self.correlation_ids
+            journal_seqs = self.journal_seqs
+            self.pending = {}
+            self.correlation_ids = []
+            self.journal_seqs = []
+        if not records:
+            return []
+
+        # The batch gets its own id, logged with the ids of the requests it merges
+        new_correlation_id()
+        logger.debug("Flushing %s coalesced records", len(records), extra={"requests": request_ids})
+
+        save_events(records)
+        try:
+            process_events(records)
+        except Exception as e:
+            logger.error("Error processing coalesced events: %s", e)
+        journal.done(journal_seqs)
+        return records
+
+    def stop(self):
+        """
+        Stop the flushing thread and flush whatever is still pending.
+        """
+        self.stopped.set()
+        self.flush()
+
+    def _ensure_started(self):
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, name="event-coalescer", daemon=True)
+                    self.thread.start()
+
+    def _run(self):
+        while not self.stopped.wait(self.window if self.window > 0 else IDLE_POLL_SECONDS):
+            try:
+                self.flush()
+                # Pick up setting changes without a restart
+                self.reload_settings()
+            except Exception as e:
+                logger.error("Error flushing coalesced events: %s", e)
+
+
+coalescer = EventCoalescer()
@@ -0,0 +1,151 @@
+import contextvars
+import functools
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from requests.adapters import HTTPAdapter
+from metrics import InstrumentedSession, histogram
+
+# Command classes, most urgent first. Requests made by a mitigation inherit
+# its class, everything else is a plain read or write.
+COMMAND_CLASSES = ("block", "redirect", "rate_limit", "write", "read")
+_PRIORITIES = {name: index for index, name in enumerate(COMMAND_CLASSES)}
+
+# Controller requests per second and requests in flight, per server process
+DEFAULT_QPS = float(os.environ.get("NETSECFLOW_ONOS_QPS", "200"))
+DEFAULT_CONCURRENCY = int(os.environ.get("NETSECFLOW_ONOS_CONCURRENCY", "8"))
+
+# Seconds to connect to the controller and to wait for its response, so a
+# hung request cannot hold a slot forever. Callers may pass their own timeout.
+CONNECT_TIMEOUT = float(os.environ.get("NETSECFLOW_ONOS_CONNECT_TIMEOUT", "3"))
+READ_TIMEOUT = float(os.environ.get("NETSECFLOW_ONOS_READ_TIMEOUT", "30"))
+
+QUEUE_SECONDS = histogram("netsecflow_controller_queue_seconds",
+                          "Time controller requests waited for their turn, by command class.", ["command_class"])
+
+# Class of the controller requests made in the current context
+command_class = contextvars.ContextVar("command_class", default=None)
+
+
+@contextmanager
+def command_priority(name):
+    """
+    Make the controller requests of a block run as the given command class.
+    """
+    token = command_class.set(name)
+    try:
+        yield
+    finally:
+        command_class.reset(token)
+
+
+def prioritized(name):
+    """
+    Decorator running a function's controller requests as the given command class.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with command_priority(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class CommandScheduler:
+    """
+    Admit controller requests by priority, under a rate and concurrency limit.
+
+    Waiting requests are ordered by command class, then arrival. The first
+    one is admitted when fewer than `concurrency` requests are in flight and
+    the token bucket, refilled at `qps` tokens per second up to `qps`, holds
+    a token. A burst of dashboard reads therefore queues behind blocks
+    instead of delaying them, and ONOS never sees more than the configured
+    load from one process.
+
+    Args:
+        qps (float): Requests per second, 0 for no rate limit.
+        concurrency (int): Requests in flight at most.
+    """
+
+    def __init__(self, qps=DEFAULT_QPS, concurrency=DEFAULT_CONCURRENCY):
+        self.qps = qps
+        self.concurrency = max(1, concurrency)
+        self.tokens = max(qps, 1.0)
+        self.refilled_at = time.monotonic()
+        self.in_flight = 0
+        self.waiting = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+
+    def _take_token(self):
+        # Seconds until a token is available, 0 if one was taken
+        if self.qps <= 0:
+            return 0
+        now = time.monotonic()
+        self.tokens = min(self.tokens + (now - self.refilled_at) * self.qps, max(self.qps, 1.0))
+        self.refilled_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.qps
+
+    @contextmanager
+    def slot(self, name):
+        """
+        Wait for the turn of a request, and hold its slot for the block.
+
+        Args:
+            name (str): The request's command class from COMMAND_CLASSES.
+        """
+        start = time.perf_counter()
+        ticket = (_PRIORITIES.get(name, _PRIORITIES["write"]), next(self.sequence))
+        with self.condition:
+            heapq.heappush(self.waiting, ticket)
+            while True:
+                if self.waiting[0] == ticket and self.in_flight < self.concurrency:
+                    delay = self._take_token()
+                    if not delay:
+                        break
+                    self.condition.wait(delay)
+                else:
+                    self.condition.wait()
+            heapq.heappop(self.waiting)
+            self.in_flight += 1
+            # The next request in line may be admitted as well
+            self.condition.notify_all()
+        QUEUE_SECONDS.observe(time.perf_counter() - start, name)
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.in_flight -= 1
+                self.condition.notify_all()
+
+
+class ScheduledSession(InstrumentedSession):
+    """
+    Instrumented session sending every request through a CommandScheduler.
+
+    Requests outside a command_priority block count as reads (GET) or writes.
+    Requests without a timeout get (CONNECT_TIMEOUT, READ_TIMEOUT).
+    """
+
+    def __init__(self, service, base_path="", scheduler=None, timeout=None):
+        super().__init__(service, base_path)
+        self.scheduler = scheduler or CommandScheduler()
+        self.timeout = timeout or (CONNECT_TIMEOUT, READ_TIMEOUT)
+        # Enough pooled connections for every request allowed in flight
+        adapter = HTTPAdapter(pool_maxsize=max(10, self.scheduler.concurrency))
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+
+    def request(self, method, url, *args, **kwargs):
+        name = command_class.get() or ("read" if method.upper() == "GET" else "write")
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        with self.scheduler.slot(name):
+            return super().request(method, url, *args, **kwargs)
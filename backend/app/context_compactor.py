@@ -0,0 +1,216 @@
+import re
+from collections import Counter
+
+# tiktoken encoding, loaded on first use (it may download its data), False if unavailable
+_encoding = None
+
+# Tokens of context sent to the model alongside the question
+CONTEXT_TOKEN_BUDGET = 1500
+
+# Entries listed in each "top" summary
+TOP_N = 5
+
+IP_PATTERN = re.compile(r"\b\d{1,3}(?:\.\d{1,3}){3}\b")
+WORD_PATTERN = re.compile(r"[a-z0-9.]+")
+
+# Words that make a section relevant even when they do not appear in it
+SECTION_KEYWORDS = {
+    "anomalies": {"anomaly", "anomalies", "alert", "alerts", "event", "events", "attack", "attacker", "score", "detected", "suspicious"},
+    "actions": {"action", "actions", "block", "blocked", "redirect", "redirected", "rate", "limit", "mitigation", "mitigations", "honeypot", "unblock"},
+    "elk_logs": {"log", "logs", "elk", "elastic", "siem", "login", "logon", "ad", "active", "directory", "user"},
+    "topology": {"topology", "network", "switch", "switches", "device", "devices", "link", "links", "host", "hosts", "onos", "mininet", "up", "down"},
+    "changes": {"new", "latest", "recent", "changed", "today", "now", "since"},
+}
+
+
+def estimate_tokens(text):
+    """
+    Count the tokens in a piece of text, approximately if tiktoken is not installed.
+    """
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text))
+    return len(text) // 4 + 1
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = False
+    return _encoding
+
+
+def _top(counter, n=TOP_N):
+    return ", ".join(f"{key} ({count})" for key, count in counter.most_common(n)) or "none"
+
+
+def summarize_anomalies(rows, focus_ips=()):
+    """
+    Summarize event rows of (timestamp, source, event, score, source_ip, destination_ip, count).
+    """
+    if not rows:
+        return ["No anomalies recorded."]
+    by_ip, score_by_ip, by_source, by_event = Counter(), Counter(), Counter(), Counter()
+    for timestamp, source, event, score, source_ip, destination_ip, count in rows:
+        count = count or 1
+        by_ip[source_ip] += count
+        score_by_ip[source_ip] += score or 0
+        by_source[source] += count
+        by_event[event] += count
+    lines = [
+        f"{sum(by_ip.values())} alerts in the last {len(rows)} events, from {rows[-1][0]} to {rows[0][0]}.",
+        f"Top source IPs by alerts: {_top(by_ip)}.",
+        f"Top source IPs by total score: {_top(score_by_ip)}.",
+        f"Alerts per source: {_top(by_source)}.",
+        f"Most common events: {_top(by_event)}.",
+    ]
+    for row in rows:
+        if row[4] in focus_ips:
+            lines.append(f"{row[0]} {row[4]} -> {row[5]}: {row[2]} from {row[1]}, score {row[3]} x{row[6] or 1}.")
+    lines.extend(f"Latest: {row[0]} {row[4]} -> {row[5]}: {row[2]} from {row[1]}, score {row[3]}." for row in rows[:3])
+    return lines
+
+
+def summarize_actions(rows, focus_ips=()):
+    """
+    Summarize action rows of (timestamp, action_type, reason, source_ip, admin_or_automated).
+    """
+    if not rows:
+        return ["No mitigation actions recorded."]
+    by_type = Counter(row[1] for row in rows)
+    by_origin = Counter(row[4] for row in rows)
+    by_ip = Counter(row[3] for row in rows)
+    lines = [
+        f"{len(rows)} recent actions: {_top(by_type)}.",
+        f"Admin vs automated: {_top(by_origin)}.",
+        f"Most mitigated IPs: {_top(by_ip)}.",
+    ]
+    for row in rows:
+        if row[3] and row[3].split("/")[0] in focus_ips:
+            lines.append(f"{row[0]} {row[1]} ({row[4]}): {row[2]}")
+    lines.extend(f"Latest: {row[0]} {row[1]} ({row[4]}): {row[2]}" for row in rows[:5])
+    return lines
+
+
+def summarize_elk_logs(hits, focus_ips=()):
+    """
+    Summarize Elasticsearch hits.
+    """
+    if not hits:
+        return ["No recent ELK logs."]
+    by_host, by_action = Counter(), Counter()
+    messages = []
+    for hit in hits:
+        source = hit.get("_source", {})
+        host_ip = source.get("host", {}).get("ip")
+        if isinstance(host_ip, list):
+            host_ip = host_ip[0] if host_ip else None
+        action = source.get("event", {}).get("action") or source.get("event", {}).get("code")
+        by_host[host_ip or "unknown"] += 1
+        by_action[action or "unknown"] += 1
+        message = str(source.get("message", "")).replace("\n", " ")[:120]
+        if message:
+            messages.append((host_ip, f"{source.get('@timestamp', '')} {host_ip}: {message}"))
+    lines = [
+        f"{len(hits)} recent log entries.",
+        f"Hosts: {_top(by_host)}.",
+        f"Event actions: {_top(by_action)}.",
+    ]
+    lines.extend(message for host_ip, message in messages if host_ip in focus_ips)
+    lines.extend(f"Latest: {message}" for _, message in messages[:3])
+    return lines
+
+
+def summarize_topology(topology):
+    """
+    Summarize the ONOS /topology response.
+    """
+    if not topology or "error" in topology:
+        return ["Topology unavailable, ONOS may be down."]
+    return [
+        f"ONOS reports {topology.get('devices', 0)} devices, {topology.get('links', 0)} links "
+        f"and {topology.get('clusters', 0)} clusters."
+    ]
+
+
+def summarize_changes(changes):
+    """
+    Summarize what changed since the previous context snapshot.
+    """
+    if not changes:
+        return ["No changes since the previous snapshot."]
+    lines = []
+    for name, value in changes.items():
+        if isinstance(value, list):
+            lines.append(f"{len(value)} new {name.replace('_', ' ')}.")
+        else:
+            lines.append(f"{name.replace('_', ' ')} changed.")
+    return lines
+
+
+def _relevance(name, lines, question_words, question_ips):
+    text = " ".join(lines).lower()
+    score = len(question_words & SECTION_KEYWORDS.get(name, set())) * 2
+    score += sum(1 for word in question_words if len(word) > 3 and word in text)
+    score += sum(5 for ip in question_ips if ip in text)
+    return score
+
+
+def _fit(header, lines, budget):
+    # Keep as many leading lines as fit, the summary lines come first
+    kept = []
+    used = estimate_tokens(header)
+    for line in lines:
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            break
+        kept.append(line)
+        used += cost
+    return kept, used
+
+
+def compact_context(question, data, changes=None, budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Turn raw context data into dense summaries packed into a token budget.
+
+    Sections are ordered by relevance to the question, so when the budget
+    runs out it is the least relevant detail that is dropped.
+
+    Args:
+        question (str): The user's question.
+        data (dict): 'anomalies', 'actions', 'elk_logs' and 'topology' data.
+        changes (dict, optional): Changes since the previous snapshot.
+        budget (int): Maximum tokens of context.
+
+    Returns:
+        str: The context text.
+    """
+    question_ips = set(IP_PATTERN.findall(question))
+    question_words = set(WORD_PATTERN.findall(question.lower()))
+    sections = {
+        "anomalies": ("Anomalies", summarize_anomalies(data.get("anomalies") or [], question_ips)),
+        "actions": ("Mitigation Actions", summarize_actions(data.get("actions") or [], question_ips)),
+        "elk_logs": ("ELK Logs", summarize_elk_logs(data.get("elk_logs") or [], question_ips)),
+        "topology": ("Network Topology", summarize_topology(data.get("topology"))),
+        "changes": ("Changes Since Last Snapshot", summarize_changes(changes)),
+    }
+    ranked = sorted(
+        sections.items(),
+        key=lambda item: _relevance(item[0], item[1][1], question_words, question_ips),
+        reverse=True
+    )
+
+    parts = []
+    remaining = budget
+    for _, (title, lines) in ranked:
+        header = f"{title}:"
+        kept, used = _fit(header, lines, remaining)
+        if not kept:
+            continue
+        parts.append("\n".join([header] + [f"- {line}" for line in kept]))
+        remaining -= used
+    return "\n\n".join(parts)
@@ -1,14 +1,24 @@
+import contextvars
+import logging
 import requests
 from requests.auth import HTTPBasicAuth
 import time
 import json
 import os
-from database import get_setting_value, record_action
-from topology import get_topology_data
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import quote, unquote
+from database import record_action, get_cached_setting, save_mitigations, get_mitigations, delete_mitigations
+from expiry import register_remover, remove_mitigations, scheduler
+from topology import get_topology_data, get_onos_base_url, onos_session
 from generator import point_to_point_intent
+from redirect_aggregator import aggregator
+from flow_batcher import flow_batcher
+from command_scheduler import command_class, command_priority, prioritized
+
+logger = logging.getLogger(__name__)
+
 # ONOS Controller Credentials
-ONOS_CONTROLLER_IP = get_setting_value("SDN Controller IP")
-ONOS_API_BASE = f'http://{ONOS_CONTROLLER_IP}:8181/onos/v1'
 ONOS_USERNAME = ''
 ONOS_PASSWORD = ''
 CONFIG_DIRECTORY = 'C:\\netsecflow\\backend\\app\\'
@@ -16,6 +26,17 @@ CONFIG_DIRECTORY = 'C:\\netsecflow\\backend\\app\\'
 # ONOS Authentication
 auth = HTTPBasicAuth(ONOS_USERNAME, ONOS_PASSWORD)
 
+# Priority of the per-hop flows installed along a redirect path
+PATH_FLOW_PRIORITY = 40000
+
+# Installed path flows are checked this many times, VERIFY_DELAY seconds apart
+VERIFY_ATTEMPTS = 10
+VERIFY_DELAY = 0.05
+VERIFY_WORKERS = 16
+
+# Mitigations installed in the current context, collected by track_mitigations
+_installed = contextvars.ContextVar("installed_mitigations", default=None)
+
 def log_action(action_type, reason, source_ip, admin_or_automated="Admin"):
     """
     Utility function to log actions in the database.
@@ -37,26 +58,115 @@ def is_valid_ip(ip):
     except (ValueError, IndexError):
         return False
 
+def _created_path(response, resource):
+    """
+    Path segments following the resource in the Location header of a created
+    object, e.g. [device_id, flow_id] for a flow. Empty if there is none.
+    """
+    location = response.headers.get("Location", "")
+    marker = f"/{resource}/"
+    if marker not in location:
+        return []
+    return [unquote(part) for part in location.split(marker, 1)[1].strip("/").split("/")]
+
+def _schedule_expiry(kind, action_type, source_ip, handle, duration):
+    """
+    Record a created mitigation for track_mitigations and schedule its
+    removal if it was created with a duration.
+    """
+    # Ids are None when the controller did not return them
+    identified = bool(handle) and None not in handle.values()
+    installed = _installed.get()
+    if installed is not None and identified:
+        installed.append((kind, action_type, handle))
+    if not duration:
+        return
+    if not identified:
+        logger.warning("%s for %s was not created or cannot be identified, it will not expire", action_type, source_ip)
+        return
+    scheduler.schedule(kind, action_type, source_ip or "", handle, duration)
+
+@contextmanager
+def track_mitigations(source_ip):
+    """
+    Record the mitigations created within a block for a source IP, so
+    withdraw_mitigations can remove them later.
+    """
+    installed = []
+    token = _installed.set(installed)
+    try:
+        yield installed
+    finally:
+        _installed.reset(token)
+        save_mitigations([(source_ip, kind, action_type, handle) for kind, action_type, handle in installed])
+
+def withdraw_mitigations(source_ip, admin_or_automated="Admin"):
+    """
+    Remove every mitigation recorded for a source IP by track_mitigations.
+
+    Mitigations that could not be removed stay recorded and are retried by
+    the next withdrawal.
+
+    Returns:
+        int: The number of mitigations that were recorded, 0 if none were.
+    """
+    recorded = get_mitigations(source_ip)
+    by_kind = {}
+    for mitigation_id, kind, action_type, handle in recorded:
+        by_kind.setdefault(kind, []).append((mitigation_id, action_type, handle))
+
+    removed_ids, action_types = [], []
+    for kind, entries in by_kind.items():
+        try:
+            removed = remove_mitigations(kind, [handle for _, _, handle in entries])
+        except Exception as e:
+            logger.error("Error removing %s mitigations of %s: %s", kind, source_ip, e)
+            removed = [False] * len(entries)
+        for (mitigation_id, action_type, _), ok in zip(entries, removed):
+            if ok:
+                removed_ids.append(mitigation_id)
+                if action_type not in action_types:
+                    action_types.append(action_type)
+    delete_mitigations(removed_ids)
+
+    if action_types:
+        log_action(
+            action_type="Withdraw",
+            reason=f"Removed {', '.join(action_types)} for {source_ip}.",
+            source_ip=source_ip,
+            admin_or_automated=admin_or_automated
+        )
+    if len(removed_ids) < len(recorded):
+        logger.warning("%s mitigations of %s could not be removed", len(recorded) - len(removed_ids), source_ip)
+    return len(recorded)
+
 def create_acl_rule(
     src_ip=None, dst_ip=None, src_mac=None, dst_mac=None,
     vlan_id=None, eth_type="0x0800", ip_proto="TCP", src_port=None,
     dst_port=None, action="ALLOW"
 ):
+    """
+    Create an ACL rule on the controller.
+
+    Returns:
+        dict: {'rule_id': ...} identifying the created rule, the id is None
+            if the controller did not return it. None if no rule was created.
+    """
     # Input Validation
     if src_ip and not is_valid_ip(src_ip):
-        print(f"Invalid source IP address: {src_ip}")
+        logger.warning("Invalid source IP address: %s", src_ip)
         return
     if dst_ip and not is_valid_ip(dst_ip):
-        print(f"Invalid destination IP address: {dst_ip}")
+        logger.warning("Invalid destination IP address: %s", dst_ip)
         return
     if action not in ["ALLOW", "DENY"]:
-        print(f"Invalid action: {action}")
+        logger.warning("Invalid action: %s", action)
         return
 
     acl_rule = {
         "action": action  # Action can be "ALLOW" or "DENY"
     }
-    print(f"Creating ACL rule with ipProto: {ip_proto}")
+    logger.debug("Creating ACL rule with ipProto: %s", ip_proto)
     if src_ip:
         acl_rule["srcIp"] = src_ip
     if dst_ip:
@@ -76,56 +186,65 @@ def create_acl_rule(
     if dst_port:
         acl_rule["dstTpPort"] = dst_port
 
-    url = f"{ONOS_API_BASE}/acl/rules/"
-    print(acl_rule)
+    url = f"{get_onos_base_url()}/acl/rules/"
+    logger.debug("ACL rule: %s", acl_rule)
     try:
-        response = requests.post(url, json=acl_rule, auth=auth)
+        response = onos_session.post(url, json=acl_rule, auth=auth)
         if response.status_code == 201:
-            print(f"Successfully created ACL rule: {acl_rule}")
+            logger.info("Successfully created ACL rule: %s", acl_rule)
+            rule_path = _created_path(response, "rules")
+            return {"rule_id": rule_path[0] if rule_path else None}
         else:
-            print(f"Failed to create ACL rule: {response.text}")
+            logger.error("Failed to create ACL rule: %s", response.text)
     except requests.exceptions.RequestException as e:
-        print(f"Error creating ACL rule: {e}")
+        logger.error("Error creating ACL rule: %s", e)
 
 
-def block_ip(src_ip=None, dst_ip=None, src_mac=None, dst_mac=None, vlan_id=None, eth_type=None, ip_proto=None, src_port=None, dst_port=None, admin_or_automated="Admin"):
+@prioritized("block")
+def block_ip(src_ip=None, dst_ip=None, src_mac=None, dst_mac=None, vlan_id=None, eth_type=None, ip_proto=None, src_port=None, dst_port=None, admin_or_automated="Admin", duration=None):
     log_action(
         action_type="Block",
         reason=f"Blocked traffic for {src_ip} to {dst_ip}.",
         source_ip=src_ip,
         admin_or_automated=admin_or_automated
     )
-    create_acl_rule(
+    handle = create_acl_rule(
         src_ip=src_ip, dst_ip=dst_ip, src_mac=src_mac, dst_mac=dst_mac,
         vlan_id=vlan_id, eth_type=eth_type, src_port=src_port, dst_port=dst_port, ip_proto=ip_proto,
         action="DENY"
-    )    
+    )
+    _schedule_expiry("acl", "Block", src_ip or dst_ip, handle, duration)
+    return handle is not None
 
 
-def allow_ip(src_ip=None, dst_ip=None, src_mac=None, dst_mac=None, vlan_id=None, eth_type=None, ip_proto=None, src_port=None, dst_port=None, admin_or_automated="Admin"):
+@prioritized("block")
+def allow_ip(src_ip=None, dst_ip=None, src_mac=None, dst_mac=None, vlan_id=None, eth_type=None, ip_proto=None, src_port=None, dst_port=None, admin_or_automated="Admin", duration=None):
     log_action(
         action_type="Allow",
         reason=f"Allow traffic from {src_ip} to {dst_ip}.",
         source_ip=src_ip,
         admin_or_automated=admin_or_automated
     )
-    create_acl_rule(
+    handle = create_acl_rule(
         src_ip=src_ip, dst_ip=dst_ip, src_mac=src_mac, dst_mac=dst_mac,
         vlan_id=vlan_id, eth_type=eth_type, src_port=src_port, dst_port=dst_port, ip_proto=ip_proto,
         action="ALLOW"
     )
+    _schedule_expiry("acl", "Allow", src_ip or dst_ip, handle, duration)
+    return handle is not None
 
 
+@prioritized("redirect")
 def redirect_traffic(src_ip, dest_ip, ingress_port, egress_port, device_id, config_name="redirect_intent", admin_or_automated="Admin"):
     if not is_valid_ip(src_ip) or not is_valid_ip(dest_ip):
-        print(f"Invalid source or destination IP address: {src_ip}, {dest_ip}")
+        logger.warning("Invalid source or destination IP address: %s, %s", src_ip, dest_ip)
         return
 
     # Remove CIDR suffix from dest_ip for ONOS compatibility
     dest_ip_without_cidr = dest_ip.split('/')[0]
 
     if not ingress_port or not egress_port:
-        print("Ingress and egress ports must be specified.")
+        logger.warning("Ingress and egress ports must be specified.")
         return
     
     log_action(
@@ -165,33 +284,34 @@ def redirect_traffic(src_ip, dest_ip, ingress_port, egress_port, device_id, conf
     with open(file_path, 'w') as json_file:
         json.dump(intent, json_file, indent=4)
 
-    print(f"Intent configuration saved to: {file_path}")
+    logger.debug("Intent configuration saved to: %s", file_path)
 
     headers = {'Content-Type': 'application/json'}
     try:
         with open(file_path, 'rb') as json_file:
-            response = requests.post(f"{ONOS_API_BASE}/intents", headers=headers, data=json_file.read(), auth=auth)
+            response = onos_session.post(f"{get_onos_base_url()}/intents", headers=headers, data=json_file.read(), auth=auth)
         if response.status_code == 201:
-            print(f"Successfully redirected traffic from {src_ip} to {dest_ip_without_cidr} on device {device_id}")
+            logger.info("Successfully redirected traffic from %s to %s on device %s", src_ip, dest_ip_without_cidr, device_id)
         else:
-            print(f"Failed to redirect traffic: {response.status_code}, {response.text}")
+            logger.error("Failed to redirect traffic: %s, %s", response.status_code, response.text)
     except requests.exceptions.RequestException as e:
-        print(f"Error redirecting traffic: {e}")
+        logger.error("Error redirecting traffic: %s", e)
 
 def list_acl_rules():
     try:
-        url = f"{ONOS_API_BASE}/acl/rules"
-        response = requests.get(url, auth=auth)
+        url = f"{get_onos_base_url()}/acl/rules"
+        response = onos_session.get(url, auth=auth)
         if response.status_code == 200:
             return response.json().get('aclRules', [])
         else:
-            print(f"Failed to fetch ACL rules: {response.text}")
+            logger.error("Failed to fetch ACL rules: %s", response.text)
             return []
     except requests.exceptions.RequestException as e:
-        print(f"Error fetching ACL rules: {e}")
+        logger.error("Error fetching ACL rules: %s", e)
         return []
 
 
+@prioritized("block")
 def unblock_ip(src_ip=None, dst_ip=None, src_port=None, dst_port=None, prefix_length='32',admin_or_automated="Admin"):
     acl_rules = list_acl_rules()
     log_action(
@@ -201,10 +321,10 @@ def unblock_ip(src_ip=None, dst_ip=None, src_port=None, dst_port=None, prefix_le
         admin_or_automated=admin_or_automated
     )
     if src_ip and not is_valid_ip(src_ip):
-        print(f"Invalid source IP address: {src_ip}")
+        logger.warning("Invalid source IP address: %s", src_ip)
         return
     if dst_ip and not is_valid_ip(dst_ip):
-        print(f"Invalid destination IP address: {dst_ip}")
+        logger.warning("Invalid destination IP address: %s", dst_ip)
         return
 
     if src_ip and '/' not in src_ip:
@@ -219,43 +339,57 @@ def unblock_ip(src_ip=None, dst_ip=None, src_port=None, dst_port=None, prefix_le
 
             if ((src_ip and rule_src_ip == src_ip) or (dst_ip and rule_dst_ip == dst_ip)):
                 rule_id = rule.get("id")
-                delete_url = f"{ONOS_API_BASE}/acl/rules/{rule_id}"
+                delete_url = f"{get_onos_base_url()}/acl/rules/{rule_id}"
                 try:
-                    response = requests.delete(delete_url, auth=auth)
+                    response = onos_session.delete(delete_url, auth=auth)
                     if response.status_code == 204:
-                        print(f"Successfully unblocked traffic for IP: {src_ip or dst_ip}")
+                        logger.info("Successfully unblocked traffic for IP: %s", src_ip or dst_ip)
                     else:
-                        print(f"Failed to delete ACL rule for IP {src_ip or dst_ip}: {response.text}")
+                        logger.error("Failed to delete ACL rule for IP %s: %s", src_ip or dst_ip, response.text)
                 except requests.exceptions.RequestException as e:
-                    print(f"Error deleting ACL rule: {e}")
-    print(f"No ACL rule found for IP {src_ip or dst_ip}")
+                    logger.error("Error deleting ACL rule: %s", e)
+    logger.warning("No ACL rule found for IP %s", src_ip or dst_ip)
 
-def rate_limit_for_host(host_ip, rate_limit_bps, admin_or_automated="Admin"):
+@prioritized("rate_limit")
+def rate_limit_for_host(host_ip, rate_limit_bps, admin_or_automated="Admin", duration=None):
+    """
+    Rate limit traffic to a host with a meter on the switch nearest to it.
+
+    Args:
+        host_ip (str): The IP address of the host.
+        rate_limit_bps (int): The rate limit.
+        admin_or_automated (str): Whether the action is admin-initiated or automated.
+        duration (float, optional): Seconds until the meter and its flow are
+            removed again. Permanent if omitted.
+
+    Returns:
+        bool: True if the rate limit was applied.
+    """
     try:
         # Fetch topology data
-        print("Fetching topology data...")
+        logger.debug("Fetching topology data...")
         topology_data = get_topology_data()
         hosts = topology_data.get('hosts', [])
 
         # Find the host in the topology by its IP address
-        print(f"Searching for host with IP {host_ip}...")
+        logger.debug("Searching for host with IP %s...", host_ip)
         target_host = next((host for host in hosts if host_ip in host.get('ipAddresses', [])), None)
         
         if not target_host:
-            print(f"Host with IP {host_ip} not found in the topology.")
-            return
+            logger.warning("Host with IP %s not found in the topology.", host_ip)
+            return False
 
         # Resolve the MAC address of the host
         host_mac = target_host.get('mac')
         if not host_mac:
-            print(f"MAC address not found for host with IP {host_ip}.")
-            return
+            logger.warning("MAC address not found for host with IP %s.", host_ip)
+            return False
 
         # Extract the closest inbound port from the host's location
         locations = target_host.get('locations', [])
         if not locations:
-            print(f"No locations found for host {host_ip}.")
-            return
+            logger.warning("No locations found for host %s.", host_ip)
+            return False
 
         # Use the first location as the closest inbound port
         closest_location = locations[0]
@@ -263,8 +397,8 @@ def rate_limit_for_host(host_ip, rate_limit_bps, admin_or_automated="Admin"):
         inbound_port = closest_location.get('port')
 
         if not device_id or not inbound_port:
-            print(f"Incomplete location data for host {host_ip}.")
-            return
+            logger.warning("Incomplete location data for host %s.", host_ip)
+            return False
 
         # Log the action
         log_action(
@@ -290,29 +424,29 @@ def rate_limit_for_host(host_ip, rate_limit_bps, admin_or_automated="Admin"):
         }
 
         # Create the meter on the switch
-        print("Creating meter on the device...")
-        meter_url = f"{ONOS_API_BASE}/meters/{device_id}"
-        meter_response = requests.post(meter_url, json=meter_config, auth=auth)
+        logger.debug("Creating meter on the device...")
+        meter_url = f"{get_onos_base_url()}/meters/{device_id}"
+        meter_response = onos_session.post(meter_url, json=meter_config, auth=auth)
         if meter_response.status_code != 201:
-            print(f"Failed to create meter: {meter_response.text}")
-            return
+            logger.error("Failed to create meter: %s", meter_response.text)
+            return False
 
         # Debugging: Fetch all meters to confirm creation
-        print("Fetching all meters after creation...")
-        meters_response = requests.get(meter_url, auth=auth)
+        logger.debug("Fetching all meters after creation...")
+        meters_response = onos_session.get(meter_url, auth=auth)
         if meters_response.status_code == 200:
             meters = meters_response.json().get("meters", [])
-            print("Meters fetched:", meters)
+            logger.debug("Meters fetched: %s", meters)
 
             # Find the most recent meter for debugging
             latest_meter = next((m for m in meters if m["bands"][0]["rate"] == rate_limit_bps), None)
             if not latest_meter:
-                print("Could not find the newly created meter.")
-                return
+                logger.warning("Could not find the newly created meter.")
+                return False
             meter_id = latest_meter["id"]
 
             # Create a flow with MAC-based selector
-            print("Attaching meter to flow...")
+            logger.debug("Attaching meter to flow...")
             flow_rule = {
                 "priority": 41000,
                 "timeout": 0,
@@ -332,18 +466,22 @@ def rate_limit_for_host(host_ip, rate_limit_bps, admin_or_automated="Admin"):
                 }
             }
 
-            flow_url = f"{ONOS_API_BASE}/flows/{device_id}"
-            flow_response = requests.post(flow_url, json=flow_rule, auth=auth)
-            if flow_response.status_code == 201:
-                print(f"Successfully applied rate limit for {host_ip} ({host_mac}) on port {inbound_port}.")
-            else:
-                print(f"Failed to apply flow for rate limiting: {flow_response.text}")
+            # Submitted together with the flows of concurrent mitigations
+            created = flow_batcher.submit([flow_rule])
+            if created:
+                logger.info("Successfully applied rate limit for %s (%s) on port %s.", host_ip, host_mac, inbound_port)
+                handle = {"device_id": device_id, "flow_id": created[0]["flowId"], "meter_id": meter_id}
+                _schedule_expiry("rate_limit", "Rate Limit", host_ip, handle, duration)
+                return True
+            logger.error("Failed to apply flow for rate limiting %s.", host_ip)
+            return False
         else:
-            print(f"Failed to fetch meters: {meters_response.text}")
-            return
+            logger.error("Failed to fetch meters: %s", meters_response.text)
+            return False
 
     except Exception as e:
-        print(f"Error applying rate limit for host {host_ip}: {e}")
+        logger.error("Error applying rate limit for host %s: %s", host_ip, e)
+        return False
 
 def calculate_shortest_path(src_device_id, dst_device_id, links):
     """
@@ -382,9 +520,128 @@ def calculate_shortest_path(src_device_id, dst_device_id, links):
 
 
 
+def path_hops(path, links, ingress_port, egress_port):
+    """
+    Turn a device path into the ports traffic enters and leaves each device by.
+
+    Args:
+        path (list of str): Device ids from calculate_shortest_path.
+        links (list of dict): Links from the topology.
+        ingress_port (str): Port traffic enters the first device by.
+        egress_port (str): Port traffic leaves the last device by, None if
+            the last device forwards it by itself.
+
+    Returns:
+        list of tuple: (device_id, in_port, out_port) per device on the path.
+    """
+    ports = {}
+    for link in links:
+        src, dst = link['src'], link['dst']
+        ports[(src['device'], dst['device'])] = (src['port'], dst['port'])
+        ports.setdefault((dst['device'], src['device']), (dst['port'], src['port']))
+
+    hops = []
+    in_port = ingress_port
+    for device, next_device in zip(path, path[1:]):
+        out_port, next_in_port = ports[(device, next_device)]
+        hops.append((device, in_port, out_port))
+        in_port = next_in_port
+    hops.append((path[-1], in_port, egress_port))
+    return hops
+
+def install_path(source_ip, hops, priority=PATH_FLOW_PRIORITY):
+    """
+    Steer a source IP's traffic along a path with one flow rule per hop.
+
+    All flows go to the controller in a single bulk request, shared with
+    concurrent mitigations, which installs them on the devices in parallel.
+    They are then checked concurrently.
+    Unlike an intent, nothing has to be compiled or routed by ONOS.
+
+    Args:
+        source_ip (str): The source IP address to match.
+        hops (list of tuple): (device_id, in_port, out_port) from path_hops.
+        priority (int): Priority of the flows.
+
+    Returns:
+        list of dict: {'deviceId', 'flowId'} of the installed flows, or None
+            if they could not be installed.
+    """
+    flows = []
+    for device_id, in_port, out_port in hops:
+        flows.append({
+            "priority": priority,
+            "timeout": 0,
+            "isPermanent": True,
+            "deviceId": device_id,
+            "treatment": {"instructions": [{"type": "OUTPUT", "port": str(out_port)}]},
+            "selector": {
+                "criteria": [
+                    {"type": "IN_PORT", "port": str(in_port)},
+                    {"type": "ETH_TYPE", "ethType": "0x0800"},
+                    {"type": "IPV4_SRC", "ip": f"{source_ip}/32"}
+                ]
+            }
+        })
+    installed = flow_batcher.submit(flows)
+    if installed is None:
+        logger.error("Failed to install path flows for %s.", source_ip)
+        return None
+    if not verify_flows(installed):
+        logger.warning("Path flows for %s were submitted but not all reported as added.", source_ip)
+    else:
+        logger.info("Installed %s path flows for %s.", len(installed), source_ip)
+    return installed
+
+def _flow_state(flow):
+    url = f"{get_onos_base_url()}/flows/{flow['deviceId']}/{flow['flowId']}"
+    try:
+        response = onos_session.get(url, auth=auth)
+        if response.status_code == 200:
+            found = response.json().get("flows", [])
+            return found[0].get("state") if found else None
+    except requests.exceptions.RequestException as e:
+        logger.debug("Error checking flow %s: %s", flow['flowId'], e)
+    return None
+
+def verify_flows(flows, attempts=VERIFY_ATTEMPTS, delay=VERIFY_DELAY):
+    """
+    Wait until the controller reports flows as added to their devices.
+
+    Every check queries all flows still pending concurrently.
+
+    Args:
+        flows (list of dict): {'deviceId', 'flowId'} of the flows.
+        attempts (int): How many times to check.
+        delay (float): Seconds between checks.
+
+    Returns:
+        bool: True if all flows were added.
+    """
+    pending = list(flows)
+    # Checks run in worker threads with the caller's command class
+    name = command_class.get()
+
+    def check(flow):
+        with command_priority(name):
+            return _flow_state(flow)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(len(pending), VERIFY_WORKERS))) as executor:
+        for attempt in range(attempts):
+            states = list(executor.map(check, pending))
+            pending = [flow for flow, state in zip(pending, states) if state != "ADDED"]
+            if not pending:
+                return True
+            time.sleep(delay)
+    return False
+
 def create_point_to_point_intents(source_ip, destination_ip, src_device, dst_device, src_port, dst_port, app_id="org.onosproject.cli", priority=200):
     """
     Create a Point-to-Point Intent to reroute traffic between two devices.
+
+    Returns:
+        dict: {'app_id': ..., 'key': ...} identifying the created intent, both
+            None if the controller did not return them. None if no intent was created.
     """
     try:
         intent = {
@@ -411,27 +668,42 @@ def create_point_to_point_intents(source_ip, destination_ip, src_device, dst_dev
         filename = f"intent_{src_device.replace(':', '_')}_{dst_device.replace(':', '_')}.json"
         with open(filename, 'w') as file:
             json.dump(intent, file, indent=4)
-        print(f"Intent saved to {filename}")
+        logger.debug("Intent saved to %s", filename)
 
         # Push the intent to ONOS
-        url = f"{ONOS_API_BASE}/intents"
+        url = f"{get_onos_base_url()}/intents"
         with open(filename, 'r') as file:
-            response = requests.post(
+            response = onos_session.post(
                 url,
                 auth=auth,
                 headers={"Content-Type": "application/json"},
                 data=file.read()
             )
         if response.status_code == 201:
-            print(f"Intent successfully pushed: {filename}")
+            logger.info("Intent successfully pushed: %s", filename)
+            return _intent_handle(response)
         else:
-            print(f"Failed to push intent: {response.status_code} {response.text}")
+            logger.error("Failed to push intent: %s %s", response.status_code, response.text)
     except Exception as e:
-        print(f"Error creating intent: {e}")
+        logger.error("Error creating intent: %s", e)
+
+def _intent_handle(response):
+    intent_path = _created_path(response, "intents")
+    if len(intent_path) != 2:
+        return {"app_id": None, "key": None}
+    return {"app_id": intent_path[0], "key": intent_path[1]}
 
-def redirect_traffic_full(source_ip, honeypot_ip, admin_or_automated="Admin"):
+@prioritized("redirect")
+def redirect_traffic_full(source_ip, honeypot_ip, admin_or_automated="Admin", duration=None):
     """
     Redirect traffic from a source IP to the honeypot IP through the shortest path.
+
+    A source host with a port of its own joins the honeypot's aggregated
+    intent, otherwise it gets a Point-to-Point Intent matching its IP.
+    The redirect is removed again after duration seconds if one is given.
+
+    Returns:
+        bool: True if the redirect was set up.
     """
     log_action(
         action_type="Redirect",
@@ -440,25 +712,25 @@ def redirect_traffic_full(source_ip, honeypot_ip, admin_or_automated="Admin"):
         admin_or_automated=admin_or_automated
     )
     try:
-        print("Fetching topology data...")
+        logger.debug("Fetching topology data...")
         topology_data = get_topology_data()
         devices = topology_data.get('devices', [])
         links = topology_data.get('links', [])
         hosts = topology_data.get('hosts', [])
 
         # Locate source host
-        print(f"Finding source host with IP {source_ip}...")
+        logger.debug("Finding source host with IP %s...", source_ip)
         source_host = next((host for host in hosts if source_ip in host.get('ipAddresses', [])), None)
         if not source_host:
-            print(f"Source host with IP {source_ip} not found.")
-            return
+            logger.warning("Source host with IP %s not found.", source_ip)
+            return False
 
         # Locate honeypot host
-        print(f"Finding honeypot host with IP {honeypot_ip}...")
+        logger.debug("Finding honeypot host with IP %s...", honeypot_ip)
         honeypot_host = next((host for host in hosts if honeypot_ip in host.get('ipAddresses', [])), None)
         if not honeypot_host:
-            print(f"Honeypot host with IP {honeypot_ip} not found.")
-            return
+            logger.warning("Honeypot host with IP %s not found.", honeypot_ip)
+            return False
 
         # Extract source and destination device details
         src_location = source_host['locations'][0]
@@ -470,16 +742,37 @@ def redirect_traffic_full(source_ip, honeypot_ip, admin_or_automated="Admin"):
         dst_port = dst_location['port']
 
         # Determine shortest path
-        print(f"Calculating the shortest path from {src_device_id} to {dst_device_id}...")
+        logger.debug("Calculating the shortest path from %s to %s...", src_device_id, dst_device_id)
         path = calculate_shortest_path(src_device_id, dst_device_id, links)
         if not path:
-            print("No path found between the source and honeypot.")
-            return
+            logger.warning("No path found between the source and honeypot.")
+            return False
+
+        logger.debug("Shortest path calculated: %s", path)
 
-        print(f"Shortest path calculated: {path}")
+        # Install the computed path directly instead of having ONOS route an intent
+        if get_cached_setting("Redirect Mode") == "path":
+            flows = install_path(source_ip, path_hops(path, links, src_port, dst_port))
+            _schedule_expiry("flows", "Redirect", source_ip, {"flows": flows} if flows else None, duration)
+            return flows is not None
+
+        # Traffic can be selected by ingress port when no other host shares it
+        shares_port = any(
+            host is not source_host and any(
+                (location.get('elementId'), str(location.get('port'))) == (src_device_id, str(src_port))
+                for location in host.get('locations', [])
+            )
+            for host in hosts
+        )
+        if not shares_port:
+            aggregator.add(source_ip, honeypot_ip, src_location, dst_location)
+            _schedule_expiry("honeypot_redirect", "Redirect", source_ip,
+                             {"source_ip": source_ip, "honeypot_ip": honeypot_ip}, duration)
+            logger.info("Added %s to the honeypot intent for %s.", source_ip, honeypot_ip)
+            return True
 
         # Generate the Point-to-Point Intent JSON
-        create_point_to_point_intents(
+        handle = create_point_to_point_intents(
             source_ip=source_ip,
             destination_ip=honeypot_ip,
             src_device=src_device_id,
@@ -487,32 +780,54 @@ def redirect_traffic_full(source_ip, honeypot_ip, admin_or_automated="Admin"):
             src_port=src_port,
             dst_port=dst_port
         )
+        _schedule_expiry("intent", "Redirect", source_ip, handle, duration)
+        if handle is None:
+            return False
 
-        print("Intent created successfully.")
+        logger.info("Intent created successfully.")
+        return True
     except Exception as e:
-        print(f"Error redirecting traffic: {e}")
+        logger.error("Error redirecting traffic: %s", e)
+        return False
+
+def remove_redirect(source_ip, admin_or_automated="Admin"):
+    """
+    Stop redirecting a source IP to its honeypot.
 
-def redirect_to_intermediate_ovs(source_ip, ovs_id, admin_or_automated="Admin"):
+    Only redirects aggregated into a honeypot intent can be removed here.
+    """
+    if aggregator.remove([source_ip]):
+        log_action(
+            action_type="Remove Redirect",
+            reason=f"Stopped redirecting traffic from {source_ip}.",
+            source_ip=source_ip,
+            admin_or_automated=admin_or_automated
+        )
+
+@prioritized("redirect")
+def redirect_to_intermediate_ovs(source_ip, ovs_id, admin_or_automated="Admin", duration=None):
     """
     Redirect traffic from a source host to an intermediate Open vSwitch (OVS).
     After reaching the intermediate switch, traffic is forwarded using reactive routing.
     :param source_ip: The IP address of the source host.
     :param ovs_id: The ID of the intermediate Open vSwitch.
     :param admin_or_automated: Indicates if the action is admin-triggered or automated.
+    :param duration: Seconds until the intent is removed again, permanent if omitted.
+    :return: True if the redirect was set up.
     """
     try:
-        print("Fetching topology data...")
+        logger.debug("Fetching topology data...")
         topology_data = get_topology_data()
         devices = topology_data.get('devices', [])
         links = topology_data.get('links', [])
         hosts = topology_data.get('hosts', [])
 
         # Find source host
-        print(f"Finding source host with IP {source_ip}...")
+        logger.debug("Finding source host with IP %s...", source_ip)
         source_host = next((host for host in hosts if source_ip in host.get('ipAddresses', [])), None)
         if not source_host:
-            print(f"Source host with IP {source_ip} not found.")
-            return
+            logger.warning("Source host with IP %s not found.", source_ip)
+            return False
 
         # Locate the source host's switch and port
         source_location = source_host.get('locations', [])[0]
@@ -520,27 +835,40 @@ def redirect_to_intermediate_ovs(source_ip, ovs_id, admin_or_automated="Admin"):
         ingress_port = source_location.get('port')  # Port nearest to the source host
 
         # Locate the intermediate switch
-        print(f"Finding intermediate Open vSwitch with ID {ovs_id}...")
+        logger.debug("Finding intermediate Open vSwitch with ID %s...", ovs_id)
         intermediate_switch = next((device for device in devices if device['id'] == ovs_id), None)
         if not intermediate_switch:
-            print(f"Intermediate Open vSwitch with ID {ovs_id} not found.")
-            return
+            logger.warning("Intermediate Open vSwitch with ID %s not found.", ovs_id)
+            return False
 
         intermediate_device_id = intermediate_switch['id']
 
         # Find the link from the source switch to the intermediate switch
-        print(f"Finding link from source switch ({src_device_id}) to intermediate switch ({intermediate_device_id})...")
+        logger.debug("Finding link from source switch (%s) to intermediate switch (%s)...", src_device_id, intermediate_device_id)
         link_to_intermediate = next(
             (l for l in links if l['src']['device'] == src_device_id and l['dst']['device'] == intermediate_device_id),
             None
         )
         if not link_to_intermediate:
-            print(f"No direct link found between {src_device_id} and {intermediate_device_id}.")
-            return
+            # Steer the traffic hop by hop along the shortest path instead
+            path = calculate_shortest_path(src_device_id, intermediate_device_id, links)
+            if not path:
+                logger.warning("No path found between %s and %s.", src_device_id, intermediate_device_id)
+                return False
+            log_action(
+                action_type="Redirect",
+                reason=f"Redirected traffic from {source_ip} to intermediate switch {ovs_id}.",
+                source_ip=source_ip,
+                admin_or_automated=admin_or_automated
+            )
+            # The intermediate switch forwards the traffic itself
+            flows = install_path(source_ip, path_hops(path, links, ingress_port, None)[:-1])
+            _schedule_expiry("flows", "Intermediate Redirect", source_ip, {"flows": flows} if flows else None, duration)
+            return flows is not None
 
         egress_port = link_to_intermediate['src']['port']  # Port on the source switch to the intermediate switch
 
-        print(f"Source switch ingress port: {ingress_port}, egress port: {egress_port}")
+        logger.debug("Source switch ingress port: %s, egress port: %s", ingress_port, egress_port)
 
         # Log action
         log_action(
@@ -575,21 +903,127 @@ def redirect_to_intermediate_ovs(source_ip, ovs_id, admin_or_automated="Admin"):
         file_name = f"intent_{src_device_id.replace(':', '_')}_{ovs_id.replace(':', '_')}.json"
         with open(file_name, 'w') as file:
             json.dump(intent, file, indent=4)
-        print(f"Intent saved to {file_name}")
+        logger.debug("Intent saved to %s", file_name)
 
         # Submit the intent to ONOS
         headers = {'Content-Type': 'application/json'}
-        url = f"{ONOS_API_BASE}/intents"
+        url = f"{get_onos_base_url()}/intents"
         with open(file_name, 'r') as file:
-            response = requests.post(url, headers=headers, data=file.read(), auth=auth)
+            response = onos_session.post(url, headers=headers, data=file.read(), auth=auth)
 
         if response.status_code == 201:
-            print(f"Successfully redirected traffic from {source_ip} to {ovs_id}.")
-        else:
-            print(f"Failed to redirect traffic: {response.status_code} {response.text}")
+            logger.info("Successfully redirected traffic from %s to %s.", source_ip, ovs_id)
+            _schedule_expiry("intent", "Intermediate Redirect", source_ip, _intent_handle(response), duration)
+            return True
+        logger.error("Failed to redirect traffic: %s %s", response.status_code, response.text)
+        return False
 
     except Exception as e:
-        print(f"Error redirecting traffic: {e}")
+        logger.error("Error redirecting traffic: %s", e)
+        return False
+
+
+def remove_acl_rules(handles):
+    """
+    Remove expired ACL rules.
+
+    Args:
+        handles (list of dict): Handles returned by create_acl_rule.
+
+    Returns:
+        list of bool: Whether each rule is gone.
+    """
+    results = []
+    for handle in handles:
+        url = f"{get_onos_base_url()}/acl/rules/{handle['rule_id']}"
+        try:
+            response = onos_session.delete(url, auth=auth)
+            # Rules already removed by hand count as removed
+            results.append(response.status_code in (200, 204, 404))
+        except requests.exceptions.RequestException as e:
+            logger.error("Error deleting ACL rule %s: %s", handle['rule_id'], e)
+            results.append(False)
+    return results
+
+def remove_intents(handles):
+    """
+    Withdraw expired intents.
+
+    Args:
+        handles (list of dict): {'app_id', 'key'} of each intent.
+
+    Returns:
+        list of bool: Whether each intent is gone.
+    """
+    results = []
+    for handle in handles:
+        url = f"{get_onos_base_url()}/intents/{quote(handle['app_id'], safe='')}/{quote(handle['key'], safe='')}"
+        try:
+            response = onos_session.delete(url, auth=auth)
+            results.append(response.status_code in (200, 204, 404))
+        except requests.exceptions.RequestException as e:
+            logger.error("Error withdrawing intent %s: %s", handle['key'], e)
+            results.append(False)
+    return results
+
+def _delete_flows(flows):
+    """
+    Remove flows from their devices with a single batch request.
+
+    Returns:
+        bool: True if the controller accepted the removal.
+    """
+    try:
+        response = onos_session.delete(f"{get_onos_base_url()}/flows", json={"flows": flows}, auth=auth)
+        if response.status_code not in (200, 204):
+            logger.error("Failed to remove flows: %s %s", response.status_code, response.text)
+            return False
+        return True
+    except requests.exceptions.RequestException as e:
+        logger.error("Error removing flows: %s", e)
+        return False
+
+def remove_flows(handles):
+    """
+    Remove the flows of expired path redirects in one batch request.
+
+    Args:
+        handles (list of dict): {'flows': [{'deviceId', 'flowId'}, ...]} of each redirect.
+
+    Returns:
+        list of bool: Whether the flows of each redirect are gone.
+    """
+    removed = _delete_flows([flow for handle in handles for flow in handle["flows"]])
+    return [removed] * len(handles)
+
+def remove_rate_limits(handles):
+    """
+    Remove the flows of expired rate limits in one batch request, then their meters.
+
+    Args:
+        handles (list of dict): {'device_id', 'flow_id', 'meter_id'} of each rate limit.
+
+    Returns:
+        list of bool: Whether each flow and meter are gone.
+    """
+    if not _delete_flows([{"deviceId": handle["device_id"], "flowId": handle["flow_id"]} for handle in handles]):
+        return [False] * len(handles)
+
+    results = []
+    for handle in handles:
+        url = f"{get_onos_base_url()}/meters/{handle['device_id']}/{handle['meter_id']}"
+        try:
+            response = onos_session.delete(url, auth=auth)
+            results.append(response.status_code in (200, 204, 404))
+        except requests.exceptions.RequestException as e:
+            logger.error("Error removing meter %s: %s", handle['meter_id'], e)
+            results.append(False)
+    return results
+
+register_remover("acl", remove_acl_rules)
+register_remover("intent", remove_intents)
+register_remover("rate_limit", remove_rate_limits)
+register_remover("flows", remove_flows)
 
 
 def test_rate_limit_for_host():
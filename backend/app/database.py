@@ -1,9 +1,165 @@
+import functools
+import ipaddress
+import json
+import logging
 import sqlite3
 import os
+import threading
+import time
+from datetime import datetime, timezone
+from event_bus import bus
+from metrics import timed_db
 
-# Path to the database file
-DB_PATH = os.path.abspath("C:\\netsecflow\\database\\netsecflow.db")
+logger = logging.getLogger(__name__)
 
+# Path to the database file, NETSECFLOW_DB_PATH overrides it (e.g. for benchmarks)
+DB_PATH = os.path.abspath(os.environ.get("NETSECFLOW_DB_PATH", "C:\\netsecflow\\database\\netsecflow.db"))
+
+# Columns of the flows table, in the order they are stored and returned
+FLOW_COLUMNS = ["id", "source_ip", "destination_ip", "protocol", "bandwidth", "flow_duration", "priority", "app_id", "device_id"]
+
+# Tables split into monthly partitions named e.g. events_2024_05. The table
+# itself is the hot partition holding the recent rows.
+PARTITIONED_TABLES = ("events", "actions")
+
+# Lookup tables of the categorical event columns, holding each distinct name once
+LOOKUP_TABLES = ("event_sources", "event_types")
+
+# Lookup ids by (table, name) and names by table and id, filled as they are used
+_lookup_ids = {}
+_lookup_names = {table: {} for table in LOOKUP_TABLES}
+_lookup_lock = threading.Lock()
+
+# Columns of an events table row, decoded, in the order they are stored
+EVENT_COLUMNS = ["event_id", "source", "event", "score", "source_ip", "destination_ip",
+                 "timestamp", "count", "first_seen", "last_seen"]
+STORED_EVENT_COLUMNS = ["event_id", "source_id", "event_type_id", "score", "source_ip", "destination_ip",
+                        "timestamp", "count", "first_seen", "last_seen"]
+
+# Columns of the suppressions table, in the order they are returned
+SUPPRESSION_COLUMNS = ["network", "reason", "created_at", "expires_at"]
+
+# Columns of the jobs table, in the order they are returned
+JOB_COLUMNS = ["job_id", "kind", "params", "status", "error", "created_at", "started_at", "finished_at"]
+
+# Per-resource version counters, bumped by the write helpers so read
+# endpoints can answer conditional requests without querying SQLite
+RESOURCES = ("events", "actions", "flows", "settings", "suppressions")
+_versions = {resource: [0, time.time()] for resource in RESOURCES}
+_versions_lock = threading.Lock()
+
+# Dashboard stream topic carrying the changes of a resource
+RESOURCE_TOPICS = {"events": "anomalies", "actions": "actions", "flows": "flows"}
+
+# Versions of the other processes' rows in the versions table last seen here,
+# keyed by (resource, writer), None until first read. Guarded by _versions_lock
+_seen_versions = None
+
+# check_external_writes reads the versions table at most this often
+EXTERNAL_CHECK_SECONDS = 1.0
+_external_checked_at = 0.0
+
+# Setting values cached by get_cached_setting, keyed by the settings version
+_setting_cache = {}
+
+def record_change(cursor, *resources):
+    """
+    Tell other processes that resources are being modified.
+
+    Called inside the write transaction, so the versions table changes if
+    and only if the data does. Each process counts its writes in rows of its
+    own, which check_external_writes in the other processes compares.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor of the open write transaction.
+        resources (str): Names from RESOURCES.
+    """
+    cursor.executemany('''
+        INSERT INTO versions (resource, writer, version) VALUES (?, ?, 1)
+        ON CONFLICT(resource, writer) DO UPDATE SET version = version + 1;
+    ''', [(resource, os.getpid()) for resource in resources])
+
+def bump_version(*resources):
+    """
+    Record that resources were modified by this process.
+
+    Every write helper changing one of RESOURCES calls this after
+    committing the transaction it called record_change in.
+
+    Args:
+        resources (str): Names from RESOURCES.
+    """
+    now = time.time()
+    with _versions_lock:
+        for resource in resources:
+            _versions[resource][0] += 1
+            _versions[resource][1] = now
+
+def _read_versions():
+    with sqlite3.connect(DB_PATH) as conn:
+        rows = conn.execute("SELECT resource, writer, version FROM versions WHERE writer != ?;", (os.getpid(),))
+        return {(resource, writer): version for resource, writer, version in rows if resource in _versions}
+
+def check_external_writes():
+    """
+    Detect resources modified by other processes (e.g. other server workers).
+
+    The versions table is read at most every EXTERNAL_CHECK_SECONDS. Only
+    the resources another process wrote are invalidated, and only dashboard
+    streams of their topics are told to resync, as no deltas were published
+    here.
+
+    Returns:
+        list: The resources modified by other processes since the last check.
+    """
+    global _seen_versions, _external_checked_at
+    now = time.monotonic()
+    with _versions_lock:
+        if now - _external_checked_at < EXTERNAL_CHECK_SECONDS:
+            return []
+        _external_checked_at = now
+    try:
+        current = _read_versions()
+    except sqlite3.Error as e:
+        logger.warning("Could not check for writes of other processes: %s", e)
+        return []
+
+    changed = set()
+    with _versions_lock:
+        if _seen_versions is not None:
+            changed = {key[0] for key, version in current.items() if _seen_versions.get(key) != version}
+            wall = time.time()
+            for resource in changed:
+                _versions[resource][0] += 1
+                _versions[resource][1] = wall
+        _seen_versions = current
+    topics = sorted(RESOURCE_TOPICS[resource] for resource in changed if resource in RESOURCE_TOPICS)
+    if topics:
+        bus.publish("resync", {"topics": topics})
+    return sorted(changed)
+
+def get_version(resource):
+    """
+    Retrieve the current version of a resource.
+
+    Args:
+        resource (str): A name from RESOURCES.
+
+    Returns:
+        tuple: (version, last_modified) where last_modified is a Unix timestamp.
+    """
+    # Called for every alert through the cached settings and suppressions,
+    # check_external_writes only queries every EXTERNAL_CHECK_SECONDS
+    check_external_writes()
+    with _versions_lock:
+        version, last_modified = _versions[resource]
+    return version, last_modified
+
+def _db_timestamp():
+    # Same format and timezone as SQLite's CURRENT_TIMESTAMP
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+@timed_db
 def init_db():
     """
     Initialize the settings and flows tables in the database if they do not exist.
@@ -32,40 +188,556 @@ def init_db():
                 device_id TEXT
             );
         ''')
+        # Create the lookup tables of event sources and types
+        for table in LOOKUP_TABLES:
+            cursor.execute(f'''
+                CREATE TABLE IF NOT EXISTS {table} (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT UNIQUE NOT NULL
+                );
+            ''')
         # Create the events table to store webhook data
+        create_events_table(cursor, "events")
+        # Older databases predate coalesced events
+        if "source" in _table_columns(cursor, "events"):
+            add_missing_columns(cursor, "events", {
+                "count": "INTEGER NOT NULL DEFAULT 1",
+                "first_seen": "DATETIME",
+                "last_seen": "DATETIME"
+            })
+        migrate_events_encoding(cursor)
+        # Create the actions table to record actions taken
+        create_actions_table(cursor, "actions")
+        # Create the reputation table holding the decaying marks of each source IP
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS events (
-                event_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                source TEXT NOT NULL,
-                event TEXT NOT NULL,
-                score INTEGER NOT NULL,
-                source_ip TEXT NOT NULL,
-                destination_ip TEXT NOT NULL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+            CREATE TABLE IF NOT EXISTS reputation (
+                source_ip TEXT PRIMARY KEY,
+                score REAL NOT NULL,
+                last_update REAL NOT NULL,
+                level INTEGER NOT NULL DEFAULT 0,
+                action TEXT
             );
         ''')
-        # Create the actions table to record actions taken
+        # Older databases only stored the level, an index into the policy's actions
+        add_missing_columns(cursor, "reputation", {"action": "TEXT"})
+        # Create the expirations table holding time-bounded mitigations still to be removed
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS actions (
-                action_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            CREATE TABLE IF NOT EXISTS expirations (
+                expiration_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
                 action_type TEXT NOT NULL,
-                reason TEXT NOT NULL,
                 source_ip TEXT NOT NULL,
-                admin_or_automated TEXT NOT NULL
+                handle TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                claimed_at REAL
             );
         ''')
+        add_missing_columns(cursor, "expirations", {"claimed_at": "REAL"})
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_expirations_expires_at ON expirations (expires_at);")
+        # Create the mitigations table holding what the decision engine installed for each source IP
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS mitigations (
+                mitigation_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                source_ip TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                action_type TEXT NOT NULL,
+                handle TEXT NOT NULL
+            );
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_mitigations_source_ip ON mitigations (source_ip);")
+        # Create the honeypot redirects table listing the attackers aggregated into each honeypot's intent
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS honeypot_redirects (
+                source_ip TEXT PRIMARY KEY,
+                honeypot_ip TEXT NOT NULL,
+                device_id TEXT NOT NULL,
+                port TEXT NOT NULL,
+                honeypot_device_id TEXT NOT NULL,
+                honeypot_port TEXT NOT NULL
+            );
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_honeypot_redirects_honeypot ON honeypot_redirects (honeypot_ip);")
+        # Create the jobs table tracking traffic-control actions run in the background
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                params TEXT NOT NULL,
+                status TEXT NOT NULL,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            );
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_created_at ON jobs (created_at);")
+        # No process is running jobs while the tables are set up, unfinished ones were interrupted
+        cursor.execute('''
+            UPDATE jobs SET status = 'failed', error = 'Interrupted by a restart', finished_at = ?
+            WHERE status IN ('queued', 'running');
+        ''', (time.time(),))
+        # Create the suppressions table listing the IPs and networks whose alerts are dropped on arrival
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS suppressions (
+                network TEXT PRIMARY KEY,
+                reason TEXT,
+                created_at REAL NOT NULL,
+                expires_at REAL
+            );
+        ''')
+        # Create the versions table counting each process's writes per resource
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS versions (
+                resource TEXT NOT NULL,
+                writer INTEGER NOT NULL,
+                version INTEGER NOT NULL,
+                PRIMARY KEY (resource, writer)
+            );
+        ''')
+        migrate_marks_to_reputation(cursor)
+        record_change(cursor, *RESOURCES)
         conn.commit()
+    bump_version(*RESOURCES)
+
+def create_events_table(cursor, name):
+    """
+    Create the events table, or one of its monthly partitions, with its indexes.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor of an open connection.
+        name (str): 'events' or a partition name such as 'events_2024_05'.
+    """
+    # Sources and event types are ids into the lookup tables and IP
+    # addresses are packed into 4 or 16 bytes, see _encode_events
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {name} (
+            event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            source_id INTEGER NOT NULL REFERENCES event_sources (id),
+            event_type_id INTEGER NOT NULL REFERENCES event_types (id),
+            score REAL NOT NULL,
+            source_ip BLOB NOT NULL,
+            destination_ip BLOB NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            count INTEGER NOT NULL DEFAULT 1,
+            first_seen DATETIME,
+            last_seen DATETIME
+        );
+    ''')
+    # Ignoring an IP deletes its events, reads are ordered and ranged by time
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{name}_source_ip ON {name} (source_ip);")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{name}_timestamp ON {name} (timestamp);")
+
+def create_actions_table(cursor, name):
+    """
+    Create the actions table, or one of its monthly partitions, with its index.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor of an open connection.
+        name (str): 'actions' or a partition name such as 'actions_2024_05'.
+    """
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {name} (
+            action_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            action_type TEXT NOT NULL,
+            reason TEXT NOT NULL,
+            source_ip TEXT NOT NULL,
+            admin_or_automated TEXT NOT NULL
+        );
+    ''')
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{name}_timestamp ON {name} (timestamp);")
+
+_TABLE_CREATORS = {"events": create_events_table, "actions": create_actions_table}
+
+def _table_columns(cursor, name):
+    return [row[1] for row in cursor.execute(f"PRAGMA table_info({name});").fetchall()]
+
+def pack_ip(value):
+    """
+    Pack an IP address into the 4 or 16 bytes stored in the events table.
+
+    Args:
+        value (str): An IPv4 or IPv6 address.
+
+    Returns:
+        bytes: The packed address, or the value unchanged if it is not an IP address.
+    """
+    try:
+        return ipaddress.ip_address(value).packed
+    except ValueError:
+        return value
+
+@functools.lru_cache(maxsize=65536)
+def unpack_ip(value):
+    """
+    Turn a stored IP address back into text.
+
+    Args:
+        value (bytes or str): A value written by pack_ip.
+
+    Returns:
+        str: The address as text.
+    """
+    if isinstance(value, bytes):
+        return str(ipaddress.ip_address(value))
+    return value
+
+def _lookup_id(cursor, table, name, pending):
+    # Id of a source or event type name, added to its lookup table on first use.
+    # Ids added by the open transaction go to pending, see _publish_lookups.
+    key = (table, name)
+    lookup_id = _lookup_ids.get(key) or pending.get(key)
+    if lookup_id is None:
+        cursor.execute(f"INSERT OR IGNORE INTO {table} (name) VALUES (?);", (name,))
+        cursor.execute(f"SELECT id FROM {table} WHERE name = ?;", (name,))
+        lookup_id = pending[key] = cursor.fetchone()[0]
+    return lookup_id
+
+def _publish_lookups(pending):
+    # Called once the transaction that added them committed; a rolled back
+    # id could otherwise be reused for another name and decode as this one
+    with _lookup_lock:
+        for (table, name), lookup_id in pending.items():
+            _lookup_ids[(table, name)] = lookup_id
+            _lookup_names[table][lookup_id] = name
+
+def _lookup_name(cursor, table, lookup_id):
+    names = _lookup_names[table]
+    name = names.get(lookup_id)
+    if name is None and lookup_id is not None:
+        # Added by another process, reload the whole (small) table
+        rows = cursor.execute(f"SELECT id, name FROM {table};").fetchall()
+        with _lookup_lock:
+            names.update(rows)
+            _lookup_ids.update(((table, row_name), row_id) for row_id, row_name in rows)
+        name = names.get(lookup_id)
+    return name
+
+def _event_values(data):
+    # Values of an event stored as they are, checked before any lookup row is added
+    for field in ("Source", "Event", "SourceIP", "DestinationIP"):
+        if data.get(field) is None:
+            raise ValueError(f"Event is missing '{field}'")
+    return (
+        float(data.get("Score", 0)),
+        pack_ip(data.get("SourceIP")),
+        pack_ip(data.get("DestinationIP")),
+        int(data.get("Count", 1)),
+        data.get("FirstSeen"),
+        data.get("LastSeen")
+    )
+
+def _encode_events(cursor, events, pending):
+    # Webhook or coalesced events -> events rows without event_id and timestamp.
+    # The whole batch is checked first, so an invalid event adds no lookup rows.
+    values = [_event_values(data) for data in events]
+    return [
+        (
+            _lookup_id(cursor, "event_sources", data["Source"], pending),
+            _lookup_id(cursor, "event_types", data["Event"], pending)
+        ) + event_values
+        for data, event_values in zip(events, values)
+    ]
+
+def _decode_event(cursor, row):
+    # Stored events row -> values of EVENT_COLUMNS
+    event_id, source_id, event_type_id, score, source_ip, destination_ip = row[:6]
+    return (
+        event_id,
+        _lookup_name(cursor, "event_sources", source_id),
+        _lookup_name(cursor, "event_types", event_type_id),
+        score,
+        unpack_ip(source_ip),
+        unpack_ip(destination_ip)
+    ) + tuple(row[6:])
+
+def migrate_events_encoding(cursor):
+    """
+    Convert events tables with text sources, event names and IP addresses
+    to the compact encoding, keeping their ids and timestamps.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor of the connection running init_db.
+    """
+    # Not published, the ids are cached when first used after init_db commits
+    pending = {}
+    for name in ["events"] + [partition for _, partition in _partitions(cursor, "events")]:
+        if "source" not in _table_columns(cursor, name):
+            continue
+        legacy = f"{name}_legacy"
+        cursor.execute(f"ALTER TABLE {name} RENAME TO {legacy};")
+        # The indexes moved with the table, free their names for the new one
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL;",
+                       (legacy,))
+        for index, in cursor.fetchall():
+            cursor.execute(f"DROP INDEX {index};")
+        create_events_table(cursor, name)
+
+        reader = cursor.connection.cursor()
+        reader.execute(f"SELECT {', '.join(EVENT_COLUMNS)} FROM {legacy};")
+        migrated = 0
+        while True:
+            rows = reader.fetchmany(5000)
+            if not rows:
+                break
+            encoded = _encode_events(cursor, [
+                {"Source": row[1], "Event": row[2], "Score": row[3], "SourceIP": row[4], "DestinationIP": row[5]}
+                for row in rows
+            ], pending)
+            cursor.executemany(f'''
+                INSERT INTO {name} ({', '.join(STORED_EVENT_COLUMNS)})
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+            ''', [
+                (row[0],) + values[:5] + (row[6], row[7], row[8], row[9])
+                for row, values in zip(rows, encoded)
+            ])
+            migrated += len(rows)
+        cursor.execute(f"DROP TABLE {legacy};")
+        logger.info("Converted %s rows of %s to the compact event encoding", migrated, name)
+
+def partition_name(table, month):
+    """
+    Name of the partition of a table holding one month.
+
+    Args:
+        table (str): A name from PARTITIONED_TABLES.
+        month (str): The month as 'YYYY-MM'.
+
+    Returns:
+        str: e.g. 'events_2024_05'.
+    """
+    return f"{table}_{month.replace('-', '_')}"
+
+def table_for_partition(name):
+    """
+    Table a partition belongs to.
+
+    Args:
+        name (str): A partition name such as 'events_2024_05'.
+
+    Returns:
+        str: e.g. 'events'.
+    """
+    return name[:-len("_YYYY_MM")]
+
+def month_bounds(month):
+    """
+    First timestamp of a month and of the next one, in the stored timestamp format.
+
+    Args:
+        month (str): The month as 'YYYY-MM'.
+
+    Returns:
+        tuple: ('YYYY-MM-01 00:00:00', first timestamp of the next month).
+    """
+    year, number = int(month[:4]), int(month[5:7])
+    year_after, number_after = (year + 1, 1) if number == 12 else (year, number + 1)
+    return f"{year:04d}-{number:02d}-01 00:00:00", f"{year_after:04d}-{number_after:02d}-01 00:00:00"
 
+def _partitions(cursor, table):
+    cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ? ORDER BY name;",
+        (f"{table}_[0-9][0-9][0-9][0-9]_[0-9][0-9]",)
+    )
+    return [(name[-7:].replace("_", "-"), name) for name, in cursor.fetchall()]
+
+def _tables_for_range(cursor, table, since, until):
+    # Without a range only the hot partition is read
+    if since is None and until is None:
+        return [table]
+    tables = [table]
+    for month, name in _partitions(cursor, table):
+        start, end = month_bounds(month)
+        if (until is None or start < until) and (since is None or end > since):
+            tables.append(name)
+    return tables
+
+def _select_range(cursor, table, columns, since, until):
+    # Rows of the partitions overlapping [since, until), newest first
+    conditions, params = [], []
+    if since is not None:
+        conditions.append("timestamp >= ?")
+        params.append(since)
+    if until is not None:
+        conditions.append("timestamp < ?")
+        params.append(until)
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    tables = _tables_for_range(cursor, table, since, until)
+    query = " UNION ALL ".join(f"SELECT {columns} FROM {name}{where}" for name in tables)
+    cursor.execute(f"{query} ORDER BY timestamp DESC;", params * len(tables))
+    return cursor.fetchall()
+
+@timed_db
+def get_partitions(table):
+    """
+    List the monthly partitions of a table.
+
+    Args:
+        table (str): A name from PARTITIONED_TABLES.
+
+    Returns:
+        list of tuple: (month as 'YYYY-MM', table name), oldest first.
+    """
+    try:
+        with sqlite3.connect(DB_PATH) as conn:
+            return _partitions(conn.cursor(), table)
+    except sqlite3.Error as e:
+        raise Exception(f"Database error: {e}")
+
+@timed_db
+def roll_over_partitions(table, before):
+    """
+    Move the rows of the hot partition older than a time into their monthly partitions.
+
+    Args:
+        table (str): A name from PARTITIONED_TABLES.
+        before (str): Timestamp in the stored format, 'YYYY-MM-DD HH:MM:SS' (UTC).
+
+    Returns:
+        int: The number of rows moved.
+    """
+    conn = sqlite3.connect(DB_PATH, isolation_level=None)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE;")
+        columns = ", ".join(row[1] for row in cursor.execute(f"PRAGMA table_info({table});").fetchall())
+        cursor.execute(f'''
+            SELECT DISTINCT substr(timestamp, 1, 7) FROM {table}
+            WHERE timestamp < ? AND timestamp GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-*';
+        ''', (before,))
+        moved = 0
+        for month, in cursor.fetchall():
+            name = partition_name(table, month)
+            _TABLE_CREATORS[table](cursor, name)
+            start, end = month_bounds(month)
+            end = min(end, before)
+            cursor.execute(f'''
+                INSERT INTO {name} ({columns})
+                SELECT {columns} FROM {table} WHERE timestamp >= ? AND timestamp < ?;
+            ''', (start, end))
+            cursor.execute(f"DELETE FROM {table} WHERE timestamp >= ? AND timestamp < ?;", (start, end))
+            moved += cursor.rowcount
+        if moved:
+            record_change(cursor, table)
+        cursor.execute("COMMIT;")
+    except sqlite3.Error as e:
+        if conn.in_transaction:
+            conn.rollback()
+        raise Exception(f"Database error: {e}")
+    finally:
+        conn.close()
+    if moved:
+        # The hot partition shrank, dashboards reload instead of applying deltas
+        bump_version(table)
+        bus.publish("resync", {"topics": [RESOURCE_TOPICS[table]]})
+    return moved
+
+@timed_db
+def read_partition(name):
+    """
+    Read every row of a partition, e.g. to archive it. Events are decoded.
+
+    Args:
+        name (str): The partition name.
+
+    Returns:
+        tuple: (list of column names, list of row tuples ordered by timestamp).
+    """
+    try:
+        with sqlite3.connect(DB_PATH) as conn:
+            cursor = conn.cursor()
+            if table_for_partition(name) == "events":
+                cursor.execute(f"SELECT {', '.join(STORED_EVENT_COLUMNS)} FROM {name} ORDER BY timestamp;")
+                # Archives hold names and IP addresses as text
+                return EVENT_COLUMNS, [_decode_event(cursor, row) for row in cursor.fetchall()]
+            cursor.execute(f"SELECT * FROM {name} ORDER BY timestamp;")
+            return [column[0] for column in cursor.description], cursor.fetchall()
+    except sqlite3.Error as e:
+        raise Exception(f"Database error: {e}")
+
+@timed_db
+def drop_partition(table, name):
+    """
+    Delete a partition.
+
+    Args:
+        table (str): A name from PARTITIONED_TABLES.
+        name (str): The partition name.
+    """
+    if name not in {partition for _, partition in get_partitions(table)}:
+        raise ValueError(f"{name} is not a partition of {table}")
+    try:
+        with sqlite3.connect(DB_PATH) as conn:
+            conn.execute(f"DROP TABLE {name};")
+            record_change(conn.cursor(), table)
+            conn.commit()
+    except sqlite3.Error as e:
+        raise Exception(f"Database error: {e}")
+    bump_version(table)
+
+def migrate_marks_to_reputation(cursor):
+    """
+    Move '<ip> marks' and '<ip> level' rows from the settings table into the
+    reputation table. Migrated marks start decaying from the time of migration.
+    Other settings ending in those words (e.g. 'Log Level') are left alone.
+
+    Args:
+        cursor (sqlite3.Cursor): The cursor to execute on.
+    """
+    # GLOB is case-sensitive, unlike LIKE
+    rows = cursor.execute(
+        "SELECT key, value FROM settings WHERE key GLOB '* marks' OR key GLOB '* level';"
+    ).fetchall()
+    entries = {}
+    migrated = []
+    for key, value in rows:
+        source_ip, kind = key.rsplit(' ', 1)
+        try:
+            ipaddress.ip_address(source_ip)
+        except ValueError:
+            continue
+        entries.setdefault(source_ip, {"marks": 0.0, "level": 0})[kind] = value
+        migrated.append((key,))
+    if not migrated:
+        return
+    now = time.time()
+    for source_ip, entry in entries.items():
+        cursor.execute('''
+            INSERT OR IGNORE INTO reputation (source_ip, score, last_update, level)
+            VALUES (?, ?, ?, ?);
+        ''', (source_ip, float(entry["marks"]), now, int(entry["level"])))
+    cursor.executemany("DELETE FROM settings WHERE key = ?;", migrated)
+
+def add_missing_columns(cursor, table, columns):
+    """
+    Add columns to an existing table if they are not already present.
+
+    Args:
+        cursor (sqlite3.Cursor): The cursor to execute on.
+        table (str): The table name.
+        columns (dict): Column names mapped to their SQL type definitions.
+    """
+    existing = {row[1] for row in cursor.execute(f"PRAGMA table_info({table});")}
+    for name, definition in columns.items():
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition};")
+
+@timed_db
 def delete_event_entry(source_ip):
     try:
         with sqlite3.connect(DB_PATH) as conn:
             cursor = conn.cursor()
-            cursor.execute("DELETE FROM events WHERE source_ip = ?", (source_ip,))
+            for name in ["events"] + [partition for _, partition in _partitions(cursor, "events")]:
+                cursor.execute(f"DELETE FROM {name} WHERE source_ip = ?", (pack_ip(source_ip),))
+            record_change(cursor, "events")
             conn.commit()
     except sqlite3.Error as e:
         raise Exception(f"Database error: {e}")
+    bump_version("events")
+    bus.publish("anomalies", {"removed_source_ip": source_ip})
 
+@timed_db
 def record_action(action_type, reason, source_ip, admin_or_automated):
     """
     Record an action taken to the actions table.
@@ -88,13 +760,31 @@ def record_action(action_type, reason, source_ip, admin_or_automated):
                 source_ip,
                 admin_or_automated
             ))
+            record_change(cursor, "actions")
             conn.commit()
     except sqlite3.Error as e:
         raise Exception(f"Database error: {e}")
-    
-def get_actions():
+    bump_version("actions")
+    logger.debug("Recorded action %s for %s", action_type, source_ip)
+    bus.publish("actions", {"added": [{
+        "timestamp": _db_timestamp(),
+        "action_type": action_type,
+        "reason": reason,
+        "source_ip": source_ip,
+        "admin_or_automated": admin_or_automated
+    }]})
+
+@timed_db
+def get_actions(since=None, until=None):
     """
-    Retrieve all actions from the actions table.
+    Retrieve actions, newest first.
+
+    Without a time range only the recent actions in the actions table are
+    returned. With one, the monthly partitions overlapping it are read too.
+
+    Args:
+        since (str, optional): Earliest timestamp, 'YYYY-MM-DD HH:MM:SS' (UTC).
+        until (str, optional): Timestamp the actions must be older than.
 
     Returns:
         list of dict: A list of dictionaries containing action data.
@@ -102,12 +792,8 @@ def get_actions():
     try:
         with sqlite3.connect(DB_PATH) as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                SELECT timestamp, action_type, reason, source_ip, admin_or_automated
-                FROM actions
-                ORDER BY timestamp DESC;
-            ''')
-            rows = cursor.fetchall()
+            rows = _select_range(cursor, "actions", "timestamp, action_type, reason, source_ip, admin_or_automated",
+                                 since, until)
             return [
                 {
                     "timestamp": row[0],
@@ -121,6 +807,7 @@ def get_actions():
     except sqlite3.Error as e:
         raise Exception(f"Database error: {e}")
 
+@timed_db
 def save_event(data):
     """
     Save an event received from the webhook to the database.
@@ -128,26 +815,55 @@ def save_event(data):
     Args:
         data (dict): The event data to save.
     """
+    save_events([data])
+
+@timed_db
+def save_events(events):
+    """
+    Save several events to the database in a single transaction.
+
+    Args:
+        events (list of dict): The event data to save. Coalesced events carry
+            'Count', 'FirstSeen' and 'LastSeen' in addition to the webhook fields.
+    """
+    pending = {}
     try:
         with sqlite3.connect(DB_PATH) as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO events (source, event, score, source_ip, destination_ip)
-                VALUES (?, ?, ?, ?, ?);
-            ''', (
-                data.get("Source"),
-                data.get("Event"),
-                int(data.get("Score", 0)),
-                data.get("SourceIP"),
-                data.get("DestinationIP")
-            ))
+            cursor.executemany('''
+                INSERT INTO events (source_id, event_type_id, score, source_ip, destination_ip, count, first_seen, last_seen)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?);
+            ''', _encode_events(cursor, events, pending))
+            record_change(cursor, "events")
             conn.commit()
     except sqlite3.Error as e:
         raise Exception(f"Database error: {e}")
-    
-def get_anomalies():
+    _publish_lookups(pending)
+    bump_version("events")
+    logger.debug("Saved %s event(s)", len(events))
+    timestamp = _db_timestamp()
+    bus.publish("anomalies", {"added": [
+        {
+            "timestamp": timestamp,
+            "source_ip": data.get("SourceIP"),
+            "event": data.get("Event"),
+            "score": float(data.get("Score", 0)),
+            "count": int(data.get("Count", 1))
+        }
+        for data in events
+    ]})
+
+@timed_db
+def get_anomalies(since=None, until=None):
     """
-    Retrieve recent anomalies from the events table.
+    Retrieve anomalies, newest first.
+
+    Without a time range only the recent events in the events table are
+    returned. With one, the monthly partitions overlapping it are read too.
+
+    Args:
+        since (str, optional): Earliest timestamp, 'YYYY-MM-DD HH:MM:SS' (UTC).
+        until (str, optional): Timestamp the events must be older than.
 
     Returns:
         list of dict: A list of dictionaries containing anomaly data.
@@ -155,25 +871,42 @@ def get_anomalies():
     try:
         with sqlite3.connect(DB_PATH) as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                SELECT timestamp, source_ip, event, score
-                FROM events
-                ORDER BY timestamp DESC;
-            ''')
-            rows = cursor.fetchall()
+            rows = _select_range(cursor, "events", "timestamp, source_ip, event_type_id, score, count", since, until)
             return [
                 {
                     "timestamp": row[0],
-                    "source_ip": row[1],
-                    "event": row[2],
-                    "score": row[3]
+                    "source_ip": unpack_ip(row[1]),
+                    "event": _lookup_name(cursor, "event_types", row[2]),
+                    "score": row[3],
+                    "count": row[4]
                 }
                 for row in rows
             ]
     except sqlite3.Error as e:
         raise Exception(f"Database error: {e}")
 
+@timed_db
+def get_recent_events(limit):
+    """
+    Retrieve the latest events with all their fields, e.g. for the chatbot context.
+
+    Args:
+        limit (int): Maximum number of events.
+
+    Returns:
+        list of tuple: (timestamp, source, event, score, source_ip, destination_ip, count), newest first.
+    """
+    try:
+        with sqlite3.connect(DB_PATH) as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT {', '.join(STORED_EVENT_COLUMNS)} FROM events ORDER BY timestamp DESC LIMIT ?;",
+                           (limit,))
+            rows = [_decode_event(cursor, row) for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        raise Exception(f"Database error: {e}")
+    return [(row[6], row[1], row[2], row[3], row[4], row[5], row[7]) for row in rows]
 
+@timed_db
 def save_settings(settings):
     """
     Save or update settings in the database.
@@ -190,11 +923,14 @@ def save_settings(settings):
                     VALUES (?, ?)
                     ON CONFLICT(key) DO UPDATE SET value=excluded.value;
                 ''', (key, value))
+            record_change(cursor, "settings")
             conn.commit()
     except sqlite3.Error as e:
         raise Exception(f"Database error: {e}")
+    bump_version("settings")
 
 
+@timed_db
 def get_settings():
     """
     Retrieve all settings as a dictionary from the database.
@@ -211,6 +947,7 @@ def get_settings():
     except sqlite3.Error as e:
         raise Exception(f"Database error: {e}")
 
+@timed_db
 def get_setting_value(key):
     """
     Retrieve a specific setting value by key from the database.
@@ -230,43 +967,82 @@ def get_setting_value(key):
     except sqlite3.Error as e:
         raise Exception(f"Database error: {e}")
 
+def get_cached_setting(key):
+    """
+    Retrieve a setting value, reusing it until the settings change.
+
+    Meant for values read on every controller request, such as the
+    controller IP, so they are looked up on first use instead of at import
+    and do not cost a query each time.
+
+    Args:
+        key (str): The key of the setting to retrieve.
+
+    Returns:
+        str: The value of the specified setting, or None if not found.
+    """
+    version, _ = get_version("settings")
+    cached = _setting_cache.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    value = get_setting_value(key)
+    _setting_cache[key] = (version, value)
+    return value
+
+@timed_db
 def save_flows(flows):
     """
     Save or update flows data in the database.
 
     This function first clears the existing data in the flows table
-    to ensure only current flow data is stored.
+    to ensure only current flow data is stored. The difference to the
+    previous contents is published on the 'flows' topic.
 
     Args:
         flows (list of dict): A list of dictionaries where each dictionary represents a flow.
     """
+    rows = [
+        (
+            flow['id'],
+            flow.get('source_ip', 'Unknown'),
+            flow.get('destination_ip', 'Unknown'),
+            flow.get('protocol', 'Unknown'),
+            flow.get('bandwidth', 0),
+            flow.get('flow_duration', 0),
+            flow.get('priority', 0),
+            flow.get('app_id', 'Unknown'),
+            flow.get('device_id', 'Unknown')
+        )
+        for flow in flows
+    ]
     try:
         with sqlite3.connect(DB_PATH) as conn:
             cursor = conn.cursor()
 
+            cursor.execute(f"SELECT {', '.join(FLOW_COLUMNS)} FROM flows")
+            previous = {row[0]: row for row in cursor.fetchall()}
+
             # Clear the existing flows data
             cursor.execute("DELETE FROM flows")
 
             # Insert the new flows data
-            for flow in flows:
-                cursor.execute('''
-                    INSERT INTO flows (id, source_ip, destination_ip, protocol, bandwidth, flow_duration, priority, app_id, device_id)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    flow['id'],
-                    flow.get('source_ip', 'Unknown'),
-                    flow.get('destination_ip', 'Unknown'),
-                    flow.get('protocol', 'Unknown'),
-                    flow.get('bandwidth', 0),
-                    flow.get('flow_duration', 0),
-                    flow.get('priority', 0),
-                    flow.get('app_id', 'Unknown'),
-                    flow.get('device_id', 'Unknown')
-                ))
+            cursor.executemany('''
+                INSERT INTO flows (id, source_ip, destination_ip, protocol, bandwidth, flow_duration, priority, app_id, device_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            record_change(cursor, "flows")
             conn.commit()
     except sqlite3.Error as e:
         raise Exception(f"Database error: {e}")
 
+    bump_version("flows")
+    current = {row[0]: row for row in rows}
+    upserted = [dict(zip(FLOW_COLUMNS, row)) for flow_id, row in current.items() if previous.get(flow_id) != row]
+    removed = [flow_id for flow_id in previous if flow_id not in current]
+    if upserted or removed:
+        bus.publish("flows", {"upserted": upserted, "removed": removed})
+
+@timed_db
 def get_flows():
     """
     Retrieve all flow data from the database.
@@ -298,5 +1074,593 @@ def get_flows():
             ]
     except sqlite3.Error as e:
         raise Exception(f"Database error: {e}")
-    
 
+@timed_db
+def get_reputation(source_ip):
+    """
+    Retrieve the stored reputation of a source IP.
+
+    Args:
+        source_ip (str): The source IP address.
+
+    Returns:
+        tuple: (score, last_update, action), or None if the IP has no entry.
+            action is the name of the applied action, or the level index for
+            entries saved before action names were stored.
+    """
+    try:
+        with sqlite3.connect(DB_PATH) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT score, last_update, COALESCE(action, level) FROM reputation WHERE source_ip = ?;",
+                (source_ip,)
+            )
+            return cursor.fetchone()
+    except sqlite3.Error as e:
+        raise Exception(f"Database error: {e}")
+
+@timed_db
+def save_reputation(source_ip, score, last_update, action):
+    """
+    Save or update the reputation of a source IP.
+
+    Args:
+        source_ip (str): The source IP address.
+        score (float): The marks at last_update.
+        last_update (float): Unix timestamp the score was computed at.
+        action (str): The name of the policy action currently applied, so
+            it keeps its meaning when the policy's levels change.
+    """
+    try:
+        with sqlite3.connect(DB_PATH) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO reputation (source_ip, score, last_update, action)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(source_ip) DO UPDATE SET
+                    score=excluded.score, last_update=excluded.last_update, action=excluded.action;
+            ''', (source_ip, score, last_update, action))
+            conn.commit()
+    except sqlite3.Error as e:
+        raise Exception(f"Database error: {e}")
+
+@timed_db
+def save_reputations(entries):
+    """
+    Save or update the reputation of several source IPs in one transaction.
+
+    Args:
+        entries (list of tuple): (source_ip, score, last_update, action) rows.
+    """
+    try:
+        with sqlite3.connect(DB_PATH) as conn:
+            cursor = conn.cursor()
+            cursor.executemany('''
+                INSERT INTO reputation (source_ip, score, last_update, action)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(source_ip) DO UPDATE SET
+                    score=excluded.score, last_update=excluded.last_update, action=excluded.action;
+            ''', entries)
+            conn.commit()
+    except sqlite3.Error as e:
+        raise Exception(f"Database error: {e}")
+
+@timed_db
+def get_reputations(source_ips=None):
+    """
+    Retrieve the stored reputation of tracked source IPs.
+
+    Args:
+        source_ips (list of str, optional): Only return these IPs. All IPs if omitted.
+
+    Returns:
+        list of tuple: (source_ip, score, last_update, action) rows, action
+            as returned by get_reputation.
+    """
+    try:
+        with sqlite3.connect(DB_PATH) as conn:
+            cursor = conn.cursor()
+            if source_ips is None:
+                cursor.execute("SELECT source_ip, score, last_update, COALESCE(action, level) FROM reputation;")
+                return cursor.fetchall()
+            rows = []
+            source_ips = list(source_ips)
+            # Stay well below SQLite's bound parameter limit
+            for start in range(0, len(source_ips), 500):
+                chunk = source_ips[start:start + 500]
+                placeholders = ", ".join("?" for _ in chunk)
+                cursor.execute(
+                    f"SELECT source_ip, score, last_update, COALESCE(action, level) FROM reputation WHERE source_ip IN ({placeholders});",
+                    chunk
+                )
+                rows.extend(cursor.fetchall())
+            return rows
+    except sqlite3.Error as e:
+        raise Exception(f"Database error: {e}")
+
+@timed_db
+def delete_reputation(source_ip):
+    """
+    Remove the reputation entry of a source IP.
+
+    Args:
+        source_ip (str): The source IP address.
+    """
+    try:
+        with sqlite3.connect(DB_PATH) as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM reputation WHERE source_ip = ?;", (source_ip,))
+            conn.commit()
+    except sqlite3.Error as e:
+        raise Exception(f"Database error: {e}")
+
+@timed_db
+def save_mitigations(entries):
+    """
+    Record mitigations installed on the controller for source IPs.
+
+    Args:
+        entries (list of tuple): (source_ip, kind, action_type, handle) rows,
+            where kind names the remover and handle is a dict identifying
+            what to remove on the controller.
+    """
+    if not entries:
+        return
+    try:
+        with sqlite3.connect(DB_PATH) as conn:
+            cursor = conn.cursor()
+            cursor.executemany('''
+                INSERT INTO mitigations (source_ip, kind, action_type, handle)
+                VALUES (?, ?, ?, ?);
+            ''', [
+                (source_ip, kind, action_type, json.dumps(handle))
+                for source_ip, kind, action_type, handle in entries
+            ])
+            conn.commit()
+    except sqlite3.Error as e:
+        raise Exception(f"Database error: {e}")
+
+@timed_db
+def get_mitigations(source_ip):
+    """
+    Retrieve the mitigations recorded for a source IP.
+
+    Args:
+        source_ip (str): The source IP address.
+
+    Returns:
+        list of tuple: (mitigation_id, kind, action_type, handle) rows, oldest
+            first, with handle decoded.
+    """
+    try:
+        with sqlite3.connect(DB_PATH) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT mitigation_id, kind, action_type, handle FROM mitigations
+                WHERE source_ip = ? ORDER BY mitigation_id;
+            ''', (source_ip,))
+            rows = cursor.fetchall()
+    except sqlite3.Error as e:
+        raise Exception(f"Database error: {e}")
+    return [(mitigation_id, kind, action_type, json.loads(handle)) for mitigation_id, kind, action_type, handle in rows]
+
+@timed_db
+def delete_mitigations(mitigation_ids):
+    """
+    Forget mitigations that were removed from the controller.
+
+    Args:
+        mitigation_ids (list of int): Ids returned by get_mitigations.
+    """
+    if not mitigation_ids:
+        return
+    try:
+        with sqlite3.connect(DB_PATH) as conn:
+            cursor = conn.cursor()
+            cursor.executemany("DELETE FROM mitigations WHERE mitigation_id = ?;",
+                               [(mitigation_id,) for mitigation_id in mitigation_ids])
+            conn.commit()
+    except sqlite3.Error as e:
+        raise Exception(f"Database error: {e}")
+
+@timed_db
+def record_actions(entries):
+    """
+    Record several actions to the actions table in one transaction.
+
+    Args:
+        entries (list of tuple): (action_type, reason, source_ip, admin_or_automated) rows.
+    """
+    if not entries:
+        return
+    try:
+        with sqlite3.connect(DB_PATH) as conn:
+            cursor = conn.cursor()
+            cursor.executemany('''
+                INSERT INTO actions (action_type, reason, source_ip, admin_or_automated)
+                VALUES (?, ?, ?, ?);
+            ''', entries)
+            record_change(cursor, "actions")
+            conn.commit()
+    except sqlite3.Error as e:
+        raise Exception(f"Database error: {e}")
+    bump_version("actions")
+    timestamp = _db_timestamp()
+    bus.publish("actions", {"added": [
+        {
+            "timestamp": timestamp,
+            "action_type": action_type,
+            "reason": reason,
+            "source_ip": source_ip,
+            "admin_or_automated": admin_or_automated
+        }
+        for action_type, reason, source_ip, admin_or_automated in entries
+    ]})
+
+@timed_db
+def save_expirations(entries):
+    """
+    Schedule mitigations for removal.
+
+    Args:
+        entries (list of tuple): (kind, action_type, source_ip, handle, expires_at, attempts)
+            rows, where handle is a dict identifying what to remove on the controller.
+    """
+    if not entries:
+        return
+    try:
+        with sqlite3.connect(DB_PATH) as conn:
+            cursor = conn.cursor()
+            cursor.executemany('''
+                INSERT INTO expirations (kind, action_type, source_ip, handle, expires_at, attempts)
+                VALUES (?, ?, ?, ?, ?, ?);
+            ''', [
+                (kind, action_type, source_ip, json.dumps(handle), expires_at, attempts)
+                for kind, action_type, source_ip, handle, expires_at, attempts in entries
+            ])
+            conn.commit()
+    except sqlite3.Error as e:
+        raise Exception(f"Database error: {e}")
+
+@timed_db
+def get_next_expiration(lease=300):
+    """
+    Retrieve the time the next scheduled mitigation expires.
+
+    Args:
+        lease (float): Seconds a claim lasts, see claim_expirations.
+
+    Returns:
+        float: Unix timestamp, or None if nothing is scheduled. For a claimed
+            expiration it is the time its lease runs out.
+    """
+    try:
+        with sqlite3.connect(DB_PATH) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT MIN(CASE WHEN claimed_at IS NULL THEN expires_at ELSE claimed_at + ? END) FROM expirations;",
+                (lease,)
+            )
+            return cursor.fetchone()[0]
+    except sqlite3.Error as e:
+        raise Exception(f"Database error: {e}")
+
+@timed_db
+def claim_expirations(now, limit=500, lease=300):
+    """
+    Lease mitigations that expired by now.
+
+    Rows are selected and marked as claimed in one write transaction, so
+    when several server processes share the database each expiration is
+    claimed once. They stay in the table until complete_expirations is
+    called after the removal; if the claiming process dies first, they can
+    be claimed again once the lease runs out.
+
+    Args:
+        now (float): Unix timestamp.
+        limit (int): Maximum number of rows to claim.
+        lease (float): Seconds before an unfinished claim can be taken over.
+
+    Returns:
+        list of tuple: (expiration_id, kind, action_type, source_ip, handle,
+            expires_at, attempts) rows, earliest first, with handle decoded.
+    """
+    conn = sqlite3.connect(DB_PATH, isolation_level=None)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE;")
+        cursor.execute('''
+            SELECT expiration_id, kind, action_type, source_ip, handle, expires_at, attempts
+            FROM expirations
+            WHERE expires_at <= ? AND (claimed_at IS NULL OR claimed_at <= ?)
+            ORDER BY expires_at
+            LIMIT ?;
+        ''', (now, now - lease, limit))
+        rows = cursor.fetchall()
+        cursor.executemany("UPDATE expirations SET claimed_at = ? WHERE expiration_id = ?;",
+                           [(now, row[0]) for row in rows])
+        cursor.execute("COMMIT;")
+    except sqlite3.Error as e:
+        if conn.in_transaction:
+            conn.rollback()
+        raise Exception(f"Database error: {e}")
+    finally:
+        conn.close()
+    return [
+        (expiration_id, kind, action_type, source_ip, json.loads(handle), expires_at, attempts)
+        for expiration_id, kind, action_type, source_ip, handle, expires_at, attempts in rows
+    ]
+
+@timed_db
+def complete_expirations(finished, retries):
+    """
+    Settle claimed expirations once their removal was attempted.
+
+    Args:
+        finished (list of int): Ids of the expirations removed or given up on.
+        retries (list of tuple): (expiration_id, expires_at, attempts) of those
+            to try again, released from their claim.
+    """
+    if not finished and not retries:
+        return
+    try:
+        with sqlite3.connect(DB_PATH) as conn:
+            cursor = conn.cursor()
+            cursor.executemany("DELETE FROM expirations WHERE expiration_id = ?;",
+                               [(expiration_id,) for expiration_id in finished])
+            cursor.executemany('''
+                UPDATE expirations SET expires_at = ?, attempts = ?, claimed_at = NULL
+                WHERE expiration_id = ?;
+            ''', [(expires_at, attempts, expiration_id) for expiration_id, expires_at, attempts in retries])
+            conn.commit()
+    except sqlite3.Error as e:
+        raise Exception(f"Database error: {e}")
+
+@timed_db
+def save_honeypot_redirect(source_ip, honeypot_ip, device_id, port, honeypot_device_id, honeypot_port):
+    """
+    Save or update the redirect of a source IP to a honeypot.
+
+    Args:
+        source_ip (str): The redirected source IP address.
+        honeypot_ip (str): The honeypot IP address.
+        device_id (str): The device the source host is attached to.
+        port (str): The port the source host is attached to.
+        honeypot_device_id (str): The device the honeypot is attached to.
+        honeypot_port (str): The port the honeypot is attached to.
+    """
+    try:
+        with sqlite3.connect(DB_PATH) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO honeypot_redirects (source_ip, honeypot_ip, device_id, port, honeypot_device_id, honeypot_port)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(source_ip) DO UPDATE SET
+                    honeypot_ip=excluded.honeypot_ip, device_id=excluded.device_id, port=excluded.port,
+                    honeypot_device_id=excluded.honeypot_device_id, honeypot_port=excluded.honeypot_port;
+            ''', (source_ip, honeypot_ip, device_id, str(port), honeypot_device_id, str(honeypot_port)))
+            conn.commit()
+    except sqlite3.Error as e:
+        raise Exception(f"Database error: {e}")
+
+@timed_db
+def delete_honeypot_redirects(source_ips):
+    """
+    Remove the redirects of several source IPs.
+
+    Args:
+        source_ips (list of str): The source IP addresses.
+
+    Returns:
+        dict: The honeypot IP of each source IP that was redirected.
+    """
+    source_ips = list(source_ips)
+    honeypots = {}
+    try:
+        with sqlite3.connect(DB_PATH) as conn:
+            cursor = conn.cursor()
+            # Stay well below SQLite's bound parameter limit
+            for start in range(0, len(source_ips), 500):
+                chunk = source_ips[start:start + 500]
+                placeholders = ", ".join("?" for _ in chunk)
+                cursor.execute(
+                    f"SELECT source_ip, honeypot_ip FROM honeypot_redirects WHERE source_ip IN ({placeholders});",
+                    chunk
+                )
+                honeypots.update(cursor.fetchall())
+                cursor.execute(f"DELETE FROM honeypot_redirects WHERE source_ip IN ({placeholders});", chunk)
+            conn.commit()
+    except sqlite3.Error as e:
+        raise Exception(f"Database error: {e}")
+    return honeypots
+
+@timed_db
+def get_honeypot_redirects(honeypot_ip):
+    """
+    Retrieve the redirects to a honeypot.
+
+    Args:
+        honeypot_ip (str): The honeypot IP address.
+
+    Returns:
+        list of tuple: (source_ip, device_id, port, honeypot_device_id, honeypot_port) rows.
+    """
+    try:
+        with sqlite3.connect(DB_PATH) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT source_ip, device_id, port, honeypot_device_id, honeypot_port
+                FROM honeypot_redirects
+                WHERE honeypot_ip = ?
+                ORDER BY source_ip;
+            ''', (honeypot_ip,))
+            return cursor.fetchall()
+    except sqlite3.Error as e:
+        raise Exception(f"Database error: {e}")
+
+@timed_db
+def save_job(job_id, kind, params, created_at):
+    """
+    Record a newly queued job.
+
+    Args:
+        job_id (str): The job id.
+        kind (str): The action it runs, e.g. 'block'.
+        params (dict): The action's parameters.
+        created_at (float): Unix timestamp it was queued at.
+    """
+    try:
+        with sqlite3.connect(DB_PATH) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO jobs (job_id, kind, params, status, created_at)
+                VALUES (?, ?, ?, 'queued', ?);
+            ''', (job_id, kind, json.dumps(params), created_at))
+            conn.commit()
+    except sqlite3.Error as e:
+        raise Exception(f"Database error: {e}")
+
+@timed_db
+def update_job(job_id, status, error=None, started_at=None, finished_at=None):
+    """
+    Update the status of a job. Timestamps that are not given are kept.
+
+    Args:
+        job_id (str): The job id.
+        status (str): 'running', 'succeeded' or 'failed'.
+        error (str, optional): Why the job failed.
+        started_at (float, optional): Unix timestamp it started at.
+        finished_at (float, optional): Unix timestamp it finished at.
+    """
+    try:
+        with sqlite3.connect(DB_PATH) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE jobs SET status = ?, error = ?,
+                    started_at = COALESCE(?, started_at), finished_at = COALESCE(?, finished_at)
+                WHERE job_id = ?;
+            ''', (status, error, started_at, finished_at, job_id))
+            conn.commit()
+    except sqlite3.Error as e:
+        raise Exception(f"Database error: {e}")
+
+@timed_db
+def get_jobs(job_ids=None, limit=100):
+    """
+    Retrieve jobs by id, or the most recent ones.
+
+    Args:
+        job_ids (list of str, optional): The job ids. The latest jobs if omitted.
+        limit (int): Maximum number of recent jobs returned without ids.
+
+    Returns:
+        list of dict: The jobs found, with params decoded.
+    """
+    try:
+        with sqlite3.connect(DB_PATH) as conn:
+            cursor = conn.cursor()
+            columns = ", ".join(JOB_COLUMNS)
+            if job_ids is None:
+                cursor.execute(f"SELECT {columns} FROM jobs ORDER BY created_at DESC LIMIT ?;", (limit,))
+                rows = cursor.fetchall()
+            else:
+                rows = []
+                job_ids = list(job_ids)
+                # Stay well below SQLite's bound parameter limit
+                for start in range(0, len(job_ids), 500):
+                    chunk = job_ids[start:start + 500]
+                    placeholders = ", ".join("?" for _ in chunk)
+                    cursor.execute(f"SELECT {columns} FROM jobs WHERE job_id IN ({placeholders});", chunk)
+                    rows.extend(cursor.fetchall())
+    except sqlite3.Error as e:
+        raise Exception(f"Database error: {e}")
+    jobs = [dict(zip(JOB_COLUMNS, row)) for row in rows]
+    for job in jobs:
+        job["params"] = json.loads(job["params"])
+    return jobs
+
+@timed_db
+def delete_jobs_before(finished_before):
+    """
+    Remove jobs that finished before a time.
+
+    Args:
+        finished_before (float): Unix timestamp.
+    """
+    try:
+        with sqlite3.connect(DB_PATH) as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM jobs WHERE finished_at < ?;", (finished_before,))
+            conn.commit()
+    except sqlite3.Error as e:
+        raise Exception(f"Database error: {e}")
+
+@timed_db
+def save_suppression(network, reason=None, expires_at=None):
+    """
+    Add or replace a suppression, dropping suppressions that have expired.
+
+    Args:
+        network (str): An IP address or CIDR network.
+        reason (str, optional): Why its alerts are suppressed.
+        expires_at (float, optional): Unix timestamp it ends at, never if omitted.
+    """
+    now = time.time()
+    try:
+        with sqlite3.connect(DB_PATH) as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM suppressions WHERE expires_at <= ?;", (now,))
+            cursor.execute('''
+                INSERT OR REPLACE INTO suppressions (network, reason, created_at, expires_at)
+                VALUES (?, ?, ?, ?);
+            ''', (network, reason, now, expires_at))
+            record_change(cursor, "suppressions")
+            conn.commit()
+    except sqlite3.Error as e:
+        raise Exception(f"Database error: {e}")
+    bump_version("suppressions")
+
+@timed_db
+def delete_suppression(network):
+    """
+    Remove a suppression.
+
+    Args:
+        network (str): The IP address or CIDR network it was saved with.
+
+    Returns:
+        bool: True if it existed.
+    """
+    try:
+        with sqlite3.connect(DB_PATH) as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM suppressions WHERE network = ?;", (network,))
+            deleted = cursor.rowcount > 0
+            record_change(cursor, "suppressions")
+            conn.commit()
+    except sqlite3.Error as e:
+        raise Exception(f"Database error: {e}")
+    bump_version("suppressions")
+    return deleted
+
+@timed_db
+def get_suppressions():
+    """
+    Retrieve the suppressions that have not expired.
+
+    Returns:
+        list of dict: The suppressions, oldest first.
+    """
+    try:
+        with sqlite3.connect(DB_PATH) as conn:
+            cursor = conn.cursor()
+            columns = ", ".join(SUPPRESSION_COLUMNS)
+            cursor.execute(f'''
+                SELECT {columns} FROM suppressions
+                WHERE expires_at IS NULL OR expires_at > ?
+                ORDER BY created_at;
+            ''', (time.time(),))
+            rows = cursor.fetchall()
+    except sqlite3.Error as e:
+        raise Exception(f"Database error: {e}")
+    return [dict(zip(SUPPRESSION_COLUMNS, row)) for row in rows]
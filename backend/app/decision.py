@@ -1,55 +1,247 @@
-from database import save_settings, get_setting_value
-from controller_actions import redirect_traffic_full, block_ip, rate_limit_for_host, redirect_to_intermediate_ovs
-
-# Confidence rates for different data sources
-CONFIDENCE_RATES = {
-    "Netflow": 0.2,
-    "AD-logs": 0.3,
-    "Honeypot": 0.8,
-    "dns-logs": 0.25,
-    "EDR": 0.7,
-    "IDS": 0.6
-}
-
-# Detection mode thresholds
-DETECTION_MODES = {
-    "strict": 0.8,
-    "balanced": 0.5,
-    "loose": 0.2
-}
-
-def get_or_initialize_marks(sourceip):
-    """
-    Retrieve marks from the database or initialize them if not present.
+import errno
+import logging
+import threading
+import time
+import zlib
+from contextlib import ExitStack, contextmanager
+import numpy as np
+from database import DB_PATH, get_setting_value, get_reputation, save_reputation, save_reputations, get_reputations, delete_reputation
+from policy import get_policy
+from metrics import timed, EVENT_BATCH_SECONDS, EVENTS_PROCESSED, DECISIONS
+from log_setup import new_correlation_id
+from controller_actions import (
+    redirect_traffic_full, remove_redirect, block_ip, unblock_ip, rate_limit_for_host, redirect_to_intermediate_ovs,
+    track_mitigations, withdraw_mitigations
+)
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, where the backend runs as a single process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Marks lose half their value after this many seconds unless the
+# "Marks Half Life" setting says otherwise
+DEFAULT_HALF_LIFE = 24 * 60 * 60
+
+# Entries whose decayed marks fall below this are dropped by the sweeper
+EVICTION_MARKS = 0.5
+
+# Seconds between sweeper runs
+SWEEP_INTERVAL = 60
+
+_sweeper_stop = threading.Event()
+
+# Source IPs are spread over a fixed set of stripes so concurrent requests
+# for the same attacker, in this or another server process, cannot both see
+# the old level and trigger the same mitigation twice, or overwrite each
+# other's marks. The stripes are never created or evicted per IP, so no
+# thread can end up holding a lock another thread has replaced.
+IP_LOCK_STRIPES = 256
+
+# Shared by the server processes, one byte is locked per stripe
+IP_LOCK_PATH = DB_PATH + ".decisions.lock"
+
+_ip_locks = [threading.Lock() for _ in range(IP_LOCK_STRIPES)]
+
+
+class ProcessStripes:
+    """
+    Exclusive locks on single bytes of a file, one byte per stripe.
+
+    POSIX record locks belong to the process, so they only keep other
+    processes out. Threads of the same process are kept apart by _ip_locks,
+    which are taken first.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.handle = None
+        self.lock = threading.Lock()
+
+    def _fileno(self):
+        with self.lock:
+            # Closing any descriptor of the file would drop every lock this
+            # process holds on it, so one handle stays open
+            if self.handle is None:
+                self.handle = open(self.path, "ab")
+            return self.handle.fileno()
+
+    def acquire(self, stripe):
+        if fcntl is None:
+            return
+        fileno = self._fileno()
+        while True:
+            try:
+                fcntl.lockf(fileno, fcntl.LOCK_EX, 1, stripe)
+                return
+            except OSError as e:
+                # The kernel tracks waits per process, not per thread, so two
+                # processes whose threads wait on different stripes can look
+                # deadlocked although the stripes are taken in order
+                if e.errno != errno.EDEADLK:
+                    raise
+                time.sleep(0.001)
+
+    def release(self, stripe):
+        if fcntl is None:
+            return
+        fcntl.lockf(self._fileno(), fcntl.LOCK_UN, 1, stripe)
+
+
+_process_stripes = ProcessStripes(IP_LOCK_PATH)
+
+
+def _stripe_of(sourceip):
+    # Stable across processes, unlike hash() of a str
+    return zlib.crc32(sourceip.encode()) % IP_LOCK_STRIPES
+
+
+@contextmanager
+def _ip_lock(sourceips):
+    # Several IPs can share a stripe, each stripe is taken once and in index
+    # order so overlapping batches cannot deadlock
+    with ExitStack() as stack:
+        for stripe in sorted({_stripe_of(sourceip) for sourceip in sourceips}):
+            stack.enter_context(_ip_locks[stripe])
+            _process_stripes.acquire(stripe)
+            stack.callback(_process_stripes.release, stripe)
+        yield
+
+
+def get_half_life():
+    """
+    Retrieve the marks half-life from the database.
+
+    Returns:
+        float: Seconds after which marks have decayed to half, or 0.0 to disable decay.
+    """
+    half_life = get_setting_value("Marks Half Life")
+    try:
+        return max(float(half_life), 0.0) if half_life else DEFAULT_HALF_LIFE
+    except ValueError:
+        return DEFAULT_HALF_LIFE
+
+
+def decay_marks(marks, last_update, now, half_life):
+    """
+    Apply exponential decay to marks stored at last_update.
 
     Args:
-        sourceip (str): The source IP address.
+        marks (float): The stored marks.
+        last_update (float): Unix timestamp the marks were stored at.
+        now (float): Unix timestamp to compute the marks for.
+        half_life (float): Half-life in seconds, 0 disables decay.
 
     Returns:
-        float: The marks associated with the source IP, initialized to 0.0 if not found.
+        float: The decayed marks.
     """
-    key = f"{sourceip} marks"
-    marks = get_setting_value(key)
-    if marks:
-        # If marks exist, return as a float
-        return float(marks)
-    else:
-        # If marks don't exist, initialize with 0.0
-        save_settings({key: "0.0"})
-        return 0.0
+    if half_life <= 0 or now <= last_update:
+        return marks
+    return marks * 0.5 ** ((now - last_update) / half_life)
 
 
+def get_marks(sourceip, now=None, half_life=None):
+    """
+    Retrieve the current (decayed) marks and mitigation level of a source IP.
 
+    Args:
+        sourceip (str): The source IP address.
+        now (float, optional): Unix timestamp to compute the marks for.
+        half_life (float, optional): Half-life to use instead of the stored setting.
 
-def save_marks(sourceip, marks):
+    Returns:
+        tuple: (marks, level), (0.0, 0) if the IP has no entry. The level is
+            -1 if the current policy no longer has the applied action.
     """
-    Save marks to the database.
+    entry = get_reputation(sourceip)
+    if not entry:
+        return 0.0, 0
+    score, last_update, action = entry
+    now = time.time() if now is None else now
+    half_life = get_half_life() if half_life is None else half_life
+    return decay_marks(score, last_update, now, half_life), get_policy().level_of(action)
+
+
+def save_marks(sourceip, marks, level, now=None):
+    """
+    Save marks and the applied mitigation level to the database.
 
     Args:
         sourceip (str): The source IP address.
         marks (float): The marks to save.
+        level (int): Index into the policy's actions.
+        now (float, optional): Unix timestamp the marks were computed at.
+    """
+    save_reputation(sourceip, marks, time.time() if now is None else now, get_policy().actions[level])
+
+
+def level_for_marks(marks):
+    """
+    Map a marks value to the mitigation level it calls for.
+
+    Args:
+        marks (float): The marks of a source IP.
+
+    Returns:
+        int: Index into the policy's actions.
+    """
+    return get_policy().level_for(marks)
+
+
+def apply_mitigation(source_ip, current_level, new_level, honeypot_ip, policy=None):
     """
-    save_settings({f"{sourceip} marks": str(marks)})
+    Move a source IP from one mitigation level to another.
+
+    Only the controller calls needed for the transition are made, so an
+    attacker that keeps sending events at the same level costs nothing.
+    The rules installed for the current level are withdrawn on every
+    transition, so levels never stack. Escalating installs the new level's
+    action; de-escalating installs nothing unless the policy's
+    'reapply_on_deescalation' parameter is set.
+
+    Args:
+        source_ip (str): The source IP address.
+        current_level (int): The level currently applied.
+        new_level (int): The level to apply.
+        honeypot_ip (str): The honeypot IP used for redirects.
+        policy (DecisionPolicy, optional): The policy the levels refer to.
+
+    Returns:
+        str: The name of the action taken.
+    """
+    policy = policy or get_policy()
+    parameters = policy.parameters
+
+    # A level of -1 is an action the policy no longer has, its rules are withdrawn too
+    if current_level != 0 and not withdraw_mitigations(source_ip, admin_or_automated="Automated"):
+        # Mitigations installed before they were recorded are found by their IP
+        current_action = policy.actions[current_level] if current_level > 0 else None
+        if current_action == "Block":
+            unblock_ip(src_ip=f"{source_ip}/32", admin_or_automated="Automated")
+        elif current_action == "Redirect":
+            remove_redirect(source_ip, admin_or_automated="Automated")
+
+    if new_level < current_level and not parameters.get("reapply_on_deescalation"):
+        return "Withdraw"
+
+    action = policy.actions[new_level]
+    with track_mitigations(source_ip):
+        if action == "Block":
+            block_ip(src_ip=f"{source_ip}/32", admin_or_automated="Automated")
+        elif action == "Redirect":
+            redirect_traffic_full(source_ip, honeypot_ip, admin_or_automated="Automated")
+        elif action == "Rate Limit":
+            rate_limit_for_host(
+                source_ip,
+                rate_limit_bps=parameters["rate_limit_bps"],
+                admin_or_automated="Automated"  # Mark the action as automated
+            )
+        elif action == "Intermediate Redirect":
+            redirect_to_intermediate_ovs(source_ip, ovs_id=parameters["intermediate_ovs"], admin_or_automated="Automated")
+    return action
 
 
 def process_event(event):
@@ -62,52 +254,155 @@ def process_event(event):
     Returns:
         list: A list of actions taken (for informational purposes).
     """
-    source = event.get("Source")
-    score = float(event.get("Score", 0))
-    source_ip = event.get("SourceIP")
+    return list(process_events([event]).values())
+
 
+@timed(EVENT_BATCH_SECONDS)
+def process_events(events):
+    """
+    Score a batch of events and take at most one action per source IP.
+
+    Marks increases are computed for the whole batch with array operations,
+    summed per source IP, added to the decayed marks and bucketed into levels.
+    Reputations are read and written once per batch.
+
+    Args:
+        events (list of dict): Events containing 'Source', 'Score' and 'SourceIP'.
+
+    Returns:
+        dict: The action taken for each source IP (for informational purposes).
+    """
     # Retrieve detection mode and honeypot IP from database
     detection_mode = get_setting_value("Mode")
     honeypot_ip = get_setting_value("Honeypot IP Address")
     if not detection_mode or not honeypot_ip:
-        print("Error: Detection mode or honeypot IP not set in database.")
-        return []
-
-    if source not in CONFIDENCE_RATES or detection_mode not in DETECTION_MODES:
-        print("Invalid source or detection mode.")
-        return []
-
-    confidence_rate = CONFIDENCE_RATES[source]
-    detection_multiplier = DETECTION_MODES[detection_mode]
-
-    # Calculate marks increase
-    marks_increase = score * confidence_rate * detection_multiplier
-
-    # Update marks for SourceIP
-    marks = get_or_initialize_marks(source_ip)
-    updated_marks = marks + marks_increase
-    save_marks(source_ip, updated_marks)
-
-    actions = []  # List to collect actions for informational purposes
-
-    # Take actions based on marks thresholds
-    if updated_marks >= 100:
-        block_ip(src_ip=f"{source_ip}/32", admin_or_automated="Automated")
-        actions.append("Block")
-    elif updated_marks >= 60:
-        redirect_traffic_full(source_ip, honeypot_ip, admin_or_automated="Automated")
-        actions.append("Redirect")
-    elif updated_marks >= 40:
-        rate_limit_for_host(
-            source_ip,
-            rate_limit_bps=50,
-            admin_or_automated="Automated"  # Mark the action as automated
-        )
-        actions.append("Rate Limit")
-    elif updated_marks >= 20:
-        redirect_to_intermediate_ovs(source_ip, ovs_id="of:0000000000000003", admin_or_automated="Automated")
-        actions.append("Intermediate Redirect")
-    else:
-        actions.append("No Action") 
+        logger.error("Detection mode or honeypot IP not set in database.")
+        return {}
+
+    policy = get_policy()
+    if detection_mode not in policy.modes:
+        logger.warning("Invalid detection mode: %s", detection_mode)
+        return {}
+
+    valid = [event for event in events if event.get("Source") in policy.source_index and event.get("SourceIP")]
+    if len(valid) != len(events):
+        logger.warning("Invalid source or missing source IP, skipped %s event(s).", len(events) - len(valid))
+    if not valid:
+        return {}
+
+    # Calculate marks increases and group them by SourceIP
+    scores = np.array([float(event.get("Score", 0)) for event in valid])
+    weights = policy.weights_for([event["Source"] for event in valid])
+    increases = scores * weights * policy.modes[detection_mode]
+    source_ips, inverse = np.unique([event["SourceIP"] for event in valid], return_inverse=True)
+    totals = np.bincount(inverse, weights=increases, minlength=len(source_ips))
+    source_ips = source_ips.tolist()
+
+    actions = {}  # Action per SourceIP for informational purposes
+
+    with _ip_lock(source_ips):
+        now = time.time()
+        half_life = get_half_life()
+        stored = {row[0]: row[1:] for row in get_reputations(source_ips)}
+        marks = np.zeros(len(source_ips))
+        current_levels = np.zeros(len(source_ips), dtype=int)
+        for index, source_ip in enumerate(source_ips):
+            if source_ip in stored:
+                score, last_update, action = stored[source_ip]
+                marks[index] = decay_marks(score, last_update, now, half_life)
+                current_levels[index] = policy.level_of(action)
+        updated_marks = marks + totals
+        new_levels = policy.levels_for(updated_marks)
+
+        # Only act when the marks cross into a different threshold band
+        for index, source_ip in enumerate(source_ips):
+            current_level, new_level = int(current_levels[index]), int(new_levels[index])
+            if new_level != current_level:
+                actions[source_ip] = apply_mitigation(source_ip, current_level, new_level, honeypot_ip, policy)
+                logger.info("Mitigation level of %s changed from %s to %s: %s",
+                            source_ip, current_level, new_level, actions[source_ip])
+            elif new_level == 0:
+                actions[source_ip] = "No Action"
+            else:
+                actions[source_ip] = "No Change"
 
+        save_reputations([
+            (source_ip, float(updated_marks[index]), now, policy.actions[new_levels[index]])
+            for index, source_ip in enumerate(source_ips)
+        ])
+
+    EVENTS_PROCESSED.inc(amount=len(valid))
+    for action in actions.values():
+        DECISIONS.inc(action)
     return actions
+
+
+def sweep_reputations(now=None):
+    """
+    Decay every tracked source IP, de-escalate mitigations whose threshold is
+    no longer met and evict entries that have decayed to nothing.
+
+    Args:
+        now (float, optional): Unix timestamp to decay to.
+
+    Returns:
+        dict: Counts of 'deescalated' and 'evicted' entries.
+    """
+    now = time.time() if now is None else now
+    half_life = get_half_life()
+    honeypot_ip = get_setting_value("Honeypot IP Address")
+    result = {"deescalated": 0, "evicted": 0}
+    if half_life <= 0:
+        return result
+
+    for source_ip, _, _, _ in get_reputations():
+        with _ip_lock([source_ip]):
+            # Re-read under the lock, an event may have arrived meanwhile
+            marks, level = get_marks(source_ip, now, half_life)
+            new_level = level_for_marks(marks)
+            # Actions the policy no longer has are moved to the level the marks call for
+            changed = new_level < level or level == -1
+            if changed:
+                apply_mitigation(source_ip, level, new_level, honeypot_ip)
+                result["deescalated"] += 1
+            if marks < EVICTION_MARKS and new_level == 0:
+                delete_reputation(source_ip)
+                result["evicted"] += 1
+            elif changed:
+                save_marks(source_ip, marks, new_level, now)
+    return result
+
+
+def start_reputation_sweeper(interval=SWEEP_INTERVAL, is_leader=None):
+    """
+    Run sweep_reputations periodically in a daemon thread.
+
+    Args:
+        interval (float): Seconds between sweeps.
+        is_leader (callable, optional): Checked before every sweep when several
+            server processes share the database, so only one of them sweeps.
+
+    Returns:
+        threading.Thread: The started thread.
+    """
+    _sweeper_stop.clear()
+
+    def run():
+        while not _sweeper_stop.wait(interval):
+            try:
+                if is_leader is None or is_leader():
+                    new_correlation_id()
+                    sweep_reputations()
+            except Exception as e:
+                logger.error("Error sweeping reputations: %s", e)
+
+    thread = threading.Thread(target=run, name="reputation-sweeper", daemon=True)
+    thread.start()
+    return thread
+
+
+def stop_reputation_sweeper():
+    """
+    Stop the sweeper thread after its current sweep.
+    """
+    _sweeper_stop.set()
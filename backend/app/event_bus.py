@@ -0,0 +1,110 @@
+import itertools
+import queue
+import threading
+
+# Messages buffered per subscriber before the oldest are dropped
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+# Topic telling every subscriber to re-fetch its data instead of applying deltas
+RESYNC_TOPIC = "resync"
+
+
+class Subscription:
+    """
+    A subscriber's queue of published messages.
+
+    Messages are (id, topic, payload) tuples. If the subscriber falls so far
+    behind that its queue overflows, the oldest messages are dropped and
+    'lagged' is set so the client knows to reload instead of applying deltas.
+    """
+
+    def __init__(self, topics, max_size=SUBSCRIBER_QUEUE_SIZE):
+        self.topics = set(topics) if topics else None
+        self.queue = queue.Queue(maxsize=max_size)
+        self.lagged = False
+
+    def wants(self, topic, payload=None):
+        if self.topics is None or topic in self.topics:
+            return True
+        # Subscribers reload after changes the bus could not describe, a
+        # resync naming its topics only concerns their subscribers
+        if topic == RESYNC_TOPIC:
+            topics = (payload or {}).get("topics")
+            return not topics or not self.topics.isdisjoint(topics)
+        return False
+
+    def put(self, message):
+        while True:
+            try:
+                self.queue.put_nowait(message)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.lagged = True
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        """
+        Wait for the next message.
+
+        Returns:
+            tuple: (id, topic, payload), or None if the timeout passed.
+        """
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventBus:
+    """
+    In-process publish/subscribe bus for pushing data changes to clients.
+    """
+
+    def __init__(self):
+        self.subscriptions = []
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def subscribe(self, topics=None):
+        """
+        Start receiving messages.
+
+        Args:
+            topics (iterable of str, optional): Topics to receive, all if omitted.
+
+        Returns:
+            Subscription: The subscription, pass it to unsubscribe when done.
+        """
+        subscription = Subscription(topics)
+        with self.lock:
+            self.subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            if subscription in self.subscriptions:
+                self.subscriptions.remove(subscription)
+
+    def publish(self, topic, payload):
+        """
+        Deliver a message to every subscriber of a topic.
+
+        Publishing never blocks and costs nothing when no one is subscribed.
+
+        Args:
+            topic (str): The topic, e.g. 'anomalies', 'actions' or 'flows'.
+            payload (object): JSON-serializable message data.
+        """
+        with self.lock:
+            subscriptions = [s for s in self.subscriptions if s.wants(topic, payload)]
+            if not subscriptions:
+                return
+            message = (next(self.ids), topic, payload)
+        for subscription in subscriptions:
+            subscription.put(message)
+
+
+bus = EventBus()
@@ -0,0 +1,233 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from database import claim_expirations, complete_expirations, get_next_expiration, record_actions, save_expirations
+from log_setup import new_correlation_id
+from metrics import MITIGATIONS_EXPIRED
+
+logger = logging.getLogger(__name__)
+
+# Expirations claimed and removed per batch
+BATCH_SIZE = 500
+
+# Longest sleep between checks, expirations scheduled by other processes
+# sharing the database are noticed within this time
+POLL_SECONDS = 5
+
+# Removals that fail are retried after attempts * RETRY_SECONDS
+RETRY_SECONDS = 30
+MAX_ATTEMPTS = 5
+
+# Claimed expirations not settled within this many seconds, e.g. because
+# the process died during the removal, are claimed again
+LEASE_SECONDS = 300
+
+# Controller calls removing each kind of mitigation, registered by controller_actions
+_removers = {}
+
+
+def register_remover(kind, remover):
+    """
+    Register the function removing expired mitigations of a kind.
+
+    Args:
+        kind (str): The kind passed to ExpiryScheduler.schedule, e.g. 'acl'.
+        remover (callable): Called with a list of handles, returns a list of
+            booleans telling which of them were removed.
+    """
+    _removers[kind] = remover
+
+
+def remove_mitigations(kind, handles):
+    """
+    Remove mitigations of a kind from the controller with its registered remover.
+
+    Args:
+        kind (str): The kind the mitigations were installed as, e.g. 'acl'.
+        handles (list of dict): What the remover needs to find them.
+
+    Returns:
+        list of bool: Whether each of them was removed.
+
+    Raises:
+        ValueError: If no remover is registered for the kind.
+    """
+    remover = _removers.get(kind)
+    if remover is None:
+        raise ValueError(f"No remover registered for {kind}")
+    return remover(handles)
+
+
+def parse_duration(value):
+    """
+    Parse the duration of a mitigation received from the API.
+
+    Args:
+        value: Seconds as a number or string, empty for a permanent mitigation.
+
+    Returns:
+        float: The duration in seconds, or None if the mitigation is permanent.
+
+    Raises:
+        ValueError: If the value is not a positive number.
+    """
+    if value is None or value == "":
+        return None
+    duration = float(value)
+    if not duration > 0:
+        raise ValueError("Duration must be a positive number of seconds")
+    return duration
+
+
+class ExpiryScheduler:
+    """
+    Remove time-bounded mitigations from the controller when they expire.
+
+    The schedule lives in the expirations table, ordered by an index on the
+    expiry time, so it survives restarts and any number of pending entries
+    costs one row each rather than memory or timers. The thread only keeps
+    the earliest expiry time and sleeps until then. Due entries are claimed
+    in batches and removed with one controller call per kind where the
+    controller allows it. Entries are only deleted once removed, so a
+    crash mid-removal leaves them to be claimed again after LEASE_SECONDS.
+    Each expiry is recorded in the actions table.
+    """
+
+    def __init__(self):
+        self.next_due = None
+        self.condition = threading.Condition()
+        self.thread = None
+        self.stopped = False
+
+    def schedule(self, kind, action_type, source_ip, handle, duration):
+        """
+        Schedule a mitigation for removal.
+
+        Args:
+            kind (str): Which remover handles it, e.g. 'acl', 'intent' or 'rate_limit'.
+            action_type (str): The action being undone, e.g. 'Block', used in the actions log.
+            source_ip (str): The source IP the mitigation applies to.
+            handle (dict): What the remover needs to find it on the controller.
+            duration (float): Seconds until it expires.
+
+        Returns:
+            float: The Unix timestamp it expires at.
+        """
+        expires_at = time.time() + duration
+        save_expirations([(kind, action_type, source_ip, handle, expires_at, 0)])
+        self._wake_by(expires_at)
+        logger.debug("%s of %s expires in %s s", action_type, source_ip, duration)
+        return expires_at
+
+    def _wake_by(self, due):
+        with self.condition:
+            if self.next_due is None or due < self.next_due:
+                self.next_due = due
+                self.condition.notify()
+
+    def start(self):
+        """
+        Start the expiry thread, picking up the schedule persisted in the database.
+        """
+        with self.condition:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.stopped = False
+            self.next_due = get_next_expiration(LEASE_SECONDS)
+            self.thread = threading.Thread(target=self._run, name="mitigation-expiry", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """
+        Stop the expiry thread. Pending expirations stay in the database.
+        """
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def _run(self):
+        while True:
+            with self.condition:
+                timeout = POLL_SECONDS
+                if self.next_due is not None:
+                    timeout = min(max(self.next_due - time.time(), 0), POLL_SECONDS)
+                if timeout > 0:
+                    self.condition.wait(timeout)
+                if self.stopped:
+                    return
+            try:
+                self.expire_due()
+            except Exception as e:
+                logger.error("Error expiring mitigations: %s", e)
+                # Back off instead of retrying a failing database immediately
+                with self.condition:
+                    self.next_due = time.time() + POLL_SECONDS
+
+    def expire_due(self, now=None):
+        """
+        Remove every mitigation that expired by now.
+
+        Args:
+            now (float, optional): Unix timestamp, defaults to the current time.
+
+        Returns:
+            int: The number of expirations handled.
+        """
+        now = now or time.time()
+        handled = 0
+        next_due = get_next_expiration(LEASE_SECONDS)
+        if next_due is not None and next_due <= now:
+            new_correlation_id()
+            while True:
+                entries = claim_expirations(now, BATCH_SIZE, LEASE_SECONDS)
+                self._remove(entries, now)
+                handled += len(entries)
+                if len(entries) < BATCH_SIZE:
+                    break
+            next_due = get_next_expiration(LEASE_SECONDS)
+        with self.condition:
+            self.next_due = next_due
+        return handled
+
+    def _remove(self, entries, now):
+        by_kind = defaultdict(list)
+        for entry in entries:
+            by_kind[entry[1]].append(entry)
+
+        actions = []
+        finished = []
+        retries = []
+        for kind, kind_entries in by_kind.items():
+            try:
+                removed = remove_mitigations(kind, [entry[4] for entry in kind_entries])
+            except Exception as e:
+                logger.error("Error removing expired %s mitigations: %s", kind, e)
+                removed = [False] * len(kind_entries)
+
+            for (expiration_id, _, action_type, source_ip, handle, _, attempts), ok in zip(kind_entries, removed):
+                if ok:
+                    MITIGATIONS_EXPIRED.inc(kind, "removed")
+                    finished.append(expiration_id)
+                    actions.append(("Expire", f"{action_type} for {source_ip} expired.", source_ip, "Automated"))
+                elif attempts + 1 < MAX_ATTEMPTS:
+                    MITIGATIONS_EXPIRED.inc(kind, "retry")
+                    retries.append((expiration_id, now + RETRY_SECONDS * (attempts + 1), attempts + 1))
+                else:
+                    MITIGATIONS_EXPIRED.inc(kind, "failed")
+                    logger.error("Giving up removing expired %s for %s", action_type, source_ip,
+                                 extra={"handle": handle})
+                    finished.append(expiration_id)
+                    actions.append(("Expire", f"{action_type} for {source_ip} expired but could not be removed.",
+                                    source_ip, "Automated"))
+
+        complete_expirations(finished, retries)
+        record_actions(actions)
+        if actions:
+            logger.info("Expired %s mitigations", len(actions))
+
+
+scheduler = ExpiryScheduler()
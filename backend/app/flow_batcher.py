@@ -0,0 +1,105 @@
+import logging
+import threading
+from metrics import histogram
+from topology import AUTH, get_onos_base_url, onos_session
+
+logger = logging.getLogger(__name__)
+
+# Seconds flows are collected before they are submitted together
+BATCH_WINDOW = 0.02
+
+# A batch is submitted early once it holds this many flows
+MAX_BATCH = 1000
+
+FLOW_BATCH_SIZE = histogram("netsecflow_flow_batch_size", "Flow rules per batch submitted to ONOS.",
+                            buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000))
+
+
+class _FlowRequest:
+    def __init__(self, flows):
+        self.flows = flows
+        self.result = None
+        self.done = threading.Event()
+
+
+class FlowBatcher:
+    """
+    Submit flow rules from concurrent callers in shared bulk requests.
+
+    The first caller of a window waits BATCH_WINDOW seconds (or until
+    MAX_BATCH flows are queued), then sends every queued flow in a single
+    POST /flows and hands each caller the ids of its own flows. A burst of
+    mitigations during an incident thus costs a few controller calls
+    instead of one per flow.
+    """
+
+    def __init__(self, window=BATCH_WINDOW, max_batch=MAX_BATCH):
+        self.window = window
+        self.max_batch = max_batch
+        self.pending = []
+        self.pending_flows = 0
+        self.collecting = False
+        self.condition = threading.Condition()
+
+    def submit(self, flows):
+        """
+        Install flow rules, batched with those of concurrent callers.
+
+        Args:
+            flows (list of dict): Flow rules, each with its 'deviceId'.
+
+        Returns:
+            list of dict: {'deviceId', 'flowId'} of each flow in order, or
+                None if the batch could not be installed.
+        """
+        request = _FlowRequest(flows)
+        with self.condition:
+            self.pending.append(request)
+            self.pending_flows += len(flows)
+            leader = not self.collecting
+            self.collecting = True
+            if self.pending_flows >= self.max_batch:
+                self.condition.notify_all()
+
+        if leader:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending_flows >= self.max_batch, timeout=self.window)
+                batch = self.pending
+                self.pending = []
+                self.pending_flows = 0
+                self.collecting = False
+            self._send(batch)
+
+        request.done.wait()
+        return request.result
+
+    def _send(self, batch):
+        flows = [flow for request in batch for flow in request.flows]
+        FLOW_BATCH_SIZE.observe(len(flows))
+        created = None
+        try:
+            response = onos_session.post(f"{get_onos_base_url()}/flows", json={"flows": flows}, auth=AUTH)
+            if response.status_code in (200, 201):
+                created = [
+                    {"deviceId": flow["deviceId"], "flowId": str(flow["flowId"])}
+                    for flow in response.json().get("flows", [])
+                ]
+                if len(created) != len(flows):
+                    logger.error("Controller returned %s flow ids for %s flows", len(created), len(flows))
+                    created = None
+            else:
+                logger.error("Failed to submit %s flows: %s %s", len(flows), response.status_code, response.text)
+        except Exception as e:
+            logger.error("Error submitting %s flows: %s", len(flows), e)
+
+        # The controller answers in the order the flows were sent
+        offset = 0
+        for request in batch:
+            if created is not None:
+                request.result = created[offset:offset + len(request.flows)]
+                offset += len(request.flows)
+            request.done.set()
+        logger.debug("Submitted %s flows for %s callers", len(flows), len(batch))
+
+
+flow_batcher = FlowBatcher()
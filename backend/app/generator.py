@@ -68,9 +68,12 @@ def point_to_point_intent(source_ip, destination_ip, src_device, dst_device, src
         print(f"Error creating intent: {e}")
 
 
-def multipoint_to_singlepoint_intent(app_id, priority, ingress_points, egress_device, egress_port, source_ip=None, dest_ip=None, filename='multipoint_to_singlepoint_intent.json'):
+def multipoint_to_singlepoint_intent(app_id, priority, ingress_points, egress_device, egress_port, source_ip=None, dest_ip=None, filename='multipoint_to_singlepoint_intent.json', key=None, criteria=None):
     """
     Generates a Multipoint-to-Singlepoint Intent JSON for ONOS and saves it to a file.
+
+    Submitting an intent with the key of an existing one replaces it. Pass
+    criteria to set the selector directly, and filename=None to skip saving.
     """
     intent = {
         "type": "MultipointToSinglepointIntent",
@@ -88,8 +91,13 @@ def multipoint_to_singlepoint_intent(app_id, priority, ingress_points, egress_de
         },
     }
 
+    if key:
+        intent["key"] = key
+
     # Add IP selectors if provided
-    if source_ip and dest_ip:
+    if criteria:
+        intent["selector"] = {"criteria": criteria}
+    elif source_ip and dest_ip:
         intent["selector"] = {
             "criteria": [
                 {
@@ -105,7 +113,8 @@ def multipoint_to_singlepoint_intent(app_id, priority, ingress_points, egress_de
 
     # Convert to JSON and save to file
     intent_json = json.dumps(intent, indent=4)
-    save_to_file(filename, intent_json)
+    if filename:
+        save_to_file(filename, intent_json)
     return intent_json
 
 
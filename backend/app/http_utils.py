@@ -0,0 +1,190 @@
+import gzip
+import hashlib
+import math
+import time
+import uuid
+from flask import current_app, request, jsonify
+from flask.json.provider import DefaultJSONProvider
+from database import get_version
+
+# Optional faster encoders, the standard library is used without them
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Responses smaller than this many bytes are not worth compressing
+MIN_COMPRESS_SIZE = 1024
+
+# gzip level, 6 is zlib's default balance of speed and size
+GZIP_LEVEL = 6
+
+# brotli quality, the high levels are too slow for per-request use
+BROTLI_QUALITY = 4
+
+COMPRESSIBLE_TYPES = ("application/json", "text/plain", "text/html", "text/csv")
+
+# Version counters restart with the process, so ETags carry a boot id to
+# keep a restarted server from matching tags handed out by the previous one
+BOOT_ID = uuid.uuid4().hex[:8]
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider that serializes responses with orjson.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS),
+            mimetype=self.mimetype
+        )
+
+
+def init_http(app):
+    """
+    Install the fast JSON encoder and response compression on an app.
+
+    Args:
+        app (Flask): The Flask application.
+    """
+    if orjson is not None:
+        app.json = OrjsonProvider(app)
+    app.after_request(compress_response)
+
+
+def _http_date_validator(last_modified):
+    # Last-Modified has whole seconds. The last write is rounded up to the end
+    # of its second, and no date is given until that second is over, since a
+    # later write in the same second would share the date and get a stale 304.
+    if last_modified is None:
+        return None
+    validator = math.ceil(last_modified)
+    return validator if validator <= time.time() else None
+
+
+def _not_modified(etag, last_modified):
+    # If-None-Match takes precedence, If-Modified-Since is only used without it
+    if request.if_none_match:
+        # Compressed responses carry the tag with the encoding appended
+        return any(request.if_none_match.contains_weak(tag)
+                   for tag in (etag, f"{etag}-gzip", f"{etag}-br"))
+    validator = _http_date_validator(last_modified)
+    if request.if_modified_since and validator is not None:
+        return validator <= request.if_modified_since.timestamp()
+    return False
+
+
+def _validated(response, etag, last_modified=None):
+    response.set_etag(etag)
+    validator = _http_date_validator(last_modified)
+    if validator is not None:
+        response.last_modified = validator
+    # Let clients keep the response but revalidate it on every use
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def conditional_json(resource, build):
+    """
+    Serve data that only changes through the database write helpers.
+
+    The ETag is derived from the resource's version counter, so a client
+    holding the current version gets a 304 without build being called and
+    without any database query.
+
+    Args:
+        resource (str): A name from database.RESOURCES.
+        build (callable): Returns the JSON-serializable response body.
+
+    Returns:
+        Response: A 304 response, or the data with ETag and Last-Modified set.
+    """
+    version, last_modified = get_version(resource)
+    etag = f"{resource}-{BOOT_ID}-{version}"
+    if _not_modified(etag, last_modified):
+        return _validated(current_app.response_class(status=304), etag, last_modified)
+    return _validated(jsonify(build()), etag, last_modified)
+
+
+def hashed_json(data):
+    """
+    Serve data whose changes are not tracked, such as the live topology.
+
+    The ETag is a hash of the serialized data, so the data still has to be
+    fetched, but an unchanged result costs the client no transfer.
+
+    Args:
+        data (object): The JSON-serializable response body.
+
+    Returns:
+        Response: A 304 response, or the data with an ETag set.
+    """
+    response = jsonify(data)
+    etag = hashlib.sha1(response.get_data()).hexdigest()
+    if _not_modified(etag, None):
+        response = current_app.response_class(status=304)
+    return _validated(response, etag)
+
+
+def _choose_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+
+def compress_response(response):
+    """
+    Compress large text responses with brotli or gzip when the client accepts it.
+
+    Streamed responses (Server-Sent Events, file downloads) are left alone.
+
+    Args:
+        response (Response): The response about to be sent.
+
+    Returns:
+        Response: The same response, compressed if worthwhile.
+    """
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    data = response.get_data()
+    if len(data) < MIN_COMPRESS_SIZE:
+        return response
+
+    encoding = _choose_encoding()
+    if encoding == "br":
+        data = brotli.compress(data, quality=BROTLI_QUALITY)
+    elif encoding == "gzip":
+        data = gzip.compress(data, compresslevel=GZIP_LEVEL)
+    else:
+        return response
+
+    response.set_data(data)
+    response.headers["Content-Encoding"] = encoding
+    # The representation changed, so its ETag must too
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f"{etag}-{encoding}", weak)
+    return response
@@ -0,0 +1,111 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from database import save_job, update_job, delete_jobs_before
+from metrics import counter, histogram
+
+logger = logging.getLogger(__name__)
+
+# Jobs run at the same time per server process
+JOB_WORKERS = int(os.environ.get("NETSECFLOW_JOB_WORKERS", "8"))
+
+# Finished jobs are kept this many seconds for status queries
+JOB_RETENTION = 24 * 60 * 60
+
+# Old jobs are pruned after this many jobs finish
+PRUNE_EVERY = 100
+
+JOB_SECONDS = histogram("netsecflow_job_seconds", "Time from queueing to the end of a job.", ["kind"])
+JOBS_FINISHED = counter("netsecflow_jobs_total", "Finished jobs by outcome.", ["kind", "status"])
+
+
+class JobRunner:
+    """
+    Run traffic-control actions on a worker pool instead of in the request.
+
+    Jobs are recorded in the jobs table, so their status can be queried from
+    any server process. An action reports failure by returning False (its
+    helper only logged the error) or raising.
+    """
+
+    def __init__(self, workers=JOB_WORKERS):
+        self.workers = workers
+        self.executor = None
+        self.finished = 0
+        self.lock = threading.Lock()
+
+    def _get_executor(self):
+        if self.executor is None:
+            with self.lock:
+                if self.executor is None:
+                    self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+        return self.executor
+
+    def submit(self, kind, action, **params):
+        """
+        Queue an action.
+
+        Args:
+            kind (str): Name of the action, e.g. 'block'.
+            action (callable): Called with params on a worker thread.
+            params: Keyword arguments of the action, stored with the job.
+
+        Returns:
+            str: The job id.
+        """
+        job_id = uuid.uuid4().hex
+        created_at = time.time()
+        save_job(job_id, kind, params, created_at)
+        # The job logs under the correlation id of the request that queued it
+        context = contextvars.copy_context()
+        self._get_executor().submit(context.run, self._run, job_id, kind, action, params, created_at)
+        logger.debug("Queued %s job %s", kind, job_id)
+        return job_id
+
+    def _run(self, job_id, kind, action, params, created_at):
+        try:
+            update_job(job_id, "running", started_at=time.time())
+            succeeded = action(**params)
+            status, error = "succeeded", None
+            if succeeded is False:
+                status, error = "failed", f"The {kind} action was not applied, see the logs for details"
+        except Exception as e:
+            logger.error("Error running %s job %s: %s", kind, job_id, e)
+            status, error = "failed", str(e)
+
+        finished_at = time.time()
+        try:
+            update_job(job_id, status, error=error, finished_at=finished_at)
+        except Exception as e:
+            logger.error("Error saving the status of job %s: %s", job_id, e)
+        JOB_SECONDS.observe(finished_at - created_at, kind)
+        JOBS_FINISHED.inc(kind, status)
+        logger.info("%s job %s %s", kind, job_id, status)
+        self._prune(finished_at)
+
+    def _prune(self, now):
+        with self.lock:
+            self.finished += 1
+            due = self.finished % PRUNE_EVERY == 0
+        if due:
+            try:
+                delete_jobs_before(now - JOB_RETENTION)
+            except Exception as e:
+                logger.error("Error pruning old jobs: %s", e)
+
+    def stop(self):
+        """
+        Finish the running jobs and drop the queued ones. Dropped jobs are
+        marked as interrupted when the database is next initialized.
+        """
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+job_runner = JobRunner()
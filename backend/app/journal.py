@@ -0,0 +1,402 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+import zlib
+from collections import deque
+from database import DB_PATH
+from log_setup import new_correlation_id
+from metrics import counter, histogram
+
+logger = logging.getLogger(__name__)
+
+# Directory of the journal, NETSECFLOW_JOURNAL_DIR overrides it
+JOURNAL_DIR = os.path.abspath(os.environ.get("NETSECFLOW_JOURNAL_DIR", DB_PATH + ".journal"))
+
+# A new segment file is started once the current one reaches this size
+SEGMENT_BYTES = 16 * 1024 * 1024
+
+# The processed offset is written at most this often
+CHECKPOINT_SECONDS = 1.0
+
+# Alerts saved and processed together when replaying
+REPLAY_BATCH = 500
+
+OFFSET_FILE = "offset"
+LOCK_FILE = "lock"
+SEGMENT_SUFFIX = ".log"
+
+JOURNAL_COMMIT_RECORDS = histogram("netsecflow_journal_commit_records", "Alerts written per journal commit.",
+                                   buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500))
+JOURNAL_REPLAYED = counter("netsecflow_journal_replayed_total", "Alerts replayed from the journal after a restart.")
+
+
+def _try_lock(handle):
+    # Exclusive lock held until the handle is closed or the process exits
+    try:
+        import fcntl
+    except ImportError:
+        import msvcrt
+        try:
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            return False
+        return True
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+
+def _encode(seq, event):
+    payload = json.dumps(event, separators=(",", ":")).encode()
+    return b"%d\t%08x\t%s\n" % (seq, zlib.crc32(payload), payload)
+
+
+def _read_offset(directory):
+    try:
+        with open(os.path.join(directory, OFFSET_FILE)) as handle:
+            return int(handle.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def _write_offset(directory, offset):
+    path = os.path.join(directory, OFFSET_FILE)
+    with open(path + ".tmp", "w") as handle:
+        handle.write(str(offset))
+    os.replace(path + ".tmp", path)
+
+
+def _segments(directory):
+    # (first sequence number, path) of each segment, oldest first
+    segments = []
+    for name in os.listdir(directory):
+        if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit():
+            segments.append((int(name[:-len(SEGMENT_SUFFIX)]), os.path.join(directory, name)))
+    return sorted(segments)
+
+
+def read_records(directory, after=0):
+    """
+    Read the alerts journaled in a writer directory.
+
+    A segment is read up to its first incomplete or corrupt record, which
+    can only be a write torn by a crash and was never acknowledged.
+
+    Args:
+        directory (str): The writer directory.
+        after (int): Skip records up to this sequence number.
+
+    Yields:
+        tuple: (sequence number, alert dict).
+    """
+    for _, path in _segments(directory):
+        with open(path, "rb") as handle:
+            for line in handle:
+                try:
+                    seq, checksum, payload = line.rstrip(b"\n").split(b"\t", 2)
+                    if not line.endswith(b"\n") or int(checksum, 16) != zlib.crc32(payload):
+                        raise ValueError("checksum mismatch")
+                    seq = int(seq)
+                    event = json.loads(payload)
+                except ValueError:
+                    logger.warning("Ignoring a torn record at the end of %s", path)
+                    break
+                if seq > after:
+                    yield seq, event
+
+
+class _Commit:
+    def __init__(self, first_seq):
+        self.first_seq = first_seq
+        self.lines = []
+        self.done = False
+        self.error = None
+
+
+class AlertJournal:
+    """
+    Append-only journal making received alerts durable before they are acknowledged.
+
+    Every process writes its own directory of segment files, locked while
+    the process lives. Alerts are appended as checksummed lines with
+    increasing sequence numbers; concurrent appends are written and fsynced
+    together by whichever caller finds no commit in progress (group commit),
+    so a burst of alerts costs a few fsyncs instead of one SQLite
+    transaction each. Once an alert has been saved and processed its
+    sequence number is marked done, and the offset file records the highest
+    number up to which everything is done. Segments below the offset are
+    deleted.
+
+    On startup the directories of processes that no longer hold their lock
+    are replayed from their offset through the decision path, then removed,
+    or kept for the next startup if replaying them fails.
+    Replay is at least once: an alert processed just before a crash may be
+    processed again.
+    """
+
+    def __init__(self, directory=JOURNAL_DIR, segment_bytes=SEGMENT_BYTES):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.writer_dir = None
+        self.lock_handle = None
+        self.file = None
+        self.segment_size = 0
+        # First sequence numbers of the segments still on disk
+        self.segment_starts = []
+        self.next_seq = 1
+        self.commit = None
+        self.committing = False
+        self.condition = threading.Condition()
+        # Sequence numbers appended and not yet done, in order, and those done out of order
+        self.pending = deque()
+        self.completed = set()
+        self.offset = 0
+        self.checkpoint_at = 0.0
+        self.checkpoint_timer = None
+        self.checkpoint_lock = threading.Lock()
+
+    def open(self):
+        """
+        Start journaling into a new writer directory of this process.
+        """
+        with self.condition:
+            if self.file is not None:
+                return
+            writer_dir = os.path.join(self.directory, f"writer-{os.getpid()}-{uuid.uuid4().hex[:8]}")
+            os.makedirs(writer_dir)
+            lock_handle = open(os.path.join(writer_dir, LOCK_FILE), "a+")
+            _try_lock(lock_handle)
+            self.writer_dir, self.lock_handle = writer_dir, lock_handle
+            self.next_seq = 1
+            self.offset = 0
+            self.segment_starts = []
+            self._start_segment(1)
+            self.commit = _Commit(1)
+        logger.info("Journaling alerts to %s", writer_dir)
+
+    def _start_segment(self, first_seq):
+        if self.file is not None:
+            self.file.close()
+        path = os.path.join(self.writer_dir, f"{first_seq:020d}{SEGMENT_SUFFIX}")
+        self.file = open(path, "ab")
+        self.segment_size = 0
+        self.segment_starts.append(first_seq)
+
+    def append(self, event):
+        """
+        Write an alert to the journal, returning once it is on disk.
+
+        Args:
+            event (dict): The alert received from the webhook.
+
+        Returns:
+            int: The alert's sequence number, to pass to done(), or None if
+                the journal is not open.
+
+        Raises:
+            OSError: If the alert could not be written; it must not be acknowledged.
+        """
+        with self.condition:
+            if self.file is None:
+                return None
+            seq = self.next_seq
+            self.next_seq += 1
+            commit = self.commit
+            commit.lines.append(_encode(seq, event))
+            self.pending.append(seq)
+
+            while not commit.done:
+                if self.committing:
+                    self.condition.wait()
+                    continue
+                # Lead the commit of everything appended so far
+                self.committing = True
+                self.commit = _Commit(self.next_seq)
+                self.condition.release()
+                try:
+                    self._write(commit)
+                finally:
+                    self.condition.acquire()
+                    self.committing = False
+                    commit.done = True
+                    self.condition.notify_all()
+
+        if commit.error is not None:
+            self.done([seq])
+            raise commit.error
+        return seq
+
+    def _write(self, commit):
+        # Runs in one thread at a time, the committing flag guards the file
+        JOURNAL_COMMIT_RECORDS.observe(len(commit.lines))
+        data = b"".join(commit.lines)
+        try:
+            if self.segment_size and self.segment_size + len(data) > self.segment_bytes:
+                self._start_segment(commit.first_seq)
+            self.file.write(data)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.segment_size += len(data)
+        except Exception as e:
+            logger.error("Error writing %s alerts to the journal: %s", len(commit.lines), e)
+            commit.error = e
+
+    def done(self, seqs):
+        """
+        Mark journaled alerts as processed, so they are not replayed.
+
+        Args:
+            seqs (list of int): Sequence numbers returned by append(), None entries are ignored.
+        """
+        with self.condition:
+            self.completed.update(seq for seq in seqs if seq is not None)
+            while self.pending and self.pending[0] in self.completed:
+                self.completed.remove(self.pending.popleft())
+            offset = self.pending[0] - 1 if self.pending else self.next_seq - 1
+        if offset > self.offset:
+            self._schedule_checkpoint()
+
+    def _schedule_checkpoint(self):
+        with self.checkpoint_lock:
+            wait = self.checkpoint_at + CHECKPOINT_SECONDS - time.monotonic()
+            if wait > 0:
+                # Write the offset when the interval ends, in case no alert comes by then
+                if self.checkpoint_timer is None:
+                    self.checkpoint_timer = threading.Timer(wait, self.checkpoint)
+                    self.checkpoint_timer.daemon = True
+                    self.checkpoint_timer.start()
+                return
+        self.checkpoint()
+
+    def checkpoint(self):
+        """
+        Write the processed offset and delete the segments below it.
+        """
+        with self.checkpoint_lock:
+            self.checkpoint_timer = None
+            self.checkpoint_at = time.monotonic()
+            with self.condition:
+                if self.writer_dir is None:
+                    return
+                offset = self.pending[0] - 1 if self.pending else self.next_seq - 1
+                # Every segment but the current one ends where the next one starts
+                finished = [(start, end - 1) for start, end in zip(self.segment_starts, self.segment_starts[1:])]
+                removable = [start for start, last in finished if last <= offset]
+                self.segment_starts = self.segment_starts[len(removable):]
+            if offset <= self.offset:
+                return
+            try:
+                _write_offset(self.writer_dir, offset)
+                self.offset = offset
+                for start in removable:
+                    os.remove(os.path.join(self.writer_dir, f"{start:020d}{SEGMENT_SUFFIX}"))
+            except OSError as e:
+                logger.error("Error writing the journal offset: %s", e)
+
+    def close(self):
+        """
+        Stop journaling. The directory is removed if every alert was processed,
+        otherwise it is replayed on the next startup.
+        """
+        with self.condition:
+            while self.committing:
+                self.condition.wait()
+            if self.file is None:
+                return
+            self.file.close()
+            self.file = None
+            writer_dir, lock_handle = self.writer_dir, self.lock_handle
+            clean = not self.pending
+        with self.checkpoint_lock:
+            if self.checkpoint_timer is not None:
+                self.checkpoint_timer.cancel()
+        self.checkpoint()
+        self.writer_dir = self.lock_handle = None
+        lock_handle.close()
+        if clean:
+            shutil.rmtree(writer_dir, ignore_errors=True)
+        else:
+            logger.warning("%s journaled alerts were not processed, they are replayed on the next startup",
+                           len(self.pending))
+
+    def replay(self, handler):
+        """
+        Replay the alerts left unprocessed by processes that stopped.
+
+        A directory is removed once all of its alerts were replayed. If the
+        handler fails, the directory and its offset are kept so the failed
+        batch and the ones after it are replayed on the next startup.
+
+        Args:
+            handler (callable): Called with each batch of alerts, saves and
+                processes them.
+
+        Returns:
+            int: The number of alerts replayed.
+        """
+        if not os.path.isdir(self.directory):
+            return 0
+        replayed = 0
+        for name in sorted(os.listdir(self.directory)):
+            directory = os.path.join(self.directory, name)
+            if not name.startswith("writer-") or directory == self.writer_dir:
+                continue
+            lock_handle = open(os.path.join(directory, LOCK_FILE), "a+")
+            try:
+                if not _try_lock(lock_handle):
+                    # Another live process is writing it or replaying it
+                    continue
+                count, complete = self._replay_writer(directory, handler)
+                replayed += count
+            finally:
+                lock_handle.close()
+            if complete:
+                shutil.rmtree(directory, ignore_errors=True)
+        return replayed
+
+    def _replay_writer(self, directory, handler):
+        # Returns (alerts replayed, whether all of them were)
+        batch, replayed = [], 0
+
+        def feed(last_seq):
+            new_correlation_id()
+            try:
+                handler(batch)
+            except Exception as e:
+                logger.error("Error replaying %s journaled alerts from %s, they are replayed on the next startup: %s",
+                             len(batch), directory, e)
+                return False
+            # A crash during replay resumes after the last replayed batch
+            _write_offset(directory, last_seq)
+            return True
+
+        complete = True
+        last_seq = None
+        for seq, event in read_records(directory, after=_read_offset(directory)):
+            batch.append(event)
+            last_seq = seq
+            if len(batch) >= REPLAY_BATCH:
+                complete = feed(last_seq)
+                if not complete:
+                    break
+                replayed += len(batch)
+                batch = []
+        else:
+            if batch:
+                complete = feed(last_seq)
+                if complete:
+                    replayed += len(batch)
+        if replayed:
+            JOURNAL_REPLAYED.inc(amount=replayed)
+            logger.info("Replayed %s unprocessed alerts from %s", replayed, directory)
+        return replayed, complete
+
+
+journal = AlertJournal()
@@ -0,0 +1,123 @@
+import threading
+import time
+
+# OpenAI API Key
+OPENAI_API_KEY = ""
+
+_openai = None
+_openai_lock = threading.Lock()
+
+
+class InvalidRequestError(Exception):
+    """
+    The backend rejected the request, e.g. because the context is too long.
+    """
+
+
+def get_openai():
+    """
+    Import and configure the openai package on first use.
+
+    The import is slow, so processes that never use the OpenAI backend
+    (e.g. webhook-only workers) do not pay for it.
+    """
+    global _openai
+    if _openai is None:
+        with _openai_lock:
+            if _openai is None:
+                import openai
+                openai.api_key = OPENAI_API_KEY
+                _openai = openai
+    return _openai
+
+
+class OpenAIBackend:
+    """
+    Chat completions through the OpenAI API.
+    """
+
+    def __init__(self, model="gpt-3.5-turbo"):
+        self.model = model
+
+    def complete(self, messages):
+        """
+        Generate a full response.
+
+        Args:
+            messages (list of dict): Chat messages with 'role' and 'content'.
+
+        Returns:
+            str: The response text.
+        """
+        openai = get_openai()
+        try:
+            response = openai.ChatCompletion.create(model=self.model, messages=messages)
+        except openai.error.InvalidRequestError as e:
+            raise InvalidRequestError(str(e)) from e
+        return response['choices'][0]['message']['content']
+
+    def stream(self, messages):
+        """
+        Generate a response piece by piece as the model produces it.
+
+        Args:
+            messages (list of dict): Chat messages with 'role' and 'content'.
+
+        Yields:
+            str: Pieces of the response text.
+        """
+        openai = get_openai()
+        try:
+            for chunk in openai.ChatCompletion.create(model=self.model, messages=messages, stream=True):
+                text = chunk['choices'][0].get('delta', {}).get('content')
+                if text:
+                    yield text
+        except openai.error.InvalidRequestError as e:
+            raise InvalidRequestError(str(e)) from e
+
+
+class StubBackend:
+    """
+    Local stand-in model that answers without any network access.
+
+    The answer repeats the question and reports how much context was given,
+    streamed one word at a time with an optional delay, which is enough to
+    exercise the chatbot endpoints end to end.
+    """
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    def complete(self, messages):
+        return "".join(self.stream(messages))
+
+    def stream(self, messages):
+        question = messages[-1]["content"]
+        context = "".join(message["content"] for message in messages[:-1])
+        answer = f"You asked: {question} (answered with {len(context)} characters of context)"
+        for index, word in enumerate(answer.split(" ")):
+            if self.delay:
+                time.sleep(self.delay)
+            yield word if index == 0 else f" {word}"
+
+
+BACKENDS = {
+    "openai": OpenAIBackend,
+    "stub": StubBackend,
+}
+
+
+def get_backend(name=None):
+    """
+    Create the chat backend registered under a name.
+
+    Args:
+        name (str, optional): A key of BACKENDS, defaults to 'openai'.
+
+    Returns:
+        object: A backend with complete(messages) and stream(messages) methods.
+    """
+    backend = BACKENDS.get(name or "openai")
+    if backend is None:
+        raise ValueError(f"Unknown chatbot backend: {name}")
+    return backend()
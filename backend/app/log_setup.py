@@ -0,0 +1,179 @@
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+import uuid
+from metrics import counter
+
+# Records buffered for the writer thread before new ones are dropped
+LOG_QUEUE_SIZE = 10000
+
+# Default level, NETSECFLOW_LOG_LEVEL overrides it
+DEFAULT_LEVEL = "INFO"
+
+# Id of the webhook event or API request whose work is being logged
+correlation_id = contextvars.ContextVar("correlation_id", default=None)
+
+_listener = None
+
+LOG_RECORDS_DROPPED = counter("netsecflow_log_records_dropped_total", "Log records dropped because the writer fell behind.")
+
+# Attributes every LogRecord has, anything else was passed through 'extra'
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "correlation_id"}
+
+
+def new_correlation_id(value=None):
+    """
+    Start a new correlation id for the current request or batch.
+
+    Args:
+        value (str, optional): An id received from the caller, e.g. in the
+            X-Correlation-ID header. A random one is created otherwise.
+
+    Returns:
+        str: The id now attached to every log record of this context.
+    """
+    value = value or uuid.uuid4().hex[:16]
+    correlation_id.set(value)
+    return value
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format records as one JSON object per line.
+
+    Fields passed with extra={...} are included as top-level keys.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "correlation_id", None):
+            entry["correlation_id"] = record.correlation_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that never blocks the logging thread.
+
+    When the writer falls behind and the queue is full, records are dropped
+    and counted instead of waiting for console I/O.
+    """
+
+    def prepare(self, record):
+        # Format the message and drop arguments now, they may change later,
+        # and capture the correlation id while still in the logging thread
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        record.correlation_id = correlation_id.get()
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+def parse_levels(spec):
+    """
+    Parse per-module levels such as 'decision=DEBUG,controller_actions=WARNING'.
+
+    Returns:
+        dict: Logger names mapped to level names.
+    """
+    levels = {}
+    for part in (spec or "").split(","):
+        if "=" in part:
+            name, level = part.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(level=None, module_levels=None, json_output=None):
+    """
+    Send all logging through a queue to a background writer thread.
+
+    Request threads only enqueue records, the console is written by the
+    listener thread. Safe to call more than once.
+
+    Args:
+        level (str, optional): Root level, defaults to NETSECFLOW_LOG_LEVEL or INFO.
+        module_levels (dict, optional): Logger names mapped to levels, defaults
+            to NETSECFLOW_LOG_LEVELS, e.g. 'decision=DEBUG,database=WARNING'.
+        json_output (bool, optional): JSON lines instead of plain text,
+            defaults to true unless NETSECFLOW_LOG_FORMAT is 'text'.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    level = level or os.environ.get("NETSECFLOW_LOG_LEVEL", DEFAULT_LEVEL)
+    if module_levels is None:
+        module_levels = parse_levels(os.environ.get("NETSECFLOW_LOG_LEVELS"))
+    if json_output is None:
+        json_output = os.environ.get("NETSECFLOW_LOG_FORMAT", "json") != "text"
+
+    output = logging.StreamHandler(sys.stderr)
+    if json_output:
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(correlation_id)s] %(message)s"))
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    handler = DroppingQueueHandler(log_queue)
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level.upper())
+    for name, module_level in module_levels.items():
+        logging.getLogger(name).setLevel(module_level)
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+
+
+def init_request_ids(app):
+    """
+    Give every request a correlation id, taken from the X-Correlation-ID
+    header if the caller sent one, and return it in the same header.
+
+    Args:
+        app (Flask): The Flask application.
+    """
+    from flask import g, request
+
+    @app.before_request
+    def assign_correlation_id():
+        g.correlation_id = new_correlation_id(request.headers.get("X-Correlation-ID"))
+
+    @app.after_request
+    def return_correlation_id(response):
+        if "correlation_id" in g:
+            response.headers["X-Correlation-ID"] = g.correlation_id
+        return response
+
+
+def stop_logging():
+    """
+    Write out the queued records and stop the writer thread.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,266 @@
+import functools
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from urllib.parse import urlsplit
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds of the latency histogram buckets
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    """
+    A monotonically increasing count, optionally split by labels.
+    """
+
+    type = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self, extra=()):
+        with self.lock:
+            values = sorted(self.values.items())
+        return [f"{self.name}{_format_labels(self.labels, key, extra)} {value}" for key, value in values]
+
+
+class Histogram:
+    """
+    Distribution of observed values (e.g. durations) in cumulative buckets.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        # Counts are kept per bucket and only accumulated when rendered
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(label_values)
+            if entry is None:
+                entry = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def time(self, *label_values):
+        """
+        Context manager observing the duration of its block.
+        """
+        return _Timer(self, label_values)
+
+    def render(self, extra=()):
+        with self.lock:
+            values = sorted((key, ([*counts], total, count)) for key, (counts, total, count) in self.values.items())
+        lines = []
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, [*extra, ('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key, extra)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key, extra)} {count}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.histogram.observe(time.perf_counter() - self.start, *self.label_values)
+        return False
+
+
+class Registry:
+    """
+    The set of metrics exposed at /metrics.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def render(self):
+        """
+        Render every metric in the Prometheus text exposition format.
+
+        Metrics are kept in memory per process, so with several workers a
+        scrape only sees the worker that served it. Every series carries a
+        'pid' label to keep the workers apart; sum over it to aggregate.
+
+        Returns:
+            str: The metrics page.
+        """
+        with self.lock:
+            metrics = list(self.metrics.values())
+        extra = [("pid", os.getpid())]
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.render(extra))
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def counter(name, help, labels=()):
+    return registry.register(Counter(name, help, labels))
+
+
+def histogram(name, help, labels=(), buckets=DEFAULT_BUCKETS):
+    return registry.register(Histogram(name, help, labels, buckets))
+
+
+DB_SECONDS = histogram("netsecflow_db_seconds", "Time spent in database helpers.", ["helper"])
+DB_ERRORS = counter("netsecflow_db_errors_total", "Database helper calls that raised.", ["helper"])
+EXTERNAL_SECONDS = histogram("netsecflow_external_request_seconds",
+                             "Time spent in ONOS and Elasticsearch requests.", ["service", "endpoint"])
+EXTERNAL_REQUESTS = counter("netsecflow_external_requests_total",
+                            "ONOS and Elasticsearch requests by outcome.", ["service", "endpoint", "outcome"])
+EVENT_BATCH_SECONDS = histogram("netsecflow_event_batch_seconds", "Time to score and act on a batch of events.")
+EVENTS_PROCESSED = counter("netsecflow_events_processed_total", "Events scored by the decision engine.")
+DECISIONS = counter("netsecflow_decisions_total", "Decision outcomes per source IP.", ["action"])
+MITIGATIONS_EXPIRED = counter("netsecflow_mitigations_expired_total",
+                              "Time-bounded mitigations removed at expiry, by outcome.", ["kind", "outcome"])
+HTTP_SECONDS = histogram("netsecflow_http_request_seconds", "Time to handle API requests.", ["route", "method"])
+HTTP_REQUESTS = counter("netsecflow_http_requests_total", "API requests by status.", ["route", "method", "status"])
+
+
+def timed_db(function):
+    """
+    Decorator recording the duration and failures of a database helper.
+    """
+    name = function.__name__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        except Exception:
+            DB_ERRORS.inc(name)
+            raise
+        finally:
+            DB_SECONDS.observe(time.perf_counter() - start, name)
+    return wrapper
+
+
+def timed(histogram, *label_values):
+    """
+    Decorator recording the duration of every call in a histogram.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with histogram.time(*label_values):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def observe_external(service, endpoint, start, outcome):
+    EXTERNAL_SECONDS.observe(time.perf_counter() - start, service, endpoint)
+    EXTERNAL_REQUESTS.inc(service, endpoint, outcome)
+
+
+class InstrumentedSession(requests.Session):
+    """
+    requests session recording the duration and outcome of every request.
+
+    Requests are labelled with the first path segment after base_path
+    (e.g. 'flows' or 'acl' for ONOS) to keep the number of series small.
+    Sharing one session also reuses connections to the service.
+
+    Args:
+        service (str): Name of the remote service, e.g. 'onos'.
+        base_path (str): Path prefix stripped before picking the endpoint.
+    """
+
+    def __init__(self, service, base_path=""):
+        super().__init__()
+        self.service = service
+        self.base_path = base_path
+
+    def endpoint_for(self, url):
+        path = urlsplit(url).path
+        if path.startswith(self.base_path):
+            path = path[len(self.base_path):]
+        return path.strip("/").split("/", 1)[0] or "/"
+
+    def request(self, method, url, *args, **kwargs):
+        endpoint = self.endpoint_for(url)
+        start = time.perf_counter()
+        try:
+            response = super().request(method, url, *args, **kwargs)
+        except requests.exceptions.RequestException as e:
+            observe_external(self.service, endpoint, start, "error")
+            logger.warning("%s %s failed: %s", method, url, e, extra={"service": self.service})
+            raise
+        observe_external(self.service, endpoint, start, str(response.status_code))
+        logger.debug("%s %s %s", method, url, response.status_code,
+                     extra={"service": self.service, "seconds": round(time.perf_counter() - start, 4)})
+        return response
+
+
+def init_metrics(app):
+    """
+    Record the duration and status of every request handled by an app.
+
+    Args:
+        app (Flask): The Flask application.
+    """
+    from flask import g, request
+
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        start = g.pop("metrics_start", None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            HTTP_SECONDS.observe(time.perf_counter() - start, route, request.method)
+            HTTP_REQUESTS.inc(route, request.method, str(response.status_code))
+        return response
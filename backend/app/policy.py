@@ -0,0 +1,219 @@
+import json
+import logging
+import os
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Policy file read at startup and re-read whenever it changes on disk
+POLICY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "decision_policy.json")
+
+# Actions the decision engine knows how to apply
+KNOWN_ACTIONS = ["No Action", "Intermediate Redirect", "Rate Limit", "Redirect", "Block"]
+
+# Used when no policy file exists, and for keys the file leaves out
+DEFAULT_POLICY = {
+    # Confidence rates for different data sources
+    "sources": {
+        "Netflow": 0.2,
+        "AD-logs": 0.3,
+        "Honeypot": 0.8,
+        "dns-logs": 0.25,
+        "EDR": 0.7,
+        "IDS": 0.6
+    },
+    # Detection mode multipliers
+    "modes": {
+        "strict": 0.8,
+        "balanced": 0.5,
+        "loose": 0.2
+    },
+    # Marks threshold -> action, from least to most severe
+    "levels": [
+        {"threshold": 0, "action": "No Action"},
+        {"threshold": 20, "action": "Intermediate Redirect"},
+        {"threshold": 40, "action": "Rate Limit"},
+        {"threshold": 60, "action": "Redirect"},
+        {"threshold": 100, "action": "Block"}
+    ],
+    # Parameters passed to the controller actions
+    "parameters": {
+        "rate_limit_bps": 50,
+        "intermediate_ovs": "of:0000000000000003",
+        # Install the lower level's action when marks decay below a threshold,
+        # otherwise the IP is only released from its current mitigation
+        "reapply_on_deescalation": False
+    }
+}
+
+
+class DecisionPolicy:
+    """
+    A policy compiled into lookup structures for batch scoring.
+
+    Source weights are held in a NumPy array indexed through source_index, and
+    thresholds in a sorted array so a whole batch of marks can be bucketed into
+    levels with a single searchsorted call.
+    """
+
+    def __init__(self, config):
+        levels = sorted(config["levels"], key=lambda level: float(level["threshold"]))
+        for level in levels:
+            if level["action"] not in KNOWN_ACTIONS:
+                raise ValueError(f"Unknown action in policy: {level['action']}")
+        if not levels or float(levels[0]["threshold"]) > 0:
+            raise ValueError("Policy levels must start at a threshold of 0")
+
+        # Checked here so a bad file is rejected at load rather than when an event needs them
+        parameters = config["parameters"]
+        if not float(parameters.get("rate_limit_bps") or 0) > 0:
+            raise ValueError("Policy parameter rate_limit_bps must be a positive number")
+        if not parameters.get("intermediate_ovs") or not isinstance(parameters["intermediate_ovs"], str):
+            raise ValueError("Policy parameter intermediate_ovs must be a device id")
+
+        self.config = config
+        self.source_index = {source: index for index, source in enumerate(config["sources"])}
+        self.source_weights = np.array([float(weight) for weight in config["sources"].values()])
+        self.modes = {mode: float(multiplier) for mode, multiplier in config["modes"].items()}
+        self.thresholds = np.array([float(level["threshold"]) for level in levels])
+        self.actions = [level["action"] for level in levels]
+        self.parameters = config["parameters"]
+
+    def weights_for(self, sources):
+        """
+        Look up the confidence rate of each source.
+
+        Args:
+            sources (list of str): Source names, all present in source_index.
+
+        Returns:
+            numpy.ndarray: The confidence rate of each source.
+        """
+        return self.source_weights[[self.source_index[source] for source in sources]]
+
+    def levels_for(self, marks):
+        """
+        Bucket marks into mitigation levels.
+
+        Args:
+            marks (numpy.ndarray): Marks values.
+
+        Returns:
+            numpy.ndarray: Index into actions for each marks value.
+        """
+        return np.searchsorted(self.thresholds, marks, side="right") - 1
+
+    def level_for(self, marks):
+        return int(self.levels_for(np.array([marks]))[0])
+
+    def level_of(self, stored):
+        """
+        Find the level of a stored mitigation in this policy.
+
+        Args:
+            stored (str or int): The action name stored for a source IP, or
+                the level index stored before action names were.
+
+        Returns:
+            int: Index into actions, or -1 if this policy no longer has the action.
+        """
+        if isinstance(stored, int):
+            return min(max(stored, 0), len(self.actions) - 1)
+        if stored in self.actions:
+            return self.actions.index(stored)
+        return 0 if stored == "No Action" else -1
+
+
+def merge_config(defaults, overrides):
+    """
+    Merge a policy file into the defaults, nested dicts key by key.
+
+    Args:
+        defaults (dict): e.g. DEFAULT_POLICY.
+        overrides (dict): The keys set by the policy file.
+
+    Returns:
+        dict: A new dict, the overrides winning; lists are replaced whole.
+    """
+    merged = dict(defaults)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_config(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def load_policy(path=POLICY_PATH):
+    """
+    Load and compile the policy file, falling back to DEFAULT_POLICY.
+
+    Args:
+        path (str): Path of the JSON policy file.
+
+    Returns:
+        DecisionPolicy: The compiled policy.
+
+    Raises:
+        ValueError, KeyError, TypeError: If the file is not a valid policy.
+    """
+    config = DEFAULT_POLICY
+    if os.path.exists(path):
+        with open(path, 'r') as file:
+            overrides = json.load(file)
+        if not isinstance(overrides, dict):
+            raise ValueError("Policy file must hold a JSON object")
+        config = merge_config(DEFAULT_POLICY, overrides)
+    return DecisionPolicy(config)
+
+
+_policy = None
+_policy_mtime = None
+_policy_lock = threading.Lock()
+
+
+def get_policy():
+    """
+    Return the compiled policy, reloading it if the policy file changed.
+
+    A policy file that fails to load is reported and the previous policy kept.
+
+    Returns:
+        DecisionPolicy: The current policy.
+    """
+    global _policy, _policy_mtime
+    mtime = os.path.getmtime(POLICY_PATH) if os.path.exists(POLICY_PATH) else None
+    if _policy is not None and mtime == _policy_mtime:
+        return _policy
+    with _policy_lock:
+        if _policy is None or mtime != _policy_mtime:
+            try:
+                _policy = load_policy(POLICY_PATH)
+            except (ValueError, KeyError, TypeError) as e:
+                logger.error("Error loading decision policy from %s: %s", POLICY_PATH, e)
+                if _policy is None:
+                    _policy = DecisionPolicy(DEFAULT_POLICY)
+            _policy_mtime = mtime
+    return _policy
+
+
+def reload_policy():
+    """
+    Force the policy file to be read again.
+
+    Returns:
+        DecisionPolicy: The reloaded policy.
+
+    Raises:
+        ValueError: If the file is not a valid policy, the previous one is kept.
+    """
+    global _policy, _policy_mtime
+    with _policy_lock:
+        mtime = os.path.getmtime(POLICY_PATH) if os.path.exists(POLICY_PATH) else None
+        try:
+            _policy = load_policy(POLICY_PATH)
+        except (ValueError, KeyError, TypeError) as e:
+            raise ValueError(f"Invalid decision policy {POLICY_PATH}: {e}") from e
+        _policy_mtime = mtime
+        return _policy
@@ -0,0 +1,120 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Seconds between samples, a lower interval gives more detail but costs more
+DEFAULT_INTERVAL = 0.01
+
+# Frames kept per sampled stack
+MAX_DEPTH = 30
+
+# Threads whose innermost frame is in these modules are idle and not counted
+IDLE_MODULES = ("threading.py", "queue.py", "selectors.py")
+
+
+def _function_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)})"
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler that samples the stacks of all threads.
+
+    While running, a background thread records every other thread's current
+    stack each interval. Functions that show up in many samples are where
+    the time goes; threads waiting on locks or queues are left out. Nothing
+    is traced, so the overhead on the sampled threads is negligible and the
+    profiler can be switched on in production.
+    """
+
+    def __init__(self):
+        self.interval = DEFAULT_INTERVAL
+        self.samples = 0
+        self.functions = Counter()
+        self.stacks = Counter()
+        self.started_at = None
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, interval=DEFAULT_INTERVAL):
+        """
+        Start sampling, discarding the previous results.
+
+        Args:
+            interval (float): Seconds between samples.
+        """
+        with self.lock:
+            if self.running:
+                return
+            self.interval = interval
+            self.samples = 0
+            self.functions = Counter()
+            self.stacks = Counter()
+            self.started_at = time.time()
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        thread = self.thread
+        if thread is not None:
+            thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            frames = sys._current_frames()
+            with self.lock:
+                self.samples += 1
+                for thread_id, frame in frames.items():
+                    if thread_id == own_id or os.path.basename(frame.f_code.co_filename) in IDLE_MODULES:
+                        continue
+                    stack = []
+                    functions = set()
+                    while frame is not None and len(stack) < MAX_DEPTH:
+                        stack.append(_frame_label(frame))
+                        functions.add(_function_label(frame))
+                        frame = frame.f_back
+                    # Count each function once per sample, even if recursive
+                    # or sampled at different lines
+                    self.functions.update(functions)
+                    self.stacks[";".join(reversed(stack))] += 1
+
+    def report(self, top=20):
+        """
+        Summarize the samples taken so far.
+
+        Args:
+            top (int): Number of functions and stacks to include.
+
+        Returns:
+            dict: 'running', 'samples', 'interval', 'started_at' and the most
+                frequently sampled 'functions' and 'stacks' (collapsed,
+                root first, usable for flame graphs).
+        """
+        with self.lock:
+            return {
+                "running": self.running,
+                "samples": self.samples,
+                "interval": self.interval,
+                "started_at": self.started_at,
+                "functions": [{"function": name, "samples": count} for name, count in self.functions.most_common(top)],
+                "stacks": [{"stack": stack, "samples": count} for stack, count in self.stacks.most_common(top)]
+            }
+
+
+profiler = SamplingProfiler()
@@ -1,4 +1,5 @@
-from elasticsearch import Elasticsearch
+import time
+from metrics import observe_external
 
 def get_documents_by_ip(elk_host, username, password, ip_address):
     """
@@ -13,12 +14,17 @@ def get_documents_by_ip(elk_host, username, password, ip_address):
     Returns:
         dict: A dictionary with index names as keys and lists of matching documents as values.
     """
+    from elasticsearch import Elasticsearch
+
     es = Elasticsearch(
         elk_host,
         basic_auth=(username, password),
     )
 
-    if not es.ping():
+    start = time.perf_counter()
+    alive = es.ping()
+    observe_external("elasticsearch", "ping", start, "ok" if alive else "error")
+    if not alive:
         raise ConnectionError(f"Unable to connect to Elasticsearch at {elk_host}")
 
     # Indices and their field names
@@ -43,11 +49,14 @@ def get_documents_by_ip(elk_host, username, password, ip_address):
             ]
         }
 
+        start = time.perf_counter()
         try:
             response = es.search(index=index, body=query, size=50)
+            observe_external("elasticsearch", "search", start, "ok")
             documents = [hit["_source"] for hit in response["hits"]["hits"]]
             results[index] = documents
         except Exception as e:
+            observe_external("elasticsearch", "search", start, "error")
             # Log or handle the error for each index
             results[index] = f"Error querying index: {str(e)}"
     return results
@@ -1,27 +1,59 @@
-from flask import Flask, request
-from database import save_event, init_db
-from decision import process_event
-import os
+import logging
+from flask import Blueprint, request
+from database import save_event, save_events
+from decision import process_event, process_events
+from coalescer import coalescer
+from journal import journal
+from suppression import suppression_list
 
-app = Flask(__name__)
+logger = logging.getLogger(__name__)
 
-# Initialize the database
-init_db()
+webhook_blueprint = Blueprint('webhook', __name__)
 
-@app.route('/webhook', methods=['POST'])
+@webhook_blueprint.route('/webhook', methods=['POST'])
 def webhook():
     data = request.get_json()
     if data:
+        try:
+            if suppression_list.check(data):
+                # Ignored source, nothing is saved or scored
+                return {'message': 'Event suppressed'}, 200
+        except Exception as e:
+            logger.error("Error checking suppressions: %s", e)
+        try:
+            # On disk before it is acknowledged, replayed after a crash
+            journal_seq = journal.append(data)
+        except Exception as e:
+            logger.error("Error journaling event: %s", e)
+            return {'message': 'Failed to process event', 'error': str(e)}, 500
+        try:
+            if coalescer.submit(data, journal_seq):
+                # Saved and processed together with its burst when the window closes
+                return {'message': 'Event queued for processing'}, 200
+        except Exception as e:
+            journal.done([journal_seq])
+            logger.error("Error processing event: %s", e)
+            return {'message': 'Failed to process event', 'error': str(e)}, 500
         try:
             save_event(data)  # Save the received data to the database
             process_event(data)  # Process the data instantly
             return {'message': 'Event processed successfully'}, 200
         except Exception as e:
-            print(f"Error processing event: {e}")
+            logger.error("Error processing event: %s", e)
             return {'message': 'Failed to process event', 'error': str(e)}, 500
+        finally:
+            journal.done([journal_seq])
     return {'message': 'No data received'}, 400
 
 
-def run_webhook():
-    port = int(os.environ.get('WEBHOOK_PORT', 5001))
-    app.run(host='0.0.0.0', port=port, debug=True)
+def replay_events(events):
+    """
+    Save and process alerts replayed from the journal, as one batch.
+
+    Args:
+        events (list of dict): Alerts in webhook format.
+    """
+    events = [event for event in events if not suppression_list.is_suppressed(event.get("SourceIP"))]
+    if events:
+        save_events(events)
+        process_events(events)
@@ -0,0 +1,214 @@
+import logging
+import threading
+import requests
+from command_scheduler import prioritized
+from database import save_honeypot_redirect, delete_honeypot_redirects, get_honeypot_redirects
+from expiry import register_remover
+from generator import multipoint_to_singlepoint_intent
+from topology import AUTH, get_onos_base_url, onos_session
+
+logger = logging.getLogger(__name__)
+
+APP_ID = "org.onosproject.cli"
+INTENT_PRIORITY = 200
+
+# Seconds redirects are collected before a honeypot's intent is resubmitted,
+# so a burst of new attackers costs one intent update
+SYNC_DELAY = 0.2
+
+# A failed intent update is retried after RETRY_DELAY seconds, doubled after
+# every further failure up to MAX_RETRY_DELAY
+RETRY_DELAY = 1.0
+MAX_RETRY_DELAY = 60.0
+
+
+def intent_key(honeypot_ip):
+    return f"honeypot-{honeypot_ip}"
+
+
+class RedirectAggregator:
+    """
+    Redirect attackers to a honeypot with one intent per honeypot.
+
+    Each honeypot gets a single MultipointToSinglepointIntent whose ingress
+    points are the attachment points of all attackers redirected to it, so
+    ONOS compiles one intent and installs shared flow entries instead of one
+    PointToPointIntent per attacker. An ONOS selector holds one source IP at
+    most, so attackers are selected by their ingress port. Callers must only
+    add attackers whose port no other (innocent) host is attached to.
+
+    The redirects are stored in the honeypot_redirects table and the intent
+    is rebuilt from there, resubmitted under the same key when the set of
+    ingress points changes and withdrawn when the last attacker is removed.
+    Updates the controller rejects are retried with exponential backoff.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Honeypot IP -> ingress points of the intent last submitted for it
+        self.installed = {}
+        # Honeypot IP -> timer of the pending sync
+        self.pending = {}
+        # Honeypot IP -> consecutive failed syncs
+        self.failures = {}
+
+    def add(self, source_ip, honeypot_ip, source_location, honeypot_location):
+        """
+        Add an attacker to its honeypot's intent.
+
+        Args:
+            source_ip (str): The attacker's IP address.
+            honeypot_ip (str): The honeypot IP address.
+            source_location (dict): The attacker's location from the topology ('elementId', 'port').
+            honeypot_location (dict): The honeypot's location from the topology.
+        """
+        save_honeypot_redirect(
+            source_ip, honeypot_ip,
+            source_location["elementId"], source_location["port"],
+            honeypot_location["elementId"], honeypot_location["port"]
+        )
+        self._schedule_sync(honeypot_ip)
+
+    def remove(self, source_ips):
+        """
+        Remove attackers from their honeypots' intents.
+
+        Args:
+            source_ips (list of str): The attackers' IP addresses.
+
+        Returns:
+            dict: The honeypot IP of each attacker that was redirected.
+        """
+        honeypots = delete_honeypot_redirects(source_ips)
+        for honeypot_ip in set(honeypots.values()):
+            self._schedule_sync(honeypot_ip)
+        return honeypots
+
+    def _schedule_sync(self, honeypot_ip, delay=SYNC_DELAY):
+        with self.lock:
+            if honeypot_ip in self.pending:
+                return
+            timer = threading.Timer(delay, self.sync, [honeypot_ip])
+            timer.daemon = True
+            self.pending[honeypot_ip] = timer
+        timer.start()
+
+    def flush(self):
+        """
+        Submit every pending intent update now.
+        """
+        with self.lock:
+            pending = list(self.pending)
+        for honeypot_ip in pending:
+            self.sync_now(honeypot_ip)
+
+    def sync_now(self, honeypot_ip):
+        """
+        Submit a honeypot's pending intent update now instead of after its delay.
+
+        Returns:
+            bool: True if the controller holds the expected intent.
+        """
+        with self.lock:
+            timer = self.pending.pop(honeypot_ip, None)
+        if timer is not None:
+            timer.cancel()
+        return self.sync(honeypot_ip)
+
+    @prioritized("redirect")
+    def sync(self, honeypot_ip):
+        """
+        Bring the honeypot's intent in line with the stored redirects.
+
+        A failure schedules another attempt, RETRY_DELAY seconds later for
+        the first one and twice as long after each further one.
+
+        Args:
+            honeypot_ip (str): The honeypot IP address.
+
+        Returns:
+            bool: True if the controller holds the expected intent.
+        """
+        with self.lock:
+            self.pending.pop(honeypot_ip, None)
+        ok = self._sync(honeypot_ip)
+        with self.lock:
+            if ok:
+                self.failures.pop(honeypot_ip, None)
+                return True
+            failures = self.failures[honeypot_ip] = self.failures.get(honeypot_ip, 0) + 1
+        delay = min(RETRY_DELAY * 2 ** (failures - 1), MAX_RETRY_DELAY)
+        logger.warning("Retrying the honeypot intent update for %s in %s s", honeypot_ip, delay)
+        self._schedule_sync(honeypot_ip, delay)
+        return False
+
+    def _sync(self, honeypot_ip):
+        try:
+            rows = get_honeypot_redirects(honeypot_ip)
+            points = sorted({(device_id, port) for _, device_id, port, _, _ in rows})
+            if points == self.installed.get(honeypot_ip):
+                return True
+            if not points:
+                return self._withdraw(honeypot_ip)
+
+            # The honeypot's own port cannot be an ingress point of its intent
+            egress_device, egress_port = rows[-1][3], rows[-1][4]
+            ingress_points = [{"device": device_id, "port": port} for device_id, port in points
+                              if (device_id, port) != (egress_device, egress_port)]
+            intent = multipoint_to_singlepoint_intent(
+                APP_ID, INTENT_PRIORITY, ingress_points, egress_device, egress_port,
+                filename=None, key=intent_key(honeypot_ip),
+                criteria=[{"type": "ETH_TYPE", "ethType": "0x0800"}]
+            )
+            response = onos_session.post(
+                f"{get_onos_base_url()}/intents", auth=AUTH,
+                headers={"Content-Type": "application/json"}, data=intent
+            )
+            if response.status_code not in (200, 201):
+                logger.error("Failed to submit honeypot intent for %s: %s %s",
+                             honeypot_ip, response.status_code, response.text)
+                return False
+            self.installed[honeypot_ip] = points
+            logger.info("Honeypot intent for %s covers %s attackers on %s ingress points",
+                        honeypot_ip, len(rows), len(ingress_points))
+            return True
+        except Exception as e:
+            logger.error("Error updating honeypot intent for %s: %s", honeypot_ip, e)
+            return False
+
+    def _withdraw(self, honeypot_ip):
+        url = f"{get_onos_base_url()}/intents/{APP_ID}/{intent_key(honeypot_ip)}"
+        try:
+            response = onos_session.delete(url, auth=AUTH)
+        except requests.exceptions.RequestException as e:
+            logger.error("Error withdrawing honeypot intent for %s: %s", honeypot_ip, e)
+            return False
+        if response.status_code not in (200, 204, 404):
+            logger.error("Failed to withdraw honeypot intent for %s: %s", honeypot_ip, response.text)
+            return False
+        self.installed[honeypot_ip] = []
+        logger.info("Withdrew honeypot intent for %s", honeypot_ip)
+        return True
+
+
+aggregator = RedirectAggregator()
+
+
+def remove_expired_redirects(handles):
+    # Removes the attackers together, each honeypot's intent is updated once
+    honeypots = aggregator.remove([handle["source_ip"] for handle in handles])
+    synced = {}
+    results = []
+    for handle in handles:
+        # Attackers already deleted by an earlier attempt are only known from their handle
+        honeypot_ip = honeypots.get(handle["source_ip"], handle.get("honeypot_ip"))
+        if honeypot_ip is None:
+            results.append(True)
+            continue
+        if honeypot_ip not in synced:
+            synced[honeypot_ip] = aggregator.sync_now(honeypot_ip)
+        results.append(synced[honeypot_ip])
+    return results
+
+
+register_remover("honeypot_redirect", remove_expired_redirects)
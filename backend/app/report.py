@@ -1,6 +1,5 @@
 from flask import jsonify, make_response
-import pdfkit  # For generating PDFs
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from database import get_anomalies, get_actions
 
 class ReportGenerator:
@@ -33,11 +32,13 @@ class ReportGenerator:
         Returns:
             dict: The report data.
         """
+        # Only the partitions covering the last 30 days (stored in UTC) are read
+        since = (datetime.now(timezone.utc) - timedelta(days=31)).strftime("%Y-%m-%d %H:%M:%S")
         if report_type == 'anomalies':
-            anomalies = get_anomalies()
+            anomalies = get_anomalies(since=since)
             data = self.filter_data_by_monthly(anomalies)
         elif report_type == 'actions':
-            actions = get_actions()
+            actions = get_actions(since=since)
             data = self.filter_data_by_monthly(actions)
         else:
             raise ValueError("Invalid report type")
@@ -67,6 +68,8 @@ class ReportGenerator:
             </html>
             """
         else:
+            # Shown for empty cells, kept out of the nested f-strings below
+            missing = "N/A"
             html_content = f"""
             <html>
             <head><title>{report_type.capitalize()} Report</title></head>
@@ -78,13 +81,15 @@ class ReportGenerator:
                         <tr>{"".join(f"<th>{key.capitalize()}</th>" for key in report_data['data'][0].keys() if key)}</tr>
                     </thead>
                     <tbody>
-                        {"".join(f"<tr>{''.join(f'<td>{value if value is not None else "N/A"}</td>' for value in item.values())}</tr>" for item in report_data['data'])}
+                        {"".join(f"<tr>{''.join(f'<td>{value if value is not None else missing}</td>' for value in item.values())}</tr>" for item in report_data['data'])}
                     </tbody>
                 </table>
             </body>
             </html>
             """
         try:
+            # Imported here, PDF generation is rare and pdfkit is slow to load
+            import pdfkit
             pdf_content = pdfkit.from_string(html_content, False)
             return pdf_content
         except Exception as e:
@@ -0,0 +1,175 @@
+import gzip
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from database import DB_PATH, PARTITIONED_TABLES, drop_partition, get_partitions, get_setting_value, month_bounds, read_partition, roll_over_partitions
+from log_setup import new_correlation_id
+
+logger = logging.getLogger(__name__)
+
+# Directory of archived partitions, NETSECFLOW_ARCHIVE_DIR overrides it
+ARCHIVE_DIR = os.path.abspath(os.environ.get("NETSECFLOW_ARCHIVE_DIR", DB_PATH + ".archive"))
+
+# Rows stay in the hot events and actions tables this many days unless the
+# "Hot Data Days" setting says otherwise
+DEFAULT_HOT_DAYS = 30
+
+# Partitions are archived once their month ended this many days ago unless
+# the "Retention Days" setting says otherwise, 0 keeps them forever
+DEFAULT_RETENTION_DAYS = 365
+
+# Seconds between maintenance runs
+MAINTENANCE_INTERVAL = 60 * 60
+
+_maintenance_stop = threading.Event()
+
+
+def _days_setting(key, default):
+    value = get_setting_value(key)
+    try:
+        return max(float(value), 0.0) if value else default
+    except ValueError:
+        return default
+
+
+def get_hot_days():
+    """
+    Retrieve how many days rows stay in the hot tables.
+
+    Returns:
+        float: The number of days, 0 moves everything to the partitions.
+    """
+    return _days_setting("Hot Data Days", DEFAULT_HOT_DAYS)
+
+
+def get_retention_days():
+    """
+    Retrieve how many days partitions are kept in the database before being archived.
+
+    Returns:
+        float: The number of days, 0 if partitions are never archived.
+    """
+    return _days_setting("Retention Days", DEFAULT_RETENTION_DAYS)
+
+
+def _timestamp(moment):
+    # Same format and timezone as SQLite's CURRENT_TIMESTAMP
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def archive_partition(name, directory=ARCHIVE_DIR):
+    """
+    Write a partition to a gzip-compressed NDJSON file, one row per line.
+
+    Args:
+        name (str): The partition name, e.g. 'events_2024_05'.
+        directory (str): Where the archive is written.
+
+    Returns:
+        str: The path of the archive, e.g. '.../events_2024_05.ndjson.gz'.
+    """
+    columns, rows = read_partition(name)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}.ndjson.gz")
+    copy = 1
+    # Rows moved into a month after it was archived go to a second file
+    while os.path.exists(path):
+        copy += 1
+        path = os.path.join(directory, f"{name}-{copy}.ndjson.gz")
+    # Written under a temporary name so a partial archive is never mistaken for a complete one
+    with gzip.open(path + ".tmp", "wt", encoding="utf-8") as handle:
+        for row in rows:
+            handle.write(json.dumps(dict(zip(columns, row)), separators=(",", ":")))
+            handle.write("\n")
+    os.replace(path + ".tmp", path)
+    logger.info("Archived %s rows of %s to %s", len(rows), name, path)
+    return path
+
+
+def read_archive(path):
+    """
+    Read the rows of an archived partition.
+
+    Args:
+        path (str): The path returned by archive_partition.
+
+    Yields:
+        dict: One row, keyed by column name.
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as handle:
+        for line in handle:
+            yield json.loads(line)
+
+
+def run_maintenance(now=None):
+    """
+    Move old rows out of the hot tables and archive the partitions past retention.
+
+    Rows older than the hot window are moved to their monthly partitions.
+    Partitions whose month ended more than the retention period ago are
+    archived to ARCHIVE_DIR and dropped from the database.
+
+    Args:
+        now (datetime, optional): Current time, aware or UTC.
+
+    Returns:
+        dict: Counts of rows 'moved' and partitions 'archived'.
+    """
+    now = now or datetime.now(timezone.utc)
+    hot_cutoff = _timestamp(now - timedelta(days=get_hot_days()))
+    retention_days = get_retention_days()
+    retention_cutoff = _timestamp(now - timedelta(days=retention_days)) if retention_days else None
+
+    result = {"moved": 0, "archived": 0}
+    for table in PARTITIONED_TABLES:
+        result["moved"] += roll_over_partitions(table, hot_cutoff)
+        if retention_cutoff is None:
+            continue
+        for month, name in get_partitions(table):
+            _, end = month_bounds(month)
+            if end <= retention_cutoff:
+                archive_partition(name)
+                drop_partition(table, name)
+                result["archived"] += 1
+    if result["moved"] or result["archived"]:
+        logger.info("Moved %s rows to partitions and archived %s partitions", result["moved"], result["archived"])
+    return result
+
+
+def start_maintenance(interval=MAINTENANCE_INTERVAL, is_leader=None):
+    """
+    Run run_maintenance at startup and then periodically in a daemon thread.
+
+    Args:
+        interval (float): Seconds between runs.
+        is_leader (callable, optional): Checked before every run when several
+            server processes share the database, so only one of them runs it.
+
+    Returns:
+        threading.Thread: The started thread.
+    """
+    _maintenance_stop.clear()
+
+    def run():
+        while True:
+            try:
+                if is_leader is None or is_leader():
+                    new_correlation_id()
+                    run_maintenance()
+            except Exception as e:
+                logger.error("Error running storage maintenance: %s", e)
+            if _maintenance_stop.wait(interval):
+                break
+
+    thread = threading.Thread(target=run, name="storage-maintenance", daemon=True)
+    thread.start()
+    return thread
+
+
+def stop_maintenance():
+    """
+    Stop the maintenance thread after its current run.
+    """
+    _maintenance_stop.set()
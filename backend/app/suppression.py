@@ -0,0 +1,168 @@
+import ipaddress
+import logging
+import threading
+import time
+from database import delete_suppression, get_suppressions, get_version, save_suppression
+from metrics import counter
+
+logger = logging.getLogger(__name__)
+
+EVENTS_SUPPRESSED = counter("netsecflow_events_suppressed_total", "Alerts dropped on arrival because their source IP is suppressed.")
+
+
+def parse_network(value):
+    """
+    Parse an IP address or CIDR network to suppress.
+
+    Args:
+        value (str): e.g. '10.0.0.5' or '10.0.0.0/24'.
+
+    Returns:
+        ipaddress.IPv4Network or IPv6Network: The network, a single address
+            being a /32 or /128.
+
+    Raises:
+        ValueError: If the value is neither.
+    """
+    return ipaddress.ip_network(str(value).strip(), strict=False)
+
+
+def _stored_form(network):
+    # Single addresses are stored without their /32 or /128
+    return str(network.network_address) if network.num_addresses == 1 else str(network)
+
+
+class SuppressionList:
+    """
+    In-memory copy of the suppressions table, checked for every received alert.
+
+    Single addresses are kept in a dict keyed by their text, so the common
+    case is one hash lookup on the alert's SourceIP without parsing it.
+    Networks are grouped by prefix length and keyed by their network
+    address, so an address is matched with one lookup per prefix length in
+    use. The copy is rebuilt when the suppressions resource version changes,
+    which also covers writes made by other server processes.
+    """
+
+    def __init__(self):
+        self.version = None
+        # Address text -> expiry timestamp or None
+        self.addresses = {}
+        # (IP version, prefix length) -> {network address as int: expiry timestamp or None}
+        self.networks = {}
+        self.lock = threading.Lock()
+
+    def _refresh(self):
+        version, _ = get_version("suppressions")
+        if version == self.version:
+            return
+        with self.lock:
+            if version == self.version:
+                return
+            addresses, networks = {}, {}
+            for row in get_suppressions():
+                network = parse_network(row["network"])
+                if network.num_addresses == 1:
+                    addresses[str(network.network_address)] = row["expires_at"]
+                else:
+                    prefixes = networks.setdefault((network.version, network.prefixlen), {})
+                    prefixes[int(network.network_address)] = row["expires_at"]
+            self.addresses, self.networks = addresses, networks
+            self.version = version
+        logger.debug("Loaded %s suppressed addresses and %s networks",
+                     len(addresses), sum(len(prefixes) for prefixes in networks.values()))
+
+    def is_suppressed(self, source_ip):
+        """
+        Tell whether alerts from an IP are suppressed.
+
+        Args:
+            source_ip (str): The alert's source IP.
+
+        Returns:
+            bool: True if the IP or a network containing it is suppressed.
+        """
+        if not source_ip:
+            return False
+        self._refresh()
+        addresses, networks = self.addresses, self.networks
+        if not addresses and not networks:
+            return False
+
+        now = time.time()
+        if source_ip in addresses:
+            expires_at = addresses[source_ip]
+            if expires_at is None or expires_at > now:
+                return True
+        if not networks:
+            return False
+        try:
+            address = ipaddress.ip_address(source_ip)
+        except ValueError:
+            return False
+        value, bits = int(address), address.max_prefixlen
+        for (version, prefixlen), prefixes in networks.items():
+            if version != address.version:
+                continue
+            # Clear the host bits to get the address of the enclosing /prefixlen network
+            key = value >> (bits - prefixlen) << (bits - prefixlen)
+            if key in prefixes:
+                expires_at = prefixes[key]
+                if expires_at is None or expires_at > now:
+                    return True
+        return False
+
+    def check(self, event):
+        """
+        Tell whether an alert must be dropped, counting it if so.
+
+        Args:
+            event (dict): The alert received from the webhook.
+
+        Returns:
+            bool: True if its SourceIP is suppressed.
+        """
+        if self.is_suppressed(event.get("SourceIP")):
+            EVENTS_SUPPRESSED.inc()
+            return True
+        return False
+
+    def add(self, value, reason=None, duration=None):
+        """
+        Suppress the alerts of an IP address or network.
+
+        Args:
+            value (str): An IP address or CIDR network.
+            reason (str, optional): Why its alerts are suppressed.
+            duration (float, optional): Seconds until the suppression ends, never if omitted.
+
+        Returns:
+            str: The network as stored, e.g. '10.0.0.0/24' or '10.0.0.5'.
+
+        Raises:
+            ValueError: If the value is not an IP address or network.
+        """
+        stored = _stored_form(parse_network(value))
+        expires_at = time.time() + duration if duration else None
+        save_suppression(stored, reason, expires_at)
+        logger.info("Suppressing alerts from %s", stored)
+        return stored
+
+    def remove(self, value):
+        """
+        Stop suppressing an IP address or network.
+
+        Args:
+            value (str): The IP address or CIDR network.
+
+        Returns:
+            bool: True if it was suppressed.
+
+        Raises:
+            ValueError: If the value is not an IP address or network.
+        """
+        stored = _stored_form(parse_network(value))
+        return delete_suppression(stored)
+
+
+suppression_list = SuppressionList()
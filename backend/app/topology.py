@@ -1,15 +1,31 @@
-import requests
-from database import get_setting_value
+import os
+from database import get_cached_setting
+from command_scheduler import ScheduledSession
 
 
-# ONOS Controller URL and authentication
-ONOS_CONTROLLER_IP = get_setting_value("SDN Controller IP")
-ONOS_BASE_URL = f'http://{ONOS_CONTROLLER_IP}:8181/onos/v1'
+# ONOS Controller authentication
 AUTH = ('', '')  # Replace with your ONOS credentials
 
+# Port of the ONOS REST API
+ONOS_PORT = int(os.environ.get("NETSECFLOW_ONOS_PORT", "8181"))
+
+# Shared by every ONOS request, reuses connections, records request metrics
+# and admits requests by priority within the controller's rate limit
+onos_session = ScheduledSession("onos", "/onos/v1")
+
+def get_onos_base_url():
+    """
+    Build the ONOS REST API URL from the 'SDN Controller IP' setting and
+    NETSECFLOW_ONOS_PORT.
+
+    The setting is read on first use rather than at import, so importing
+    this module needs no database and picks up a changed controller IP.
+    """
+    return f'http://{get_cached_setting("SDN Controller IP")}:{ONOS_PORT}/onos/v1'
+
 # Function to fetch devices (switches) from ONOS
 def fetch_devices():
-    devices_response = requests.get(f"{ONOS_BASE_URL}/devices", auth=AUTH)
+    devices_response = onos_session.get(f"{get_onos_base_url()}/devices", auth=AUTH)
     devices = devices_response.json().get('devices', [])
     
     processed_devices = []
@@ -34,7 +50,7 @@ def fetch_devices():
 
 # Function to fetch links (connections) from ONOS
 def fetch_links():
-    links_response = requests.get(f"{ONOS_BASE_URL}/links", auth=AUTH)
+    links_response = onos_session.get(f"{get_onos_base_url()}/links", auth=AUTH)
     links = links_response.json().get('links', [])
     
     processed_links = []
@@ -51,7 +67,7 @@ def fetch_links():
 
 # Function to fetch hosts from ONOS
 def fetch_hosts():
-    hosts_response = requests.get(f"{ONOS_BASE_URL}/hosts", auth=AUTH)
+    hosts_response = onos_session.get(f"{get_onos_base_url()}/hosts", auth=AUTH)
     hosts = hosts_response.json().get('hosts', [])
     
     processed_hosts = []
@@ -0,0 +1,92 @@
+"""
+Startup profile of the backend: how long importing each module takes.
+
+Imports run.py (or another module) in a fresh interpreter with
+python -X importtime and reports the cumulative import time of the backend's
+own modules and of the slowest third-party packages. The database path
+points at a file that does not exist, so any module still touching the
+database at import shows up as a failure.
+
+Example:
+    python benchmarks/import_profile.py --top 15
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCHMARK_DIR)
+APP_DIR = os.path.join(BACKEND_DIR, "app")
+
+
+def backend_modules():
+    names = {"run", "serve", "app"}
+    for filename in os.listdir(APP_DIR):
+        if filename.endswith(".py") and filename != "__init__.py":
+            names.add(filename[:-3])
+    return names
+
+
+def parse_importtime(output):
+    """
+    Parse the stderr of python -X importtime.
+
+    Returns:
+        list of tuple: (module, self_us, cumulative_us, depth) per import.
+    """
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return imports
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="netsecflow-import-")
+    missing_db = os.path.join(workdir, "missing", "netsecflow.db")
+    env = dict(os.environ, NETSECFLOW_DB_PATH=missing_db)
+
+    code = f"import sys; sys.path.insert(1, {APP_DIR!r}); import {args.module}"
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+
+    imports = parse_importtime(result.stderr)
+    ours = backend_modules()
+    own = [entry for entry in imports if entry[0] in ours]
+    # Only top-level packages, their submodules are included in the cumulative time
+    third_party = [entry for entry in imports
+                   if entry[0] not in ours and "." not in entry[0] and entry[3] > 0]
+
+    print(f"Module:              {args.module}")
+    print(f"Interpreter + import: {wall * 1000:.0f} ms")
+    print(f"Imports:             {len(imports)}")
+    print("Backend modules (cumulative):")
+    for name, self_us, cumulative_us, _ in sorted(own, key=lambda entry: -entry[2]):
+        print(f"  {name:<24} {cumulative_us / 1000:8.1f} ms  (self {self_us / 1000:.1f} ms)")
+    print(f"Slowest packages (top {args.top}):")
+    for name, _, cumulative_us, _ in sorted(third_party, key=lambda entry: -entry[2])[:args.top]:
+        print(f"  {name:<24} {cumulative_us / 1000:8.1f} ms")
+
+    if result.returncode != 0:
+        print("Import failed:")
+        print("\n".join(line for line in result.stderr.splitlines() if not line.startswith("import time:")))
+        return 1
+    if os.path.exists(missing_db) or os.path.exists(os.path.dirname(missing_db)):
+        print("Warning: the database was touched during import")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report import time per backend module.")
+    parser.add_argument("--module", default="run", help="Module to import, e.g. run or reception")
+    parser.add_argument("--top", type=int, default=10, help="Number of third-party packages to list")
+    sys.exit(run(parser.parse_args()))
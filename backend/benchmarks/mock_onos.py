@@ -0,0 +1,263 @@
+"""
+Local stand-in for the ONOS REST API used by the benchmarks.
+
+Serves a generated linear topology and accepts the ACL, meter, flow and
+intent calls made by controller_actions, with a configurable delay per
+request. Every request is counted so benchmarks can report controller load.
+
+Run standalone with:
+    python benchmarks/mock_onos.py --port 8181 --switches 10 --latency 0.005
+"""
+import argparse
+import itertools
+import json
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+API_PREFIX = "/onos/v1"
+
+
+def device_id(index):
+    return f"of:{index:016x}"
+
+
+def build_topology(switches=10, hosts_per_switch=10):
+    """
+    Generate a linear topology of switches with hosts attached to each.
+
+    Args:
+        switches (int): Number of switches in the chain.
+        hosts_per_switch (int): Number of hosts attached to every switch.
+
+    Returns:
+        dict: 'devices', 'links' and 'hosts' in the shape ONOS returns them.
+    """
+    devices = [
+        {"id": device_id(i), "type": "SWITCH", "available": True, "role": "MASTER",
+         "mfr": "Nicira, Inc.", "hw": "Open vSwitch", "sw": "2.17.0", "serial": "None",
+         "driver": "ovs", "chassisId": str(i), "annotations": {}}
+        for i in range(1, switches + 1)
+    ]
+    links = []
+    for i in range(1, switches):
+        # Port 1 of each switch faces the previous switch, port 2 the next one
+        for src, dst, src_port, dst_port in ((i, i + 1, "2", "1"), (i + 1, i, "1", "2")):
+            links.append({
+                "src": {"device": device_id(src), "port": src_port},
+                "dst": {"device": device_id(dst), "port": dst_port},
+                "type": "DIRECT", "state": "ACTIVE", "annotations": {"latency": "1"}
+            })
+    hosts = []
+    for i in range(1, switches + 1):
+        for j in range(1, hosts_per_switch + 1):
+            mac = f"00:00:00:00:{i:02x}:{j:02x}"
+            hosts.append({
+                "id": f"{mac}/None", "mac": mac, "vlan": "None",
+                "ipAddresses": [f"10.0.{i}.{j}"],
+                "locations": [{"elementId": device_id(i), "port": str(j + 2)}]
+            })
+    return {"devices": devices, "links": links, "hosts": hosts}
+
+
+class MockOnosState:
+    """
+    In-memory controller state shared by all request handlers.
+    """
+
+    def __init__(self, topology, latency=0.0):
+        self.topology = topology
+        self.latency = latency
+        self.calls = Counter()
+        self.ids = itertools.count(1)
+        self.acl_rules = {}
+        self.meters = {}
+        self.flows = {}
+        self.intents = {}
+        self.lock = threading.Lock()
+
+    def count(self, method, path):
+        # Collapse device and rule ids so calls group by endpoint
+        endpoint = re.sub(r"/(of:[0-9a-f]+|\d+)(?=/|$)", "/{id}", path)
+        with self.lock:
+            self.calls[f"{method} {endpoint}"] += 1
+
+    def next_id(self):
+        with self.lock:
+            return next(self.ids)
+
+
+class MockOnosHandler(BaseHTTPRequestHandler):
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length else b""
+        return json.loads(body) if body else {}
+
+    def _send(self, status, payload=None, location=None):
+        body = json.dumps(payload).encode() if payload is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if location:
+            self.send_header("Location", f"http://{self.headers.get('Host', 'localhost')}{API_PREFIX}/{location}")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _route(self, method):
+        path = self.path.split("?")[0]
+        if not path.startswith(API_PREFIX):
+            return self._send(404, {"error": "not found"})
+        path = path[len(API_PREFIX):].rstrip("/")
+        state = self.state
+        state.count(method, path)
+        if state.latency:
+            time.sleep(state.latency)
+
+        parts = path.strip("/").split("/")
+        resource = parts[0]
+        if method == "GET" and resource in ("devices", "links", "hosts"):
+            return self._send(200, {resource: state.topology[resource]})
+        if method == "GET" and resource == "topology":
+            topology = state.topology
+            return self._send(200, {"time": int(time.time() * 1000), "devices": len(topology["devices"]),
+                                    "links": len(topology["links"]), "clusters": 1})
+        if resource == "acl":
+            return self._acl(method, parts)
+        if resource == "meters":
+            return self._meters(method, parts)
+        if resource == "flows":
+            return self._flows(method, parts)
+        if resource == "intents":
+            return self._intents(method, parts)
+        return self._send(404, {"error": "not found"})
+
+    def _acl(self, method, parts):
+        state = self.state
+        if method == "GET":
+            return self._send(200, {"aclRules": list(state.acl_rules.values())})
+        if method == "POST":
+            rule = self._read_json()
+            rule["id"] = str(state.next_id())
+            state.acl_rules[rule["id"]] = rule
+            return self._send(201, location=f"acl/rules/{rule['id']}")
+        if method == "DELETE" and len(parts) > 2:
+            if state.acl_rules.pop(parts[2], None) is None:
+                return self._send(404)
+            return self._send(204)
+        return self._send(405)
+
+    def _meters(self, method, parts):
+        state = self.state
+        device = parts[1] if len(parts) > 1 else None
+        if method == "POST" and device:
+            meter = self._read_json()
+            meter["id"] = str(state.next_id())
+            state.meters.setdefault(device, []).append(meter)
+            return self._send(201, location=f"meters/{device}/{meter['id']}")
+        if method == "GET":
+            meters = state.meters.get(device, []) if device else sum(state.meters.values(), [])
+            return self._send(200, {"meters": meters})
+        if method == "DELETE" and len(parts) > 2:
+            meters = state.meters.get(device, [])
+            state.meters[device] = [meter for meter in meters if meter["id"] != parts[2]]
+            return self._send(204 if len(state.meters[device]) < len(meters) else 404)
+        return self._send(405)
+
+    def _flows(self, method, parts):
+        state = self.state
+        if method == "GET" and len(parts) > 2:
+            flow = state.flows.get(parts[2])
+            return self._send(200, {"flows": [flow]}) if flow else self._send(404)
+        if method == "GET":
+            return self._send(200, {"flows": list(state.flows.values())})
+        if method == "POST" and len(parts) > 1:
+            flow = self._read_json()
+            flow["id"] = str(state.next_id())
+            flow["deviceId"] = parts[1]
+            flow["state"] = "ADDED"
+            state.flows[flow["id"]] = flow
+            return self._send(201, location=f"flows/{parts[1]}/{flow['id']}")
+        if method == "POST":
+            # Batch submission: {"flows": [...]}
+            created = []
+            for flow in self._read_json().get("flows", []):
+                flow["id"] = str(state.next_id())
+                flow["state"] = "ADDED"
+                state.flows[flow["id"]] = flow
+                created.append({"deviceId": flow.get("deviceId"), "flowId": flow["id"]})
+            return self._send(200, {"flows": created})
+        if method == "DELETE" and len(parts) > 2:
+            state.flows.pop(parts[2], None)
+            return self._send(204)
+        if method == "DELETE":
+            # Batch removal: {"flows": [{"deviceId": ..., "flowId": ...}]}
+            for flow in self._read_json().get("flows", []):
+                state.flows.pop(str(flow.get("flowId")), None)
+            return self._send(204)
+        return self._send(405)
+
+    def _intents(self, method, parts):
+        state = self.state
+        if method == "GET":
+            return self._send(200, {"intents": list(state.intents.values())})
+        if method == "POST":
+            intent = self._read_json()
+            # Submitting an intent under an existing key replaces it
+            intent["id"] = intent.get("key") or str(state.next_id())
+            state.intents[intent["id"]] = intent
+            return self._send(201, location=f"intents/{intent.get('appId', 'org.onosproject.cli')}/{intent['id']}")
+        if method == "DELETE" and len(parts) > 2:
+            if state.intents.pop(parts[-1], None) is None:
+                return self._send(404)
+            return self._send(204)
+        return self._send(405)
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_PUT(self):
+        self._route("PUT")
+
+    def do_DELETE(self):
+        self._route("DELETE")
+
+
+def start_mock_onos(host="127.0.0.1", port=8181, switches=10, hosts_per_switch=10, latency=0.0):
+    """
+    Start the mock controller in a background thread.
+
+    Returns:
+        tuple: (server, state). Call server.shutdown() to stop it.
+    """
+    state = MockOnosState(build_topology(switches, hosts_per_switch), latency)
+    handler = type("BoundMockOnosHandler", (MockOnosHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-onos", daemon=True).start()
+    return server, state
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a mock ONOS REST API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8181)
+    parser.add_argument("--switches", type=int, default=10)
+    parser.add_argument("--hosts-per-switch", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before answering each request")
+    args = parser.parse_args()
+    server, _ = start_mock_onos(args.host, args.port, args.switches, args.hosts_per_switch, args.latency)
+    print(f"Mock ONOS listening on http://{args.host}:{args.port}{API_PREFIX}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
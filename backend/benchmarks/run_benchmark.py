@@ -0,0 +1,188 @@
+"""
+Throughput benchmark for the alert path:
+/webhook -> save_event -> process_event -> controller.
+
+Runs the webhook app in-process against a scratch SQLite database (or a copy
+of an existing one) and the mock ONOS server, replays synthetic SIEM alerts and reports events/sec,
+end-to-end latency percentiles, time spent in database helpers and the
+number of controller calls per endpoint.
+
+Example:
+    python benchmarks/run_benchmark.py --events 5000 --concurrency 8 --latency 0.005
+"""
+import argparse
+import functools
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCHMARK_DIR)
+APP_DIR = os.path.join(BACKEND_DIR, "app")
+sys.path.insert(1, APP_DIR)
+sys.path.insert(1, BACKEND_DIR)
+sys.path.insert(1, BENCHMARK_DIR)
+
+from mock_onos import start_mock_onos
+from siem_generator import generator_for_topology
+
+
+class DatabaseTimer:
+    """
+    Accumulate the time spent in each database helper.
+    """
+
+    def __init__(self):
+        self.seconds = Counter()
+        self.calls = Counter()
+        self.lock = threading.Lock()
+
+    def wrap(self, name, function):
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                with self.lock:
+                    self.seconds[name] += elapsed
+                    self.calls[name] += 1
+        return timed
+
+    def instrument(self, database, modules):
+        """
+        Replace the database helpers imported by each module with timed wrappers.
+        """
+        helpers = {
+            name: value for name, value in vars(database).items()
+            if callable(value) and getattr(value, "__module__", None) == database.__name__
+        }
+        wrapped = {name: self.wrap(name, function) for name, function in helpers.items()}
+        for module in modules:
+            for name, function in helpers.items():
+                if vars(module).get(name) is function:
+                    setattr(module, name, wrapped[name])
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(int(round(fraction * (len(values) - 1))), len(values) - 1)
+    return values[index]
+
+
+def copy_database(source, target):
+    """
+    Copy a database so the benchmark never changes the original's settings,
+    events or reputations.
+    """
+    with sqlite3.connect(f"file:{source}?mode=ro", uri=True) as src, sqlite3.connect(target) as dst:
+        src.backup(dst)
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="netsecflow-bench-")
+    db_path = os.path.join(workdir, "netsecflow.db")
+    if args.db:
+        copy_database(os.path.abspath(args.db), db_path)
+    # Intent files are written to the working directory
+    os.chdir(workdir)
+    # Read when the backend modules are imported below
+    os.environ["NETSECFLOW_DB_PATH"] = db_path
+    os.environ["NETSECFLOW_ONOS_PORT"] = str(args.port)
+
+    server, onos = start_mock_onos(port=args.port, switches=args.switches,
+                                   hosts_per_switch=args.hosts_per_switch, latency=args.latency)
+    generator = generator_for_topology(onos.topology, attackers=args.attackers, seed=args.seed)
+    honeypot_ip = onos.topology["hosts"][-1]["ipAddresses"][0]
+
+    import database
+    from log_setup import configure_logging
+    configure_logging(level=args.log_level)
+    database.init_db()
+    database.save_settings({
+        "Mode": args.mode,
+        "Honeypot IP Address": honeypot_ip,
+        "SDN Controller IP": "127.0.0.1",
+        "Coalesce Window": str(args.coalesce_window)
+    })
+
+    import controller_actions
+    import decision
+    import coalescer
+    import reception
+    from app import create_app
+
+    if args.journal:
+        from journal import journal
+        journal.open()
+
+    timer = DatabaseTimer()
+    timer.instrument(database, [controller_actions, decision, coalescer, reception])
+    webhook_app = create_app(reception.webhook_blueprint)
+
+    alerts = generator.alerts(args.events)
+    local = threading.local()
+    latencies = []
+    statuses = Counter()
+    lock = threading.Lock()
+
+    def post(alert):
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = webhook_app.test_client()
+        start = time.perf_counter()
+        response = client.post("/webhook", json=alert)
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            statuses[response.status_code] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(post, alerts))
+    # Anything still held in a coalescing window counts towards the run
+    coalescer.coalescer.flush()
+    wall = time.perf_counter() - start
+    if args.journal:
+        journal.close()
+    server.shutdown()
+
+    controller_calls = sum(onos.calls.values())
+    print(f"Events:              {args.events} ({dict(statuses)})")
+    print(f"Concurrency:         {args.concurrency}")
+    print(f"Wall time:           {wall:.3f} s")
+    print(f"Throughput:          {args.events / wall:.1f} events/s")
+    print(f"Latency p50:         {percentile(latencies, 0.50) * 1000:.2f} ms")
+    print(f"Latency p99:         {percentile(latencies, 0.99) * 1000:.2f} ms")
+    print(f"DB time:             {sum(timer.seconds.values()):.3f} s in {sum(timer.calls.values())} calls")
+    for name, seconds in timer.seconds.most_common():
+        print(f"  {name:<24} {seconds:8.3f} s {timer.calls[name]:8d} calls")
+    print(f"Controller calls:    {controller_calls}")
+    for endpoint, count in onos.calls.most_common():
+        print(f"  {endpoint:<32} {count:8d}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the webhook to controller path.")
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--attackers", type=int, default=50)
+    parser.add_argument("--mode", default="balanced", choices=["strict", "balanced", "loose"])
+    parser.add_argument("--coalesce-window", type=float, default=0.0, help="Seconds, 0 disables coalescing")
+    parser.add_argument("--latency", type=float, default=0.0, help="Mock controller delay per request in seconds")
+    parser.add_argument("--switches", type=int, default=10)
+    parser.add_argument("--hosts-per-switch", type=int, default=10)
+    parser.add_argument("--port", type=int, default=8181, help="Port of the mock controller")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--db", help="Database to start from, a scratch copy is used and the file is left unchanged")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--journal", action="store_true", help="Journal alerts before acknowledging them")
+    run(parser.parse_args())
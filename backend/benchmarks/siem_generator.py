@@ -0,0 +1,88 @@
+"""
+Synthetic SIEM alert generator for the benchmarks.
+
+Alerts follow the webhook format (Source, Event, Score, SourceIP,
+DestinationIP). Sources are drawn with weights resembling a real deployment,
+where flow and log based detections outnumber EDR and honeypot hits, and
+source IPs follow a Zipf distribution so a few noisy attackers produce most
+of the alerts.
+"""
+import random
+
+# (source, relative frequency, typical events)
+SOURCE_PROFILES = [
+    ("Netflow", 40, ["Port Scan", "Traffic Spike", "Unusual Port"]),
+    ("dns-logs", 20, ["DNS Tunneling", "DGA Domain"]),
+    ("AD-logs", 15, ["Failed Logon", "Privilege Escalation"]),
+    ("IDS", 15, ["Exploit Attempt", "Malware Signature"]),
+    ("EDR", 7, ["Suspicious Process", "Credential Dumping"]),
+    ("Honeypot", 3, ["SSH Login Attempt", "Command Execution"]),
+]
+
+
+class AlertGenerator:
+    """
+    Generate webhook alerts with realistic source and IP distributions.
+
+    Args:
+        source_ips (list of str): Candidate attacker IPs, most active first.
+        destination_ips (list of str): Candidate target IPs.
+        zipf_exponent (float): Skew of the attacker distribution, 0 is uniform.
+        seed (int, optional): Seed for reproducible runs.
+    """
+
+    def __init__(self, source_ips, destination_ips, zipf_exponent=1.1, seed=None):
+        self.random = random.Random(seed)
+        self.source_ips = list(source_ips)
+        self.destination_ips = list(destination_ips)
+        self.ip_weights = [1.0 / (rank ** zipf_exponent) for rank in range(1, len(self.source_ips) + 1)]
+        self.sources = [profile[0] for profile in SOURCE_PROFILES]
+        self.source_weights = [profile[1] for profile in SOURCE_PROFILES]
+        self.events = {profile[0]: profile[2] for profile in SOURCE_PROFILES}
+
+    def alert(self):
+        """
+        Generate a single alert.
+
+        Returns:
+            dict: The alert in webhook format.
+        """
+        source = self.random.choices(self.sources, self.source_weights)[0]
+        return {
+            "Source": source,
+            "Event": self.random.choice(self.events[source]),
+            "Score": self.random.randint(1, 10),
+            "SourceIP": self.random.choices(self.source_ips, self.ip_weights)[0],
+            "DestinationIP": self.random.choice(self.destination_ips)
+        }
+
+    def alerts(self, count):
+        """
+        Generate a list of alerts.
+
+        Args:
+            count (int): Number of alerts.
+
+        Returns:
+            list of dict: The alerts in webhook format.
+        """
+        return [self.alert() for _ in range(count)]
+
+
+def generator_for_topology(topology, attackers=50, seed=None, zipf_exponent=1.1):
+    """
+    Build a generator whose attacker and target IPs are hosts of a topology.
+
+    Args:
+        topology (dict): Topology with a 'hosts' list, as built by mock_onos.
+        attackers (int): Number of distinct attacker IPs.
+        seed (int, optional): Seed for reproducible runs.
+        zipf_exponent (float): Skew of the attacker distribution.
+
+    Returns:
+        AlertGenerator: The generator.
+    """
+    ips = [host["ipAddresses"][0] for host in topology["hosts"]]
+    rng = random.Random(seed)
+    rng.shuffle(ips)
+    return AlertGenerator(ips[:attackers], ips[attackers:] or ips, zipf_exponent, seed)
@@ -1,30 +1,35 @@
-from flask import Flask, request, jsonify, send_file
-from flask_cors import CORS
+from flask import Blueprint, request, jsonify, send_file, Response, stream_with_context
 import sys
 
 # Insert path for controller actions
 sys.path.insert(1, 'app/')
+from app import create_app, startup
 from controller_actions import block_ip, allow_ip, rate_limit_for_host, redirect_traffic_full, unblock_ip
 from topology import get_topology_data
-from reception import webhook
-from database import save_settings, get_settings, get_flows, get_actions, get_setting_value, get_anomalies, delete_event_entry
+from reception import webhook_blueprint
+from database import save_settings, get_settings, get_flows, get_actions, get_setting_value, get_anomalies, delete_event_entry, check_external_writes, get_jobs, get_suppressions
 from app_logging import log_flows_to_database
 from service_stat import get_service_status
 from query_elastic import get_documents_by_ip
-from chatbot import handle_chatbot_request
+from chatbot import handle_chatbot_request, stream_chatbot_response
+from policy import reload_policy
+from event_bus import bus
+from expiry import parse_duration
+from jobs import job_runner
+from suppression import suppression_list
+from http_utils import conditional_json, hashed_json
+from metrics import registry
+from profiler import profiler, DEFAULT_INTERVAL
 from report import ReportGenerator
 import os
-# Initialize the Flask app
-app = Flask(__name__)
+import json
+from datetime import datetime, timezone
+# API routes, registered on the app by create_app
+api = Blueprint('api', __name__)
 report_generator = ReportGenerator()
 PDF_DIRECTORY = os.path.abspath("generated_reports")
 
-# Enable CORS for all routes
-CORS(app, resources={r"/*": {"origins": "*"}})
-
-app.add_url_rule('/webhook', view_func=webhook, methods=['POST'])
-
-@app.route('/api/chatbot', methods=['POST'])
+@api.route('/api/chatbot', methods=['POST'])
 def chatbot():
     user_question = request.json.get('question')
     if not user_question:
@@ -32,7 +37,82 @@ def chatbot():
     response = handle_chatbot_request(user_question)
     return jsonify({"answer": response})
 
-@app.route('/api/get-report', methods=['GET'])
+@api.route('/api/chatbot/stream', methods=['GET', 'POST'])
+def chatbot_stream():
+    """
+    Endpoint to stream a chatbot answer as Server-Sent Events.
+
+    Accepts the question as JSON ('question') on POST, or as a query
+    parameter on GET so it can be used with EventSource. Emits 'status',
+    'token', 'error' and 'done' events whose data is {"text": ...}.
+    """
+    if request.method == 'POST':
+        user_question = (request.get_json(silent=True) or {}).get('question')
+    else:
+        user_question = request.args.get('question')
+    if not user_question:
+        return jsonify({"error": "No question provided"}), 400
+
+    def events():
+        for event, text in stream_chatbot_response(user_question):
+            yield f"event: {event}\ndata: {json.dumps({'text': text})}\n\n"
+
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+# Seconds between keep-alive comments on idle update streams
+STREAM_HEARTBEAT = 15
+
+# Seconds between checks for writes by other server processes
+EXTERNAL_WRITE_POLL = 2
+
+@api.route('/api/stream', methods=['GET'])
+def stream_updates():
+    """
+    Endpoint to push incremental updates to the dashboard as Server-Sent Events.
+
+    The 'topics' query parameter selects a comma-separated subset of
+    'anomalies', 'actions' and 'flows'. Each event carries the delta for one
+    topic. A 'resync' event tells the client to re-fetch the full data of
+    the topics listed in its 'topics', or of all its topics if none are
+    listed (e.g. because it fell behind).
+    """
+    topics = [topic for topic in request.args.get('topics', '').split(',') if topic] or None
+    subscription = bus.subscribe(topics)
+
+    def events():
+        try:
+            yield "retry: 3000\n\n"
+            idle = 0
+            while True:
+                message = subscription.get(timeout=EXTERNAL_WRITE_POLL)
+                if subscription.lagged:
+                    subscription.lagged = False
+                    yield "event: resync\ndata: {}\n\n"
+                if message is None:
+                    # Other server processes cannot publish here, watch for their writes
+                    check_external_writes()
+                    idle += EXTERNAL_WRITE_POLL
+                    if idle >= STREAM_HEARTBEAT:
+                        idle = 0
+                        yield ": keep-alive\n\n"
+                    continue
+                idle = 0
+                message_id, topic, payload = message
+                yield f"id: {message_id}\nevent: {topic}\ndata: {json.dumps(payload)}\n\n"
+        finally:
+            bus.unsubscribe(subscription)
+
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@api.route('/api/get-report', methods=['GET'])
 def get_report():
     try:
         report_type = request.args.get('report_type')
@@ -41,7 +121,7 @@ def get_report():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/download-pdf', methods=['GET'])
+@api.route('/api/download-pdf', methods=['GET'])
 def download_pdf():
     try:
         report_type = request.args.get('report_type', 'anomalies')
@@ -57,7 +137,7 @@ def download_pdf():
 
 
 
-@app.route('/api/get-documents-by-ip', methods=['POST'])
+@api.route('/api/get-documents-by-ip', methods=['POST'])
 def get_documents():
     """
     Retrieve documents across all indices for a given IP address.
@@ -79,7 +159,7 @@ def get_documents():
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/service-status', methods=['GET'])
+@api.route('/api/service-status', methods=['GET'])
 def fetch_service_status():
     """
     Endpoint to fetch the statuses of SIEM (ELK), Honeypot (Cowrie), and SDN Controller (ONOS).
@@ -92,10 +172,13 @@ def fetch_service_status():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/ignore', methods=['POST'])
+@api.route('/api/ignore', methods=['POST'])
 def ignore_event():
     """
-    Endpoint to delete an event from the events table based on the source IP.
+    Endpoint to ignore a source IP or network: its events are deleted from
+    the events table and its new alerts are dropped on arrival.
+
+    Accepts an optional 'duration' in seconds after which alerts are accepted again.
     """
     data = request.json
     source_ip = data.get('srcIp')
@@ -103,35 +186,110 @@ def ignore_event():
     if not source_ip:
         return jsonify({"error": "Source IP is required"}), 400
     try:
-        delete_event_entry(source_ip)
+        duration = parse_duration(data.get('duration'))
+        network = suppression_list.add(source_ip, reason=data.get('reason'), duration=duration)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    try:
+        # Events are stored per address, a network has no rows of its own
+        if "/" not in network:
+            delete_event_entry(network)
         return jsonify({"message": f"Event for Source IP {source_ip} ignored successfully"}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/get-actions', methods=['GET'])
+@api.route('/api/suppressions', methods=['GET'])
+def fetch_suppressions():
+    """
+    Endpoint to fetch the IPs and networks whose alerts are dropped on arrival.
+    """
+    try:
+        # Expiring suppressions disappear without a write, so the ETag is taken from the data
+        return hashed_json({"data": get_suppressions()})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@api.route('/api/suppressions/<path:network>', methods=['DELETE'])
+def remove_suppression(network):
+    """
+    Endpoint to accept the alerts of a suppressed IP or network again.
+    """
+    try:
+        if not suppression_list.remove(network):
+            return jsonify({"error": "Suppression not found"}), 404
+        return jsonify({"message": f"Alerts from {network} are no longer suppressed"}), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def parse_time_range():
+    """
+    Read the optional 'since' and 'until' query parameters.
+
+    Values with a UTC offset are converted to UTC, those without one are taken as UTC.
+
+    Returns:
+        tuple: (since, until) in the stored 'YYYY-MM-DD HH:MM:SS' format (UTC), None when absent.
+
+    Raises:
+        ValueError: If a parameter is not an ISO date or date and time.
+    """
+    bounds = []
+    for name in ('since', 'until'):
+        value = request.args.get(name)
+        if value:
+            try:
+                moment = datetime.fromisoformat(value)
+                if moment.tzinfo is not None:
+                    moment = moment.astimezone(timezone.utc)
+                value = moment.strftime("%Y-%m-%d %H:%M:%S")
+            except ValueError:
+                raise ValueError(f"'{name}' must be an ISO date or date and time")
+        bounds.append(value or None)
+    return tuple(bounds)
+
+
+@api.route('/api/get-actions', methods=['GET'])
 def fetch_actions():
     """
-    Endpoint to fetch all actions from the database.
+    Endpoint to fetch actions from the database.
+
+    Returns the recent actions, or those between the optional 'since' and
+    'until' query parameters (UTC), read from the monthly partitions as well.
     """
     try:
-        actions = get_actions()
-        return jsonify({"data": actions}), 200
+        since, until = parse_time_range()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        return conditional_json("actions", lambda: {"data": get_actions(since, until)})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/get-anomalies', methods=['GET'])
+@api.route('/api/get-anomalies', methods=['GET'])
 def fetch_anomalies():
     """
     Endpoint to fetch recent anomalies from the events table.
+
+    Events between the optional 'since' and 'until' query parameters (UTC)
+    are read from the monthly partitions as well.
     """
     try:
-        anomalies = get_anomalies()
-        return jsonify({"data": anomalies}), 200
+        since, until = parse_time_range()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        return conditional_json("events", lambda: {"data": get_anomalies(since, until)})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/save-flows', methods=['POST'])
+@api.route('/api/save-flows', methods=['POST'])
 def save_flow_data():
     """
     Endpoint to save flow data to the database by fetching from the ONOS controller.
@@ -142,18 +300,17 @@ def save_flow_data():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/get-flows', methods=['GET'])
+@api.route('/api/get-flows', methods=['GET'])
 def fetch_flow_data():
     """
     Endpoint to fetch all flow data from the database.
     """
     try:
-        flows = get_flows()
-        return jsonify({"data": flows}), 200
+        return conditional_json("flows", lambda: {"data": get_flows()})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/save-settings', methods=['POST'])
+@api.route('/api/save-settings', methods=['POST'])
 def save_system_settings():
     """
     Endpoint to save system settings.
@@ -165,22 +322,44 @@ def save_system_settings():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/get-settings', methods=['GET'])
+@api.route('/api/get-settings', methods=['GET'])
 def fetch_system_settings():
     """
     Endpoint to fetch all system settings.
     """
     try:
-        settings = get_settings()
-        return jsonify({"data": settings}), 200
+        return conditional_json("settings", lambda: {"data": get_settings()})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@api.route('/api/reload-policy', methods=['POST'])
+def reload_decision_policy():
+    """
+    Endpoint to reload the decision policy file without restarting.
+    """
+    try:
+        policy = reload_policy()
+        return jsonify({"message": "Decision policy reloaded successfully", "data": policy.config}), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/block', methods=['POST'])
+def job_accepted(job_id, message):
+    """
+    Respond to a request whose action was queued as a job.
+    """
+    return jsonify({"message": message, "job_id": job_id, "status_url": f"/api/jobs/{job_id}"}), 202
+
+
+@api.route('/api/block', methods=['POST'])
 def block():
     """
     Endpoint to block traffic using an ACL with multiple criteria.
+
+    The block is applied by a background job, poll /api/jobs/<job_id> for the outcome.
     """
     data = request.json
     
@@ -194,22 +373,28 @@ def block():
     src_port = data.get('srcPort', None)
     dst_port = data.get('dstPort', None)
     prefix_length = data.get('prefixLength', '32')  # Default to /32 if not provided
-    duration = data.get('duration', None)
     ip_proto = data.get("ipProto")  
 
+    if not src_ip:
+        return jsonify({"error": "Source IP must be provided"}), 400
+    try:
+        duration = parse_duration(data.get('duration'))
+    except ValueError:
+        return jsonify({"error": "Duration must be a positive number of seconds"}), 400
+
     # Ensure the source and destination IP addresses are in the correct format (add prefix if missing)
     if src_ip and '/' not in src_ip:
         src_ip = f"{src_ip}/{prefix_length}"
     if dst_ip and '/' not in dst_ip:
         dst_ip = f"{dst_ip}/{prefix_length}"
 
-    # Call block_ip function with all the extracted parameters
-    block_ip(src_ip=src_ip, dst_ip=dst_ip, src_mac=src_mac, dst_mac=dst_mac,
-             vlan_id=vlan_id, eth_type=eth_type,ip_proto=ip_proto, src_port=src_port, dst_port=dst_port)
+    # Queue block_ip with all the extracted parameters
+    job_id = job_runner.submit("block", block_ip, src_ip=src_ip, dst_ip=dst_ip, src_mac=src_mac, dst_mac=dst_mac,
+                               vlan_id=vlan_id, eth_type=eth_type, ip_proto=ip_proto, src_port=src_port,
+                               dst_port=dst_port, duration=duration)
+    return job_accepted(job_id, f"Blocking traffic from {src_ip} to {dst_ip or 'any'}")
 
-    return jsonify({"message": f"Blocked traffic for {src_ip} successfully"}), 200
-
-@app.route('/api/topology', methods=['GET'])
+@api.route('/api/topology', methods=['GET'])
 def get_topology():
     """
     Endpoint to fetch the network topology from ONOS controller.
@@ -217,11 +402,11 @@ def get_topology():
     try:
         # Fetch the topology data by calling the function in topology.py
         topology_data = get_topology_data()
-        return jsonify(topology_data)
+        return hashed_json(topology_data)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/allow', methods=['POST'])
+@api.route('/api/allow', methods=['POST'])
 def allow():
     """
     Endpoint to allow traffic using an ACL with multiple criteria.
@@ -238,7 +423,10 @@ def allow():
     src_port = data.get('srcPort', None)
     dst_port = data.get('dstPort', None)
     prefix_length = data.get('prefixLength', '32')  # Default to /32 if not provided
-    duration = data.get('duration', None)
+    try:
+        duration = parse_duration(data.get('duration'))
+    except ValueError:
+        return jsonify({"error": "Duration must be a positive number of seconds"}), 400
 
     # Ensure the IP addresses are in the correct format
     if '/' not in src_ip:
@@ -249,16 +437,18 @@ def allow():
     # Call allow_ip function with all the extracted parameters
     try:
         allow_ip(src_ip=src_ip, dst_ip=dst_ip, src_mac=src_mac, dst_mac=dst_mac,
-             vlan_id=vlan_id, eth_type=eth_type, src_port=src_port, dst_port=dst_port)
+             vlan_id=vlan_id, eth_type=eth_type, src_port=src_port, dst_port=dst_port, duration=duration)
         return jsonify({"message": f"Allowed traffic for {src_ip} to {dst_ip} successfully"}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/rate-limit', methods=['POST'])
+@api.route('/api/rate-limit', methods=['POST'])
 def apply_rate_limit():
     """
     Endpoint to apply rate limiting to traffic for a specific host by its IP address.
+
+    The rate limit is applied by a background job, poll /api/jobs/<job_id> for the outcome.
     """
     data = request.json
     host_ip = data.get('hostIp')  # IP address of the host
@@ -268,18 +458,24 @@ def apply_rate_limit():
     # Ensure all required parameters are present
     if not all([host_ip, rate_limit_bps]):
         return jsonify({"error": "Missing required parameters"}), 400
+    try:
+        duration = parse_duration(data.get('duration'))
+    except ValueError:
+        return jsonify({"error": "Duration must be a positive number of seconds"}), 400
 
     try:
-        # Apply rate limiting using the updated function
-        rate_limit_for_host(host_ip=host_ip, rate_limit_bps=rate_limit_bps, admin_or_automated=admin_or_automated)
-        return jsonify({"message": f"Rate limit applied for host {host_ip} at {rate_limit_bps} bps"}), 200
+        job_id = job_runner.submit("rate-limit", rate_limit_for_host, host_ip=host_ip, rate_limit_bps=rate_limit_bps,
+                                   admin_or_automated=admin_or_automated, duration=duration)
+        return job_accepted(job_id, f"Applying rate limit for host {host_ip} at {rate_limit_bps} bps")
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/redirect', methods=['POST'])
+@api.route('/api/redirect', methods=['POST'])
 def redirect():
     """
     Endpoint to redirect traffic from one IP address to another.
+
+    The redirect is set up by a background job, poll /api/jobs/<job_id> for the outcome.
     """
     data = request.json
     src_ip_address = data.get('srcIp')
@@ -287,25 +483,36 @@ def redirect():
 
     if not src_ip_address or not redirect_ip_address:
         return jsonify({"error": "Source IP and Redirect IP must be provided"}), 400
+    try:
+        duration = parse_duration(data.get('duration'))
+    except ValueError:
+        return jsonify({"error": "Duration must be a positive number of seconds"}), 400
 
     try:
         # Use redirect_traffic_full to perform the redirection
-        redirect_traffic_full(source_ip=src_ip_address, honeypot_ip=redirect_ip_address, admin_or_automated="Admin")
-        return jsonify({"message": f"Redirected traffic from {src_ip_address} to {redirect_ip_address} successfully"}), 200
+        job_id = job_runner.submit("redirect", redirect_traffic_full, source_ip=src_ip_address,
+                                   honeypot_ip=redirect_ip_address, admin_or_automated="Admin", duration=duration)
+        return job_accepted(job_id, f"Redirecting traffic from {src_ip_address} to {redirect_ip_address}")
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/redirectHoney', methods=['POST'])
+@api.route('/api/redirectHoney', methods=['POST'])
 def redirect_to_honeypot():
     """
     Endpoint to redirect traffic from a given source IP to the honeypot.
+
+    The redirect is set up by a background job, poll /api/jobs/<job_id> for the outcome.
     """
     data = request.json
     src_ip = data.get('srcIp')
 
     if not src_ip:
         return jsonify({"error": "Source IP must be provided"}), 400
+    try:
+        duration = parse_duration(data.get('duration'))
+    except ValueError:
+        return jsonify({"error": "Duration must be a positive number of seconds"}), 400
 
     # Get honeypot IP from database settings
     honeypot_ip = get_setting_value("Honeypot IP Address")
@@ -314,15 +521,16 @@ def redirect_to_honeypot():
 
     try:
         # Use redirect_traffic_full to perform the redirection
-        redirect_traffic_full(source_ip=src_ip, honeypot_ip=honeypot_ip, admin_or_automated="Admin")
-        return jsonify({"message": f"Redirected traffic from {src_ip} to honeypot ({honeypot_ip}) successfully"}), 200
+        job_id = job_runner.submit("redirect", redirect_traffic_full, source_ip=src_ip, honeypot_ip=honeypot_ip,
+                                   admin_or_automated="Admin", duration=duration)
+        return job_accepted(job_id, f"Redirecting traffic from {src_ip} to honeypot ({honeypot_ip})")
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
 
 
-@app.route('/api/unblock', methods=['POST'])
+@api.route('/api/unblock', methods=['POST'])
 def unblock():
     """
     Endpoint to unblock traffic by removing the ACL rule for the specified IP address.
@@ -339,6 +547,73 @@ def unblock():
     return jsonify({"message": result})
 
 
+@api.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    Endpoint to fetch the status of a traffic-control job.
+    """
+    try:
+        found = get_jobs([job_id])
+        if not found:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify(found[0]), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@api.route('/api/jobs', methods=['GET', 'POST'])
+def get_job_statuses():
+    """
+    Endpoint to fetch the status of several jobs at once.
+
+    The ids are given as ?ids=a,b,c or as {"ids": [...]} in a POST body.
+    Without ids the most recent jobs are returned.
+    """
+    if request.method == 'POST':
+        job_ids = (request.get_json(silent=True) or {}).get('ids')
+    else:
+        job_ids = request.args.get('ids')
+        job_ids = [job_id for job_id in job_ids.split(',') if job_id] if job_ids else None
+    try:
+        return jsonify({"jobs": get_jobs(job_ids)}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@api.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Endpoint exposing counters and latency histograms in Prometheus text format.
+    """
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+@api.route('/api/profiler', methods=['GET', 'POST'])
+def sampling_profiler():
+    """
+    Endpoint to start or stop the sampling profiler and read its results.
+
+    POST {"enabled": true, "interval": 0.01} starts sampling, {"enabled": false}
+    stops it. GET returns the most sampled functions and stacks, 'top' sets
+    how many.
+    """
+    try:
+        if request.method == 'POST':
+            data = request.json or {}
+            if data.get('enabled'):
+                profiler.start(float(data.get('interval', DEFAULT_INTERVAL)))
+            else:
+                profiler.stop()
+        return jsonify({"data": profiler.report(int(request.args.get('top', 20)))}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# The app serves both the main APIs and the webhook; serve.py runs it in production
+app = create_app(api, webhook_blueprint)
+
 if __name__ == "__main__":
-    # Start the Flask app, which includes both the main APIs and the webhook
-    app.run(debug=True, host="0.0.0.0", port=5000)
+    # Development server, FLASK_DEBUG=1 enables the debugger and reloader
+    debug = os.environ.get("FLASK_DEBUG") == "1"
+    # Under the reloader only the child process serves requests
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        startup()
+    app.run(debug=debug, host="0.0.0.0", port=5000)
@@ -0,0 +1,145 @@
+"""
+Production entry point for the NetSecFlow backend.
+
+Serves the API and the webhook with a multi-threaded WSGI server instead of
+Flask's development server:
+
+    python serve.py                      # waitress, one process
+    python serve.py --workers 4          # gunicorn, four processes (Linux)
+
+Worker and thread counts can also be set with NETSECFLOW_WORKERS and
+NETSECFLOW_THREADS. gunicorn can be used directly too:
+
+    gunicorn -c serve.py run:app
+"""
+import argparse
+import os
+import sys
+
+# Make the backend modules importable regardless of the working directory
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(1, os.path.join(BACKEND_DIR, "app"))
+sys.path.insert(1, BACKEND_DIR)
+
+DEFAULT_HOST = "0.0.0.0"
+DEFAULT_PORT = 5000
+
+# Threads per process, each streaming dashboard or chatbot client holds one
+DEFAULT_THREADS = 16
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+class FileLeader:
+    """
+    Elect one of several processes by holding an exclusive lock on a file.
+
+    Every process calls is_leader() periodically. The first to lock the file
+    keeps it until it exits, after which another process takes over.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.handle = None
+
+    def is_leader(self):
+        if self.handle is not None:
+            return True
+        import fcntl
+        handle = open(self.path, "a")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+        self.handle = handle
+        return True
+
+
+def _sweeper_leader():
+    from database import DB_PATH
+    return FileLeader(DB_PATH + ".sweeper.lock")
+
+
+# gunicorn settings, read when this file is passed as the config (-c serve.py)
+bind = f"{DEFAULT_HOST}:{DEFAULT_PORT}"
+workers = _env_int("NETSECFLOW_WORKERS", 1)
+threads = _env_int("NETSECFLOW_THREADS", DEFAULT_THREADS)
+worker_class = "gthread"
+# Server-Sent Events keep requests open far longer than gunicorn's default 30 s
+timeout = 0
+graceful_timeout = 30
+
+
+def on_starting(server):
+    # Create the tables once, before any worker exists
+    from database import init_db
+    init_db()
+
+
+def post_worker_init(worker):
+    from app import startup
+    startup(init_database=False, is_leader=_sweeper_leader().is_leader)
+
+
+def worker_exit(server, worker):
+    from app import shutdown
+    shutdown()
+
+
+def serve_waitress(host, port, threads):
+    from waitress import serve
+    from app import startup, shutdown
+
+    startup()
+    from run import app
+    try:
+        serve(app, host=host, port=port, threads=threads, channel_timeout=3600)
+    finally:
+        shutdown()
+
+
+def serve_gunicorn(host, port, workers, threads):
+    from gunicorn.app.base import BaseApplication
+
+    class NetSecFlowApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{host}:{port}")
+            self.cfg.set("workers", workers)
+            self.cfg.set("threads", threads)
+            self.cfg.set("worker_class", worker_class)
+            self.cfg.set("timeout", timeout)
+            self.cfg.set("graceful_timeout", graceful_timeout)
+            self.cfg.set("on_starting", on_starting)
+            self.cfg.set("post_worker_init", post_worker_init)
+            self.cfg.set("worker_exit", worker_exit)
+
+        def load(self):
+            from run import app
+            return app
+
+    NetSecFlowApplication().run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the NetSecFlow backend.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=workers,
+                        help="Server processes, more than one requires gunicorn")
+    parser.add_argument("--threads", type=int, default=threads, help="Threads per process")
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        if os.name == "nt":
+            parser.error("multiple workers need gunicorn, which does not run on Windows")
+        serve_gunicorn(args.host, args.port, args.workers, args.threads)
+    else:
+        serve_waitress(args.host, args.port, args.threads)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,4 @@
 import React, { useState } from 'react';
-import axios from 'axios';
 import ReactMarkdown from 'react-markdown'; // For rendering markdown
 import './Chatbot.css';
 
@@ -21,10 +20,49 @@ function Chatbot() {
     setUserInput('');
     setIsLoading(true);
 
+    // Append streamed text to the last (bot) message
+    const appendToBotMessage = (text) => {
+      setMessages((prevMessages) => {
+        const last = prevMessages[prevMessages.length - 1];
+        return [...prevMessages.slice(0, -1), { ...last, text: last.text + text }];
+      });
+    };
+
     try {
-      const response = await axios.post('http://127.0.0.1:5000/api/chatbot', { question: userInput });
-      const botMessage = { sender: 'bot', text: response.data.answer };
-      setMessages((prevMessages) => [...prevMessages, botMessage]);
+      const response = await fetch('http://127.0.0.1:5000/api/chatbot/stream', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ question: userInput }),
+      });
+      if (!response.ok || !response.body) throw new Error(`HTTP ${response.status}`);
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let started = false;
+      for (;;) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // Server-Sent Events are separated by a blank line
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        for (const raw of events) {
+          const event = (raw.match(/^event: (.*)$/m) || [])[1];
+          const data = (raw.match(/^data: (.*)$/m) || [])[1];
+          if (!event || !data) continue;
+          const { text } = JSON.parse(data);
+          if (event === 'token' || event === 'error') {
+            if (!started) {
+              started = true;
+              setIsLoading(false);
+              setMessages((prevMessages) => [...prevMessages, { sender: 'bot', text: '' }]);
+            }
+            appendToBotMessage(text);
+          }
+        }
+      }
     } catch (error) {
       const errorMessage = { sender: 'bot', text: 'Sorry, something went wrong. Please try again later.' };
       setMessages((prevMessages) => [...prevMessages, errorMessage]);
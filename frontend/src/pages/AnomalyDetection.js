@@ -1,6 +1,7 @@
 // AnomalyDetection.js
 import React, { useState, useEffect } from 'react';
 import axios from 'axios';
+import { subscribeToUpdates, applyAnomalyUpdate, waitForJob, describeJob } from '../services/api';
 import './AnomalyDetection.css'
 
 function AnomalyDetection() {
@@ -15,13 +16,21 @@ function AnomalyDetection() {
   const [selectedIp, setSelectedIp] = useState('');
   const [showFlowModal, setShowFlowModal] = useState(false);
 
-  // Fetch anomalies from the backend on component mount
+  // Fetch anomalies from the backend on component mount, then follow pushed updates
   useEffect(() => {
-    axios.get('http://localhost:5000/api/get-anomalies')
-      .then((response) => {
-        setAnomalies(response.data.data);
-      })
-      .catch((error) => console.error('Error fetching anomalies:', error));
+    const fetchAnomalies = () => {
+      axios.get('http://localhost:5000/api/get-anomalies')
+        .then((response) => {
+          setAnomalies(response.data.data);
+        })
+        .catch((error) => console.error('Error fetching anomalies:', error));
+    };
+
+    fetchAnomalies();
+    return subscribeToUpdates(['anomalies'], {
+      anomalies: (delta) => setAnomalies((anomalies) => applyAnomalyUpdate(anomalies, delta)),
+      resync: fetchAnomalies,
+    });
   }, []);
   const handleIgnoreSubmit = () => {
     axios.post('http://localhost:5000/api/ignore', { srcIp: ignoreIp })
@@ -29,10 +38,7 @@ function AnomalyDetection() {
         alert(response.data.message);
         setShowIgnoreModal(false);
         setIgnoreIp('');
-        // Refresh the anomalies table after ignoring an event
-        axios.get('http://localhost:5000/api/get-anomalies')
-          .then((response) => setAnomalies(response.data.data))
-          .catch((error) => console.error('Error fetching anomalies:', error));
+        // The removal arrives through the update stream
       })
       .catch((error) => {
         console.error('Error ignoring event:', error);
@@ -43,9 +49,9 @@ function AnomalyDetection() {
   const handleBlockIpSubmit = () => {
     axios.post('http://localhost:5000/api/block', { srcIp: blockIp })
       .then((response) => {
-        alert(response.data.message);
         setShowBlockModal(false);
         setBlockIp('');
+        return waitForJob(response.data).then((job) => alert(describeJob(response.data, job)));
       })
       .catch((error) => {
         console.error('Error blocking IP:', error);
@@ -56,9 +62,9 @@ function AnomalyDetection() {
   const handleRedirectToHoneypot = () => {
     axios.post('http://localhost:5000/api/redirectHoney', { srcIp: redirectIp })
       .then((response) => {
-        alert(response.data.message);
         setShowHoneypotModal(false);
         setRedirectIp('');
+        return waitForJob(response.data).then((job) => alert(describeJob(response.data, job)));
       })
       .catch((error) => {
         console.error('Error redirecting to honeypot:', error);
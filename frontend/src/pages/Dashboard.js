@@ -3,6 +3,7 @@ import { Line, Bar } from 'react-chartjs-2';
 import { Chart as ChartJS, CategoryScale, LinearScale, PointElement, LineElement, BarElement, Title, Tooltip, Legend } from 'chart.js';
 import { useNavigate } from 'react-router-dom';
 import axios from 'axios';
+import { subscribeToUpdates, applyActionUpdate, applyFlowUpdate } from '../services/api';
 import './Dashboard.css';
 
 // Register Chart.js components
@@ -24,19 +25,34 @@ function Dashboard() {
   const navigate = useNavigate(); // React Router hook for navigation
 
   useEffect(() => {
-    // Fetch traffic data
-    axios.get('http://localhost:5000/api/get-flows')
-      .then((response) => setTrafficData(response.data.data))
-      .catch((error) => console.error('Error fetching traffic data:', error));
+    // Fetch the given topics, all of them if omitted
+    const fetchData = (topics) => {
+      // Fetch traffic data
+      if (!topics || topics.includes('flows')) {
+        axios.get('http://localhost:5000/api/get-flows')
+          .then((response) => setTrafficData(response.data.data))
+          .catch((error) => console.error('Error fetching traffic data:', error));
+      }
 
-    // Fetch recent actions
-    axios.get('http://localhost:5000/api/get-actions')
-      .then((response) => setRecentActions(response.data.data))
-      .catch((error) => console.error('Error fetching recent actions:', error));
+      // Fetch recent actions
+      if (!topics || topics.includes('actions')) {
+        axios.get('http://localhost:5000/api/get-actions')
+          .then((response) => setRecentActions(response.data.data))
+          .catch((error) => console.error('Error fetching recent actions:', error));
+      }
+    };
 
+    fetchData();
     axios.get('http://localhost:5000/api/service-status')
       .then((response) => setServiceStatus(response.data.data))
       .catch((error) => console.error('Error fetching service statuses:', error));
+
+    // Apply pushed changes instead of re-fetching
+    return subscribeToUpdates(['flows', 'actions'], {
+      flows: (delta) => setTrafficData((flows) => applyFlowUpdate(flows, delta)),
+      actions: (delta) => setRecentActions((actions) => applyActionUpdate(actions, delta)),
+      resync: (payload) => fetchData(payload.topics),
+    });
   }, []);
 
   // Prepare data for Live Traffic Overview
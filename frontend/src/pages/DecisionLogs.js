@@ -1,6 +1,7 @@
 // DecisionLogs.js
 import React, { useState, useEffect } from 'react';
 import axios from 'axios';
+import { subscribeToUpdates, applyActionUpdate } from '../services/api';
 
 function DecisionLogs() {
   const [logs, setLogs] = useState([]);
@@ -8,14 +9,22 @@ function DecisionLogs() {
   const [actionTypeFilter, setActionTypeFilter] = useState('all');
   const [adminTypeFilter, setAdminTypeFilter] = useState('all');
 
-  // Fetch logs from the backend on component mount
+  // Fetch logs from the backend on component mount, then follow pushed updates
   useEffect(() => {
-    axios.get('http://localhost:5000/api/get-actions')
-      .then((response) => {
-        setLogs(response.data.data);
-        setFilteredLogs(response.data.data); // Initialize filtered logs
-      })
-      .catch((error) => console.error('Error fetching logs:', error));
+    const fetchLogs = () => {
+      axios.get('http://localhost:5000/api/get-actions')
+        .then((response) => {
+          setLogs(response.data.data);
+          setFilteredLogs(response.data.data); // Initialize filtered logs
+        })
+        .catch((error) => console.error('Error fetching logs:', error));
+    };
+
+    fetchLogs();
+    return subscribeToUpdates(['actions'], {
+      actions: (delta) => setLogs((logs) => applyActionUpdate(logs, delta)),
+      resync: fetchLogs,
+    });
   }, []);
 
   // Filter logs whenever filters change
@@ -1,5 +1,6 @@
 import React, { useState } from 'react';
 import axios from 'axios';
+import { waitForJob, describeJob } from '../services/api';
 
 function ManualTrafficControl() {
   const [action, setAction] = useState('block'); // Default action
@@ -34,7 +35,7 @@ function ManualTrafficControl() {
         break;
       case 'rate-limit':
         endpoint = '/api/rate-limit';
-        requestBody = { hostIp, rateLimitBps };
+        requestBody = { hostIp, rateLimitBps, duration: formData.duration };
         break;
       case 'redirect':
         endpoint = '/api/redirect';
@@ -51,11 +52,14 @@ function ManualTrafficControl() {
 
     try {
       const response = await axios.post(`${baseUrl}${endpoint}`, requestBody);
-      alert(response.data.message);
       resetForm();
+      // Block, rate limit and redirect are queued, report once they have run
+      const job = await waitForJob(response.data);
+      alert(describeJob(response.data, job));
     } catch (error) {
-      console.error('Error:', error.response?.data?.error || error.message);
-      alert('Failed to apply action');
+      const message = error.response?.data?.error || error.message;
+      console.error('Error:', message);
+      alert(`Failed to apply action: ${message}`);
     }
   };
 
@@ -179,6 +183,14 @@ function ManualTrafficControl() {
                 onChange={(e) => setRateLimitBps(e.target.value)}
               />
             </div>
+            <div className="form-group">
+              <label>Duration (optional):</label>
+              <input
+                type="number"
+                placeholder="Duration in seconds"
+                onChange={(e) => handleInputChange('duration', e.target.value)}
+              />
+            </div>
           </>
         );
       case 'redirect':
@@ -201,6 +213,14 @@ function ManualTrafficControl() {
                 onChange={(e) => setRedirectIp(e.target.value)}
               />
             </div>
+            <div className="form-group">
+              <label>Duration (optional):</label>
+              <input
+                type="number"
+                placeholder="Duration in seconds"
+                onChange={(e) => handleInputChange('duration', e.target.value)}
+              />
+            </div>
           </>
         );
       case 'unblock':
@@ -1,6 +1,7 @@
 import React, { useEffect, useRef, useState } from 'react';
 import { Network } from 'vis-network';
 import axios from 'axios';
+import { subscribeToUpdates, applyFlowUpdate } from '../services/api';
 import './TrafficOverview.css';
 
 function TrafficOverview() {
@@ -32,6 +33,10 @@ function TrafficOverview() {
     };
 
     fetchFlows();
+    return subscribeToUpdates(['flows'], {
+      flows: (delta) => setFlowData((flows) => applyFlowUpdate(flows, delta)),
+      resync: fetchFlows,
+    });
   }, []);
 
   useEffect(() => {
@@ -12,3 +12,73 @@ export const fetchTopology = async () => {
         throw error;
     }
 };
+
+// Wait for an action queued by a traffic-control endpoint to finish.
+// `accepted` is the 202 response body ({ message, job_id, status_url }); the
+// job is polled until it has succeeded or failed and its final status
+// ({ status, error, ... }) is returned. Bodies without a job_id come from
+// endpoints that act synchronously and count as succeeded.
+export const waitForJob = async (accepted, { interval = 1000, timeout = 120000 } = {}) => {
+    if (!accepted.job_id) {
+        return { status: 'succeeded', error: null };
+    }
+    const deadline = Date.now() + timeout;
+    while (Date.now() < deadline) {
+        const response = await axios.get(`${API_URL}/jobs/${accepted.job_id}`);
+        if (response.data.status === 'succeeded' || response.data.status === 'failed') {
+            return response.data;
+        }
+        await new Promise((resolve) => setTimeout(resolve, interval));
+    }
+    throw new Error(`Job ${accepted.job_id} did not finish within ${timeout / 1000} s`);
+};
+
+// Describe the outcome of a traffic-control request for the operator
+export const describeJob = (accepted, job) => {
+    if (job.status === 'failed') {
+        return `${accepted.message} failed: ${job.error}`;
+    }
+    return accepted.job_id ? `${accepted.message}: done` : accepted.message;
+};
+
+// Subscribe to incremental updates pushed by the backend over Server-Sent Events.
+// `handlers` maps event names ('anomalies', 'actions', 'flows', 'resync') to
+// callbacks receiving the parsed payload. A 'resync' payload lists the topics
+// to re-fetch in 'topics', all subscribed ones if it has none. Returns a
+// function that closes the stream.
+export const subscribeToUpdates = (topics, handlers) => {
+    const source = new EventSource(`${API_URL}/stream?topics=${topics.join(',')}`);
+    Object.entries(handlers).forEach(([event, handler]) => {
+        source.addEventListener(event, (e) => handler(JSON.parse(e.data)));
+    });
+    return () => source.close();
+};
+
+// Apply an 'anomalies' delta to a list of anomalies (newest first)
+export const applyAnomalyUpdate = (anomalies, delta) => {
+    let updated = anomalies;
+    if (delta.removed_source_ip) {
+        updated = updated.filter((anomaly) => anomaly.source_ip !== delta.removed_source_ip);
+    }
+    if (delta.added) {
+        updated = [...delta.added.slice().reverse(), ...updated];
+    }
+    return updated;
+};
+
+// Apply an 'actions' delta to a list of actions (newest first)
+export const applyActionUpdate = (actions, delta) => [...(delta.added || []).slice().reverse(), ...actions];
+
+// Apply a 'flows' delta to a list of flows
+export const applyFlowUpdate = (flows, delta) => {
+    const upserted = new Map((delta.upserted || []).map((flow) => [flow.id, flow]));
+    const removed = new Set(delta.removed || []);
+    const updated = flows
+        .filter((flow) => !removed.has(flow.id))
+        .map((flow) => upserted.get(flow.id) || flow);
+    const existing = new Set(updated.map((flow) => flow.id));
+    upserted.forEach((flow, id) => {
+        if (!existing.has(id)) updated.push(flow);
+    });
+    return updated;
+};